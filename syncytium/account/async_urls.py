@@ -0,0 +1,16 @@
+from core.async_views import with_async_views
+
+from . import urls
+from .async_views import (
+    AsyncUserAddressAPIView, AsyncUserEducationListAPIView,
+    AsyncUserProfileAPIView, AsyncUserWorkExperienceListAPIView,
+)
+
+app_name = urls.app_name
+
+urlpatterns = with_async_views(urls.urlpatterns, {
+    r"(?P<username>[\w.@+-]+)/profile/$": AsyncUserProfileAPIView,
+    r"(?P<username>[\w.@+-]+)/address/$": AsyncUserAddressAPIView,
+    r"(?P<username>[\w.@+-]+)/education/$": AsyncUserEducationListAPIView,
+    r"(?P<username>[\w.@+-]+)/work-experience/$": AsyncUserWorkExperienceListAPIView,
+})
@@ -0,0 +1,108 @@
+from asgiref.sync import sync_to_async
+from rest_framework.exceptions import NotFound
+
+from core.async_views import AsyncAPIView
+from core.paginators import KeysetPagination
+from core.utils import aget_user_id_for_request
+
+from .cache import get_cached_response, set_cached_response
+from .models import UserAddress, UserEducation, UserProfile, UserWorkExperience
+from .serializers import (
+    UserAddressSerializer, UserEducationSerializer, UserProfileSerializer,
+    UserWorkExperienceSerializer,
+)
+from .views import (
+    UserAddressAPIView, UserEducationViewSet, UserProfileAPIView,
+    UserWorkExperienceViewSet,
+)
+
+
+class AsyncProfileSectionAPIView(AsyncAPIView):
+    """Async view of a profile section, its responses being cached as by
+    `ProfileSectionCacheMixin`.
+
+    Preconditions:
+    - The `model` attribute must be a section of `account.cache.SECTIONS`.
+    - The view must implement `get_data`.
+    """
+    model = None
+
+    async def get(self, request, username):
+        owner_id = await aget_user_id_for_request(request, username)
+        if owner_id is None:
+            return self.render(await self.get_data(request, owner_id))
+        # The cache lookup runs in one thread hop, including the tier query
+        key, data = await sync_to_async(get_cached_response)(
+            request.user, owner_id, self.model, request.build_absolute_uri()
+        )
+        if data is None:
+            data = await self.get_data(request, owner_id)
+            await sync_to_async(set_cached_response)(key, data)
+        return self.render(data)
+
+    async def get_data(self, request, owner_id):
+        """Get the response data of the section.
+
+        Raises:
+        - `NotFound`: If the section does not exist.
+        """
+        raise NotImplementedError
+
+
+class AsyncUserProfileAPIView(AsyncProfileSectionAPIView):
+    """Async version of `UserProfileAPIView`"""
+    query_budget = UserProfileAPIView.query_budget
+    model = UserProfile
+
+    async def get_data(self, request, owner_id):
+        try:
+            profile = await UserProfile.objects.aget(user_id=owner_id)
+        except UserProfile.DoesNotExist:
+            raise NotFound
+        return UserProfileSerializer(profile).data
+
+
+class AsyncUserAddressAPIView(AsyncProfileSectionAPIView):
+    """Async version of `UserAddressAPIView`"""
+    query_budget = UserAddressAPIView.query_budget
+    model = UserAddress
+
+    async def get_data(self, request, owner_id):
+        queryset = UserAddress.objects.visible_to(request.user) \
+            .select_related("city", "country")
+        try:
+            address = await queryset.aget(user_id=owner_id)
+        except UserAddress.DoesNotExist:
+            raise NotFound
+        return UserAddressSerializer(address).data
+
+
+class AsyncPrivatizedListAPIView(AsyncProfileSectionAPIView):
+    """Async list of the rows of a user visible to the requester.
+
+    Preconditions:
+    - The `model` and `serializer_class` attributes must be defined.
+    """
+    serializer_class = None
+    pagination_class = KeysetPagination
+
+    async def get_data(self, request, owner_id):
+        queryset = self.model.objects.filter(user_id=owner_id).visible_to(request.user)
+        paginator = self.pagination_class()
+        rows = await paginator.apaginate_queryset(queryset, request, self)
+        data = self.serializer_class(rows, many=True).data
+        return paginator.get_paginated_response(data).data
+
+
+class AsyncUserEducationListAPIView(AsyncPrivatizedListAPIView):
+    """Async version of the `UserEducationViewSet` list"""
+    query_budget = UserEducationViewSet.query_budget
+    model = UserEducation
+    serializer_class = UserEducationSerializer
+
+
+class AsyncUserWorkExperienceListAPIView(AsyncPrivatizedListAPIView):
+    """Async version of the `UserWorkExperienceViewSet` list"""
+    query_budget = UserWorkExperienceViewSet.query_budget
+    model = UserWorkExperience
+    serializer_class = UserWorkExperienceSerializer
@@ -0,0 +1,181 @@
+"""Response cache of the profile sections.
+
+Responses are cached per owner, section, viewer tier and URL. Each section
+of each owner has a version, read before anything else and bumped by the
+writes to the section, so a response computed from older rows is never
+served after the write is committed. Viewers seeing the same rows share
+the same tier, e.g. all anonymous viewers or all the owner's friends.
+
+The versions, responses and metrics live in the cache shared by all the
+processes, so a write in any of them invalidates the responses cached by
+the others.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from core.models import Privacy, PrivatizedModel, UserConnection
+
+from .models import UserAddress, UserEducation, UserProfile, UserWorkExperience
+
+KEY_PREFIX = "profile_cache"
+SECTIONS = {
+    UserProfile: "profile",
+    UserAddress: "address",
+    UserEducation: "educations",
+    UserWorkExperience: "work_experiences",
+}
+METRICS = ["hits", "misses", "invalidations", "hit_age_ms"]
+
+
+def get_version_key(owner_id, model):
+    return f"{KEY_PREFIX}:{owner_id}:{SECTIONS[model]}:version"
+
+
+def get_section_version(owner_id, model):
+    """Get the current version of a section, starting from the current
+    time so it is never reused after an eviction.
+    """
+    key = get_version_key(owner_id, model)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def invalidate_section(owner_id, model):
+    """Drop the cached responses of a section.
+
+    The version is bumped right away, and again once the current
+    transaction is committed, so responses cached from the rows other
+    connections still see in between are dropped too.
+
+    Args:
+        `owner_id` (`int`): The user the section belongs to.
+        `model` (`Model`): The model of the section.
+    """
+    def bump_version():
+        try:
+            cache.incr(get_version_key(owner_id, model))
+        except ValueError:
+            # Missing versions restart from the current time
+            pass
+
+    bump_version()
+    increment_metric("invalidations")
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(bump_version)
+
+
+def has_custom_rows(owner_id, model, version):
+    """Whether a section has rows shared with custom people, cached for the
+    version.
+    """
+    if not issubclass(model, PrivatizedModel):
+        return False
+    key = f"{KEY_PREFIX}:{owner_id}:{SECTIONS[model]}:{version}:custom"
+    has_custom = cache.get(key)
+    if has_custom is None:
+        has_custom = model.objects \
+            .filter(user_id=owner_id, privacy=Privacy.CUSTOM).exists()
+        cache.set(key, has_custom, settings.PROFILE_CACHE_TIMEOUT)
+    return has_custom
+
+
+def get_viewer_tier(viewer, owner_id, model, version):
+    """Get the tier of the viewer, telling which rows of a section they can
+    see, as checked by `PrivatizedQuerySet.visible_to`.
+
+    Returns:
+        `str`: `public`, `friends_of_friends`, `friends` or `owner`, followed
+        by the custom rows shared with the viewer if there are any.
+    """
+    if not issubclass(model, PrivatizedModel):
+        return "all"
+    if viewer is None or not viewer.is_authenticated:
+        return "public"
+    if viewer.id == owner_id:
+        return "owner"
+
+    tier = "public"
+    connection = UserConnection.objects \
+        .filter(user_id=viewer.id, other_id=owner_id) \
+        .values_list("is_friend", "mutual_friends").first()
+    if connection:
+        is_friend, mutual_friends = connection
+        if is_friend:
+            tier = "friends"
+        elif mutual_friends > 0:
+            tier = "friends_of_friends"
+    if has_custom_rows(owner_id, model, version):
+        through = model.custom_people.through
+        source_field = model.custom_people.field.m2m_field_name()
+        row_ids = list(through.objects.filter(
+            user_id=viewer.id, **{f"{source_field}__user_id": owner_id}
+        ).order_by(f"{source_field}_id").values_list(f"{source_field}_id", flat=True))
+        if row_ids:
+            tier += ":custom:" + ",".join(str(id) for id in row_ids)
+    return tier
+
+
+def get_cached_response(viewer, owner_id, model, url):
+    """Look up the cached response data of a section.
+
+    Args:
+        `viewer` (`User`): The user viewing the section, may be anonymous.
+        `owner_id` (`int`): The user the section belongs to.
+        `model` (`Model`): The model of the section.
+        `url` (`str`): The absolute URL of the request.
+
+    Returns:
+        `str`, `object`: The cache key, and the data or `None` on a miss
+    """
+    version = get_section_version(owner_id, model)
+    tier = get_viewer_tier(viewer, owner_id, model, version)
+    digest = hashlib.sha256(f"{tier}:{url}".encode()).hexdigest()
+    key = f"{KEY_PREFIX}:{owner_id}:{SECTIONS[model]}:{version}:{digest}"
+    entry = cache.get(key)
+    if entry is None:
+        increment_metric("misses")
+        return key, None
+    data, cached_at = entry
+    increment_metric("hits")
+    increment_metric("hit_age_ms", int((time.time() - cached_at) * 1000))
+    return key, data
+
+
+def set_cached_response(key, data):
+    cache.set(key, (data, time.time()), settings.PROFILE_CACHE_TIMEOUT)
+
+
+def increment_metric(name, delta=1):
+    key = f"{KEY_PREFIX}:metrics:{name}"
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        cache.add(key, delta, None)
+
+
+def get_metrics():
+    """Get the metrics of the cache since they were last reset.
+
+    Returns:
+        `dict`: The hits, misses and invalidations, the hit rate, and the
+        staleness as the mean age in seconds of the served entries.
+    """
+    values = cache.get_many([f"{KEY_PREFIX}:metrics:{name}" for name in METRICS])
+    metrics = {name: values.get(f"{KEY_PREFIX}:metrics:{name}", 0) for name in METRICS}
+    lookups = metrics["hits"] + metrics["misses"]
+    hit_age_ms = metrics.pop("hit_age_ms")
+    metrics["hit_rate"] = round(metrics["hits"] / lookups, 4) if lookups else None
+    metrics["mean_hit_age"] = round(hit_age_ms / metrics["hits"] / 1000, 3) \
+        if metrics["hits"] else None
+    return metrics
+
+
+def reset_metrics():
+    cache.delete_many([f"{KEY_PREFIX}:metrics:{name}" for name in METRICS])
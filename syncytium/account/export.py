@@ -0,0 +1,85 @@
+import json
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import (
+    UserAddress, UserBirthDate, UserEducation, UserLink, UserPhone, UserProfile,
+    UserWorkExperience,
+)
+
+User = get_user_model()
+
+USER_FIELDS = [
+    "id", "username", "email", "first_name", "last_name", "date_joined",
+    "last_login", "registration_method",
+]
+PRIVATIZED_FIELDS = ["privacy", "created", "modified"]
+
+# Section name, model, exported fields and whether a user has many rows
+SECTIONS = [
+    ("profile", UserProfile, ["bio", "gender", "created", "modified"], False),
+    (
+        "address", UserAddress,
+        ["country__name", "city__name", *PRIVATIZED_FIELDS], False,
+    ),
+    ("birth_date", UserBirthDate, ["birth_date", *PRIVATIZED_FIELDS], False),
+    ("links", UserLink, ["link", *PRIVATIZED_FIELDS], True),
+    ("phones", UserPhone, ["phone", "is_primary", *PRIVATIZED_FIELDS], True),
+    (
+        "educations", UserEducation,
+        [
+            "school", "degree", "field_of_study", "start_date", "end_date",
+            "description", *PRIVATIZED_FIELDS,
+        ],
+        True,
+    ),
+    (
+        "work_experiences", UserWorkExperience,
+        [
+            "company", "position", "start_date", "end_date", "description",
+            *PRIVATIZED_FIELDS,
+        ],
+        True,
+    ),
+]
+
+
+def export_users(queryset=None, chunk_size=500):
+    """Export users with all of their account data as NDJSON lines.
+
+    Operations:
+    - Users are read with `.iterator(chunk_size)`, and each section is
+    fetched with one query per chunk of users, so memory stays bounded by
+    the chunk whatever the number of exported users.
+    - Every line is a JSON object holding one user and their sections.
+
+    Args:
+        `queryset` (`QuerySet`): The users to export, all by default.
+        `chunk_size` (`int`): The number of users per chunk.
+
+    Yields:
+        `str`: One JSON line per user.
+    """
+    if queryset is None:
+        queryset = User.objects.all()
+    users = queryset.order_by("id").values(*USER_FIELDS).iterator(chunk_size)
+    while chunk := list(islice(users, chunk_size)):
+        user_ids = [user["id"] for user in chunk]
+        sections = {name: {} for name, *_ in SECTIONS}
+        for name, model, fields, many in SECTIONS:
+            rows = model.objects.filter(user_id__in=user_ids) \
+                .order_by("user_id", "id").values("user_id", *fields) \
+                .iterator(chunk_size)
+            for row in rows:
+                user_id = row.pop("user_id")
+                if many:
+                    sections[name].setdefault(user_id, []).append(row)
+                else:
+                    sections[name][user_id] = row
+        for user in chunk:
+            data = {"user": user}
+            for name, _, _, many in SECTIONS:
+                data[name] = sections[name].get(user["id"], [] if many else None)
+            yield json.dumps(data, cls=DjangoJSONEncoder) + "\n"
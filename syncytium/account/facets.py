@@ -0,0 +1,249 @@
+"""Facets of the user directory, i.e. the cities, schools and companies of
+the users with the number of users having each of them.
+
+The facet values of each user are stored as `UserFacet` rows, and their
+user counts as `FacetCount` rows. When a user's rows change, their values
+are recomputed and compared with the stored ones, and only the difference
+is applied to the counts, so no request has to group the users.
+"""
+from collections import Counter
+from functools import reduce
+from operator import or_
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Count, F, Q, Window
+from django.db.models.functions import RowNumber
+
+from core.models import Privacy
+from core.utils import normalize_text
+
+from .models import (
+    Facet, FacetCount, UserAddress, UserEducation, UserFacet, UserWorkExperience,
+)
+
+User = get_user_model()
+
+VALUE_MAX_LENGTH = UserFacet._meta.get_field("value").max_length
+
+# The fields the facet values are computed from, by model
+FACET_FIELDS = {
+    User: {"is_active"},
+    UserAddress: {"user", "city", "privacy"},
+    UserEducation: {"user", "school", "privacy"},
+    UserWorkExperience: {"user", "company", "privacy"},
+}
+
+
+def get_facet_value(facet, value):
+    """Get the stored value of a facet, from a city ID or a school or
+    company name, e.g. `"nust"` for `"NUST "`.
+    """
+    if facet == Facet.CITY:
+        return str(value)
+    return normalize_text(value)[:VALUE_MAX_LENGTH]
+
+
+def get_user_facets(user_ids):
+    """Get the facet values of users, from their public address, schools
+    and companies. Inactive users have no values.
+
+    Args:
+        `user_ids` (`list`): The IDs of the users.
+
+    Returns:
+        `dict`: The `{(facet, value): label}` dictionary of each existing
+        user ID, the label being the city name or the first spelling of
+        the school or company.
+    """
+    facets = {
+        user_id: {}
+        for user_id in User.objects
+        .filter(id__in=user_ids, is_active=True).values_list("id", flat=True)
+    }
+    addresses = UserAddress.objects \
+        .filter(user_id__in=facets, privacy=Privacy.PUBLIC, city__isnull=False) \
+        .values_list("user_id", "city_id", "city__name")
+    for user_id, city_id, name in addresses:
+        facets[user_id][(Facet.CITY, get_facet_value(Facet.CITY, city_id))] = name
+    for model, facet, field in [
+        (UserEducation, Facet.SCHOOL, "school"),
+        (UserWorkExperience, Facet.COMPANY, "company"),
+    ]:
+        rows = model.objects \
+            .filter(user_id__in=facets, privacy=Privacy.PUBLIC) \
+            .order_by("id").values_list("user_id", field)
+        for user_id, name in rows:
+            value = get_facet_value(facet, name)
+            if value:
+                facets[user_id].setdefault((facet, value), name.strip())
+    return facets
+
+
+def get_facet_filter(keys):
+    return reduce(or_, (Q(facet=facet, value=value) for facet, value in keys))
+
+
+def index_user_facets(user_id, facets=None):
+    """Bring the facet values of a user up to date, adding one to the
+    counts of the added values and removing one from the counts of the
+    removed values.
+
+    Args:
+        `user_id` (`int`): The ID of the user.
+        `facets` (`dict`): The values to store, computed by default.
+
+    Returns:
+        `int`: The number of added and removed values
+    """
+    if facets is None:
+        facets = get_user_facets([user_id]).get(user_id, {})
+    with transaction.atomic():
+        stored = set(
+            UserFacet.objects.select_for_update()
+            .filter(user_id=user_id).values_list("facet", "value")
+        )
+        # Sorted so concurrent updates lock the counts in the same order
+        added = sorted(key for key in facets if key not in stored)
+        removed = sorted(key for key in stored if key not in facets)
+        if removed:
+            UserFacet.objects.filter(user_id=user_id) \
+                .filter(get_facet_filter(removed)).delete()
+            FacetCount.objects.filter(get_facet_filter(removed)) \
+                .update(count=F("count") - 1)
+        if added:
+            UserFacet.objects.bulk_create(
+                UserFacet(user_id=user_id, facet=facet, value=value)
+                for facet, value in added
+            )
+            update_facet_counts(dict.fromkeys(added, 1), facets)
+    return len(added) + len(removed)
+
+
+def index_users_facets(user_ids):
+    """Bring the facet values of users up to date in one transaction, e.g.
+    after rows were written in bulk without signals, applying the summed
+    differences of all the users to the counts.
+
+    Returns:
+        `int`: The number of added and removed values
+    """
+    facets = get_user_facets(user_ids)
+    with transaction.atomic():
+        stored = {}
+        rows = UserFacet.objects.select_for_update() \
+            .filter(user_id__in=user_ids).values_list("id", "user_id", "facet", "value")
+        for row_id, user_id, facet, value in rows:
+            stored.setdefault(user_id, {})[(facet, value)] = row_id
+        deltas, labels = Counter(), {}
+        added, removed = [], []
+        for user_id in user_ids:
+            user_facets, user_stored = facets.get(user_id, {}), stored.get(user_id, {})
+            for key, label in user_facets.items():
+                if key not in user_stored:
+                    added.append(UserFacet(user_id=user_id, facet=key[0], value=key[1]))
+                    deltas[key] += 1
+                    labels.setdefault(key, label)
+            for key, row_id in user_stored.items():
+                if key not in user_facets:
+                    removed.append(row_id)
+                    deltas[key] -= 1
+        if removed:
+            UserFacet.objects.filter(id__in=removed).delete()
+        UserFacet.objects.bulk_create(added)
+        update_facet_counts(deltas, labels)
+    return len(added) + len(removed)
+
+
+def update_facet_counts(deltas, labels):
+    """Add differences to the counts of facet values, creating the counts
+    of new values with their label.
+
+    Args:
+        `deltas` (`dict`): The difference of each `(facet, value)`.
+        `labels` (`dict`): The label of each added `(facet, value)`.
+    """
+    # Sorted so concurrent updates lock the counts in the same order
+    for facet, value in sorted(deltas):
+        delta = deltas[(facet, value)]
+        if not delta:
+            continue
+        updated = FacetCount.objects.filter(facet=facet, value=value) \
+            .update(count=F("count") + delta)
+        if not updated and delta > 0:
+            FacetCount.objects.create(
+                facet=facet, value=value, count=delta,
+                label=labels[(facet, value)][:VALUE_MAX_LENGTH],
+            )
+
+
+def rebuild_facets(chunk_size=1000):
+    """Recompute the facet values of all users, a chunk of users per
+    transaction, then recount them. Writes made in the meantime may be
+    miscounted, so it should run while the directory is not written.
+
+    Yields:
+        `int`: The number of users indexed so far, after each chunk
+    """
+    labels = {}
+    indexed, last_id = 0, 0
+    while True:
+        user_ids = list(
+            User.objects.filter(id__gt=last_id).order_by("id")
+            .values_list("id", flat=True)[:chunk_size]
+        )
+        if not user_ids:
+            break
+        facets = get_user_facets(user_ids)
+        with transaction.atomic():
+            UserFacet.objects.filter(user_id__in=user_ids).delete()
+            UserFacet.objects.bulk_create(
+                UserFacet(user_id=user_id, facet=facet, value=value)
+                for user_id, user_facets in facets.items()
+                for facet, value in user_facets
+            )
+        for user_facets in facets.values():
+            for key, label in user_facets.items():
+                labels.setdefault(key, label)
+        indexed += len(user_ids)
+        last_id = user_ids[-1]
+        yield indexed
+
+    counts = UserFacet.objects.values_list("facet", "value").annotate(count=Count("id"))
+    with transaction.atomic():
+        FacetCount.objects.all().delete()
+        FacetCount.objects.bulk_create(
+            FacetCount(
+                facet=facet, value=value, count=count,
+                label=labels.get((facet, value), value)[:VALUE_MAX_LENGTH],
+            )
+            for facet, value, count in counts.iterator()
+        )
+
+
+def get_facet_counts(selected=None, limit=10):
+    """Get the most common values of each facet with their user counts, in
+    one query.
+
+    Args:
+        `selected` (`dict`): The selected value of some facets, included
+        even when they are not among the most common.
+        `limit` (`int`): The maximum number of values per facet.
+
+    Returns:
+        `dict`: The `{"value", "label", "count"}` dictionaries of each facet
+    """
+    condition = Q(position__lte=limit)
+    if selected:
+        condition |= get_facet_filter(selected.items())
+    rows = FacetCount.objects.filter(count__gt=0) \
+        .annotate(position=Window(
+            RowNumber(), partition_by=F("facet"), order_by=[F("count").desc(), F("value")],
+        )) \
+        .filter(condition) \
+        .order_by("-count", "value") \
+        .values("facet", "value", "label", "count")
+    counts = {facet: [] for facet in Facet.values}
+    for row in rows:
+        counts[row.pop("facet")].append(row)
+    return counts
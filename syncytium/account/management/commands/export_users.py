@@ -0,0 +1,46 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from account.export import export_users
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        "Export users with all of their account data as NDJSON, one user per "
+        "line, streamed in chunks so memory stays constant."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "usernames", nargs="*",
+            help="Usernames to export, all users by default.",
+        )
+        parser.add_argument(
+            "--output", default="-",
+            help="File to write, stdout by default.",
+        )
+        parser.add_argument(
+            "--chunk-size", type=int, default=500,
+            help="Number of users read per chunk.",
+        )
+
+    def handle(self, *args, **options):
+        queryset = User.objects.all()
+        if options["usernames"]:
+            queryset = queryset.filter(username__in=options["usernames"])
+        output = options["output"]
+        file = None if output == "-" else open(output, "w", encoding="utf-8")
+        exported = 0
+        try:
+            for line in export_users(queryset, options["chunk_size"]):
+                if file:
+                    file.write(line)
+                else:
+                    self.stdout.write(line, ending="")
+                exported += 1
+        finally:
+            if file:
+                file.close()
+        self.stderr.write(f"Exported {exported} users")
@@ -0,0 +1,288 @@
+import random
+import time
+from datetime import date, timedelta
+from multiprocessing import Pool
+
+import django
+from cities_light.models import City
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, transaction
+
+from account.facets import index_users_facets
+from account.models import (
+    Gender, UserAddress, UserBirthDate, UserEducation, UserEmailStatus, UserLink,
+    UserPhone, UserProfile, UserWorkExperience, get_city_geo_cell,
+)
+from account.search import index_users
+from core.models import PrivatizedModel, Privacy
+
+User = get_user_model()
+
+PASSWORD = "Population-Passw0rd"
+# Dates are generated relative to a fixed day, not today, to stay reproducible
+REFERENCE_DATE = date(2024, 1, 1)
+FIRST_NAMES = [
+    "Ali", "Ayesha", "Bilal", "Fatima", "Hamza", "Hira", "Omar", "Sara",
+    "John", "Maria", "David", "Anna", "Wei", "Mei", "Raj", "Priya",
+]
+LAST_NAMES = [
+    "Khan", "Ahmed", "Malik", "Hussain", "Smith", "Garcia", "Chen", "Patel",
+    "Kim", "Silva", "Müller", "Rossi",
+]
+SCHOOLS = [
+    "NUST", "LUMS", "FAST", "GIKI", "MIT", "Stanford", "Oxford", "ETH Zurich",
+    "University of Tokyo", "University of Toronto",
+]
+DEGREES = ["Matric", "Intermediate", "BSc", "BS", "MSc", "MBA", "PhD"]
+FIELDS_OF_STUDY = [
+    "Computer Science", "Electrical Engineering", "Mathematics", "Physics",
+    "Economics", "Medicine", "Law", "Architecture",
+]
+COMPANIES = [
+    "Systems Ltd", "Arbisoft", "Careem", "Google", "Microsoft", "Amazon",
+    "Siemens", "Unilever", "Engro", "Jazz",
+]
+POSITIONS = [
+    "Software Engineer", "Data Scientist", "Product Manager", "Designer",
+    "Accountant", "Doctor", "Teacher", "Sales Manager",
+]
+
+# Weights of the privacy settings, most rows being public
+PRIVACIES = [Privacy.PUBLIC, Privacy.FRIENDS, Privacy.FRIENDS_OF_FRIENDS,
+             Privacy.CUSTOM, Privacy.PRIVATE]
+PRIVACY_WEIGHTS = [60, 15, 10, 10, 5]
+# Weights of 0, 1, 2... rows per user
+EDUCATION_WEIGHTS = [10, 30, 35, 20, 5]
+WORK_EXPERIENCE_WEIGHTS = [25, 35, 25, 10, 5]
+LINK_WEIGHTS = [40, 35, 20, 5]
+PHONE_WEIGHTS = [30, 60, 10]
+
+# The cities addresses point at, set in each worker process
+cities = []
+
+
+def init_worker(city_choices):
+    """Set up Django and the cities in the generating processes."""
+    global cities
+    django.setup()
+    cities = city_choices
+
+
+def get_cities():
+    """Get the cities with their countries and geohash cells, and the
+    population weights addresses are picked with.
+    """
+    rows = City.objects.order_by("id") \
+        .only("id", "country_id", "population", "latitude", "longitude")
+    ids, weights = [], []
+    for city in rows:
+        # Bulk inserts skip `UserAddress.save`, which sets the cell
+        ids.append((city.id, city.country_id, get_city_geo_cell(city)))
+        weights.append(city.population or 1)
+    return ids, weights
+
+
+def pick_privacy(rng):
+    return rng.choices(PRIVACIES, PRIVACY_WEIGHTS)[0]
+
+
+def pick_period(rng, start_year, end_year, years):
+    """Pick a start date and an end date `years` later, open when it is
+    after the reference date.
+    """
+    end_year = min(end_year, REFERENCE_DATE.year - 1)
+    start = date(rng.randint(start_year, end_year), rng.randint(1, 12), 1)
+    end = start + timedelta(days=365 * years)
+    return start, end if end < REFERENCE_DATE else None
+
+
+def generate_chunk(seed, start, size, password):
+    """Generate and write the users `start` to `start + size` with their
+    related rows in one transaction, one `INSERT` per model.
+
+    The chunk draws from its own `random.Random` seeded with the seed and
+    its first user, so its content does not depend on the processes and
+    the order the chunks are written in.
+
+    Returns:
+        `tuple`: The number of written users and related rows
+    """
+    rng = random.Random(f"{seed}:{start}")
+    city_ids, city_weights = cities
+    users = []
+    for index in range(start, start + size):
+        first_name, last_name = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        users.append(User(
+            username=f"pop{index}", email=f"pop{index}@example.com",
+            first_name=first_name, last_name=last_name, password=password,
+        ))
+
+    with transaction.atomic():
+        User.objects.bulk_create(users)
+        rows = {model: [] for model in [
+            UserEmailStatus, UserProfile, UserBirthDate, UserAddress, UserLink,
+            UserPhone, UserEducation, UserWorkExperience,
+        ]}
+        for user in users:
+            rows[UserEmailStatus].append(UserEmailStatus(user=user, is_verified=True))
+            rows[UserProfile].append(UserProfile(
+                user=user, gender=rng.choice(Gender.values),
+                bio=f"{user.first_name} {user.last_name} from the population",
+            ))
+            birth_date = date(rng.randint(1960, 2000), rng.randint(1, 12), rng.randint(1, 28))
+            rows[UserBirthDate].append(UserBirthDate(
+                user=user, birth_date=birth_date, privacy=pick_privacy(rng),
+            ))
+            if city_ids:
+                city_id, country_id, geo_cell = rng.choices(city_ids, city_weights)[0]
+                rows[UserAddress].append(UserAddress(
+                    user=user, city_id=city_id, country_id=country_id,
+                    geo_cell=geo_cell, privacy=pick_privacy(rng),
+                ))
+            for number in range(rng.choices(range(len(LINK_WEIGHTS)), LINK_WEIGHTS)[0]):
+                rows[UserLink].append(UserLink(
+                    user=user, link=f"https://example.com/{user.username}/{number}",
+                    privacy=pick_privacy(rng),
+                ))
+            for number in range(rng.choices(range(len(PHONE_WEIGHTS)), PHONE_WEIGHTS)[0]):
+                rows[UserPhone].append(UserPhone(
+                    user=user, phone=f"+92300{rng.randrange(10 ** 7):07d}",
+                    is_primary=number == 0, privacy=pick_privacy(rng),
+                ))
+            year = birth_date.year
+            for _ in range(rng.choices(range(len(EDUCATION_WEIGHTS)), EDUCATION_WEIGHTS)[0]):
+                start_date, end_date = pick_period(rng, year + 5, year + 30, rng.randint(1, 5))
+                rows[UserEducation].append(UserEducation(
+                    user=user, school=rng.choice(SCHOOLS), degree=rng.choice(DEGREES),
+                    field_of_study=rng.choice(FIELDS_OF_STUDY),
+                    start_date=start_date, end_date=end_date, privacy=pick_privacy(rng),
+                ))
+            for _ in range(
+                rng.choices(range(len(WORK_EXPERIENCE_WEIGHTS)), WORK_EXPERIENCE_WEIGHTS)[0]
+            ):
+                start_date, end_date = pick_period(rng, year + 20, year + 45, rng.randint(1, 10))
+                rows[UserWorkExperience].append(UserWorkExperience(
+                    user=user, company=rng.choice(COMPANIES),
+                    position=rng.choice(POSITIONS), start_date=start_date,
+                    end_date=end_date, privacy=pick_privacy(rng),
+                ))
+
+        written = 0
+        for model, objects in rows.items():
+            model.objects.bulk_create(objects)
+            written += len(objects)
+
+        # Custom rows are shared with other users of the same chunk, picked
+        # by position so the sets are the same whatever IDs the users get
+        for model, objects in rows.items():
+            if not issubclass(model, PrivatizedModel):
+                continue
+            through = model.custom_people.through
+            source = model.custom_people.field.m2m_field_name()
+            target = model.custom_people.field.m2m_reverse_field_name()
+            links = []
+            for obj in objects:
+                if obj.privacy != Privacy.CUSTOM:
+                    continue
+                people = rng.sample(users, min(len(users) - 1, rng.randint(1, 10)))
+                links.extend(
+                    through(**{f"{source}_id": obj.id, f"{target}_id": person.id})
+                    for person in people if person.id != obj.user_id
+                )
+            through.objects.bulk_create(links)
+            written += len(links)
+    # Bulk writes send no signals, the users are indexed once committed
+    user_ids = [user.id for user in users]
+    index_users(user_ids)
+    index_users_facets(user_ids)
+    return len(users), written
+
+
+def run_task(task):
+    return generate_chunk(*task)
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate a synthetic population of users with their profiles, "
+        "addresses in the existing cities, links, phones, educations and work "
+        "experiences, with random privacy settings including custom people. "
+        "The same seed always generates the same population."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("users", type=int, help="Number of users to generate.")
+        parser.add_argument(
+            "--seed", type=int, default=0, help="Seed of the random generators.",
+        )
+        parser.add_argument(
+            "--offset", type=int, default=0,
+            help="Number of the first user, to grow an existing population.",
+        )
+        parser.add_argument(
+            "--chunk-size", type=int, default=5000,
+            help="Number of users written per transaction.",
+        )
+        parser.add_argument(
+            "--workers", type=int, default=None,
+            help="Generating processes, 0 to generate in this process.",
+        )
+
+    def handle(self, *args, **options):
+        global cities
+        total, offset = options["users"], options["offset"]
+        chunk_size = options["chunk_size"]
+        if total < 1 or chunk_size < 1:
+            raise CommandError("The users and the chunk size must be positive.")
+        if User.objects.filter(username=f"pop{offset}").exists():
+            raise CommandError(
+                f"User pop{offset} already exists, pass a new --offset."
+            )
+
+        cities = get_cities()
+        if not cities[0]:
+            self.stderr.write("No cities found, users are generated without addresses.")
+        # One hash for all the users keeps the generation fast, they can
+        # still log in with the password
+        password = make_password(PASSWORD)
+        tasks = [
+            (options["seed"], start, min(chunk_size, offset + total - start), password)
+            for start in range(offset, offset + total, chunk_size)
+        ]
+
+        started = time.monotonic()
+        users = written = 0
+        workers = options["workers"]
+        if workers != 0 and connection.vendor == "sqlite":
+            # SQLite locks the database file for each writing transaction
+            self.stderr.write("SQLite allows a single writer, generating in this process.")
+            workers = 0
+        if workers == 0:
+            results = (generate_chunk(*task) for task in tasks)
+            pool = None
+        else:
+            # The processes must open their own database connections
+            connections.close_all()
+            pool = Pool(workers, init_worker, (cities,))
+            results = pool.imap_unordered(run_task, tasks)
+        try:
+            for count, related in results:
+                users += count
+                written += related
+                elapsed = time.monotonic() - started
+                self.stdout.write(
+                    f"{users}/{total} users, {written} related rows "
+                    f"({users / elapsed:.0f} users/s)"
+                )
+        finally:
+            if pool:
+                pool.terminate()
+                pool.join()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Generated {total} users and {written} related rows in "
+            f"{time.monotonic() - started:.1f}s"
+        ))
+
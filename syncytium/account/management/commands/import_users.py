@@ -0,0 +1,398 @@
+import csv
+import json
+import os
+import sys
+import time
+from array import array
+from concurrent.futures import Future, ProcessPoolExecutor
+from datetime import date
+from itertools import islice
+
+import django
+from cities_light.models import City, Country
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, transaction
+
+from account.facets import index_users_facets
+from account.models import (
+    Gender, UserAddress, UserEducation, UserEmailStatus, UserProfile,
+    UserWorkExperience, get_city_geo_cell,
+)
+from account.search import index_users
+from account.tasks import get_registration_email
+from core.models import Privacy
+from core.utils import is_reserved_username, send_mass_email
+
+User = get_user_model()
+
+USER_FIELDS = ["username", "email", "first_name", "last_name"]
+EDUCATION_FIELDS = [
+    "school", "degree", "field_of_study", "start_date", "end_date",
+    "description", "privacy",
+]
+WORK_EXPERIENCE_FIELDS = [
+    "company", "position", "start_date", "end_date", "description", "privacy",
+]
+# Writes of a chunk retried when a concurrent sign-up takes a username or
+# email after it was checked
+WRITE_ATTEMPTS = 3
+
+
+def init_worker():
+    """Set up Django in the password hashing processes."""
+    django.setup()
+
+
+def hash_passwords(passwords):
+    """Hash the given passwords, an empty one giving an unusable password."""
+    return [make_password(password or None) for password in passwords]
+
+
+def read_rows(file, format):
+    """Stream the rows of a CSV or JSONL file as dicts.
+
+    In CSV files, `educations` and `work_experiences` are JSON encoded.
+    """
+    if format == "csv":
+        for row in csv.DictReader(file):
+            for key in ["educations", "work_experiences"]:
+                row[key] = json.loads(row[key]) if row.get(key) else []
+            yield row
+    else:
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def clean_values(model, values):
+    """Run the validators of the model fields on the values, e.g. their
+    maximum length, as saving a model instance would.
+
+    Raises:
+    - `ValueError`: If a value is invalid.
+    """
+    for field, value in values.items():
+        try:
+            values[field] = model._meta.get_field(field).clean(value, None)
+        except ValidationError as e:
+            raise ValueError(f"Invalid {field}: {' '.join(e.messages)}")
+    return values
+
+
+def parse_entries(model, entries, fields, required):
+    """Validate the education or work experience entries of a row.
+
+    Raises:
+    - `ValueError`: If an entry is invalid.
+    """
+    parsed = []
+    for entry in entries:
+        missing = [field for field in required if not entry.get(field)]
+        if missing:
+            raise ValueError(f"Missing {', '.join(missing)}")
+        values = {field: entry[field] for field in fields if entry.get(field)}
+        for field in ["start_date", "end_date"]:
+            if field in values:
+                values[field] = date.fromisoformat(values[field])
+        if values.get("privacy", Privacy.PUBLIC) not in Privacy.values:
+            raise ValueError(f"Invalid privacy {values['privacy']}")
+        parsed.append(clean_values(model, values))
+    return parsed
+
+
+class Command(BaseCommand):
+    help = (
+        "Import users from a CSV or JSONL file, streamed in chunks. Each row "
+        "holds username, email, first_name, last_name, password, bio, gender, "
+        "country (ISO code), city (name), educations and work_experiences. "
+        "Users whose username or email is taken are skipped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="File to import, or - for stdin.")
+        parser.add_argument(
+            "--format", choices=["csv", "jsonl"], default=None,
+            help="File format, guessed from the extension by default.",
+        )
+        parser.add_argument(
+            "--chunk-size", type=int, default=1000,
+            help="Number of rows written per transaction.",
+        )
+        parser.add_argument(
+            "--workers", type=int, default=None,
+            help="Password hashing processes, 0 to hash in this process.",
+        )
+        parser.add_argument(
+            "--verified", action="store_true",
+            help="Mark the imported emails as verified.",
+        )
+        parser.add_argument(
+            "--no-email", action="store_true",
+            help="Do not queue the registration emails.",
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        format = options["format"] or ("csv" if path.endswith(".csv") else "jsonl")
+        self.verified = options["verified"]
+        self.verbosity = options["verbosity"]
+        self.stats = {"rows": 0, "created": 0, "skipped": 0, "invalid": 0}
+        self.countries = {}
+        for id, code2, code3 in Country.objects.values_list("id", "code2", "code3"):
+            self.countries[code2.upper()] = self.countries[code3.upper()] = id
+
+        try:
+            file = sys.stdin if path == "-" else open(path, newline="", encoding="utf-8")
+        except OSError as e:
+            raise CommandError(e)
+        workers = options["workers"]
+        if workers is None:
+            workers = os.cpu_count() or 1
+        pool = ProcessPoolExecutor(workers, initializer=init_worker) if workers else None
+        self.workers = workers or 1
+        self.started = time.monotonic()
+        created_ids = array("q")
+
+        try:
+            # Passwords of the next chunk are hashed while the current one
+            # is written
+            pending = None
+            for chunk in chunked(read_rows(file, format), options["chunk_size"]):
+                rows = self.parse_chunk(chunk)
+                hashed = self.hash_passwords(pool, [row["password"] for row in rows])
+                if pending:
+                    created_ids.extend(self.write_chunk(*pending))
+                    self.report()
+                pending = rows, hashed
+            if pending:
+                created_ids.extend(self.write_chunk(*pending))
+                self.report()
+        finally:
+            if pool:
+                pool.shutdown(cancel_futures=True)
+            if file is not sys.stdin:
+                file.close()
+
+        if not options["no_email"]:
+            self.queue_emails(created_ids, options["chunk_size"])
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {self.stats['created']} users in "
+            f"{time.monotonic() - self.started:.1f}s"
+        ))
+
+    def parse_row(self, row):
+        """Validate a row and split it into the values of each model.
+
+        Raises:
+        - `ValueError`: If the row is invalid.
+        """
+        user = {field: (row.get(field) or "").strip() for field in USER_FIELDS}
+        if not user["username"] or not user["email"]:
+            raise ValueError("Missing username or email")
+        user["username"] = User.normalize_username(user["username"])
+        user["email"] = User.objects.normalize_email(user["email"])
+        clean_values(User, user)
+        if is_reserved_username(user["username"]):
+            raise ValueError(f"Reserved username {user['username']}")
+        profile = {
+            field: row[field] for field in ["bio", "gender"] if row.get(field)
+        }
+        if profile.get("gender", "") not in Gender.values + [""]:
+            raise ValueError(f"Invalid gender {profile['gender']}")
+        clean_values(UserProfile, profile)
+        address = {}
+        if row.get("country"):
+            country_id = self.countries.get(row["country"].upper())
+            if country_id is None:
+                raise ValueError(f"Unknown country {row['country']}")
+            address["country_id"] = country_id
+        if row.get("city"):
+            if not address:
+                raise ValueError("City given without a country")
+            address["city"] = row["city"]
+        return {
+            "user": user,
+            "password": row.get("password") or "",
+            "profile": profile,
+            "address": address,
+            "educations": parse_entries(
+                UserEducation, row.get("educations") or [], EDUCATION_FIELDS,
+                ["school", "degree", "field_of_study", "start_date"],
+            ),
+            "work_experiences": parse_entries(
+                UserWorkExperience, row.get("work_experiences") or [],
+                WORK_EXPERIENCE_FIELDS,
+                ["company", "position", "start_date"],
+            ),
+        }
+
+    def parse_chunk(self, chunk):
+        """Parse the rows of a chunk, resolving their cities in one query.
+
+        Returns:
+            `list`: The valid rows
+        """
+        rows = []
+        for row in chunk:
+            self.stats["rows"] += 1
+            try:
+                rows.append(self.parse_row(row))
+            except (ValueError, TypeError, AttributeError) as e:
+                self.invalid(e)
+
+        addresses = [row["address"] for row in rows if "city" in row["address"]]
+        if addresses:
+            # The most populated city wins when names are ambiguous
+            cities = {}
+            queryset = City.objects.filter(
+                country_id__in={address["country_id"] for address in addresses},
+                name__in={address["city"] for address in addresses},
+            ).order_by("-population").only("country_id", "name", "latitude", "longitude")
+            for city in queryset:
+                cities.setdefault((city.country_id, city.name), city)
+            valid_rows = []
+            for row in rows:
+                address = row["address"]
+                if "city" in address:
+                    city = cities.get((address["country_id"], address["city"]))
+                    if city is None:
+                        self.invalid(f"Unknown city {address['city']}")
+                        continue
+                    # Bulk inserts skip `UserAddress.save`, which sets the cell
+                    address["city_id"] = city.id
+                    address["geo_cell"] = get_city_geo_cell(city)
+                    del address["city"]
+                valid_rows.append(row)
+            rows = valid_rows
+        return rows
+
+    def invalid(self, error):
+        self.stats["invalid"] += 1
+        if self.verbosity > 1:
+            self.stderr.write(f"Row {self.stats['rows']}: {error}")
+
+    def hash_passwords(self, pool, passwords):
+        """Hash the passwords, split across the processes of the pool.
+
+        Returns:
+            `list`: The futures of the hashed passwords, in order
+        """
+        if pool is None:
+            future = Future()
+            future.set_result(hash_passwords(passwords))
+            return [future]
+        size = max(1, -(-len(passwords) // self.workers))
+        return [
+            pool.submit(hash_passwords, passwords[index:index + size])
+            for index in range(0, len(passwords), size)
+        ]
+
+    def write_chunk(self, rows, hashed):
+        """Write the users of a chunk with their related rows in one
+        transaction, one `INSERT` per model.
+
+        Operations:
+        - Rows whose username or email is taken are skipped.
+        - When a username or email is taken concurrently, the transaction
+        is retried with the taken ones checked again, up to
+        `WRITE_ATTEMPTS` times.
+        - The search postings and directory facets of the created users
+        are written once the transaction is committed, as bulk writes send
+        no signals.
+
+        Returns:
+            `list`: The IDs of the created users
+        """
+        passwords = [password for future in hashed for password in future.result()]
+        for attempt in range(1, WRITE_ATTEMPTS + 1):
+            try:
+                with transaction.atomic():
+                    users, skipped = self.write_rows(rows, passwords)
+                break
+            except IntegrityError:
+                if attempt == WRITE_ATTEMPTS:
+                    raise
+        user_ids = [user.id for user in users]
+        index_users(user_ids)
+        index_users_facets(user_ids)
+        self.stats["created"] += len(users)
+        self.stats["skipped"] += skipped
+        return user_ids
+
+    def write_rows(self, rows, passwords):
+        """Write the rows whose username and email are free, in the
+        transaction of `write_chunk`.
+
+        Returns:
+            `tuple`: The created users and the number of skipped rows
+        """
+        taken_usernames = set(User.objects.filter(
+            username__in=[row["user"]["username"] for row in rows]
+        ).values_list("username", flat=True))
+        taken_emails = set(User.objects.filter(
+            email__in=[row["user"]["email"] for row in rows]
+        ).values_list("email", flat=True))
+
+        users, entries = [], []
+        for row, password in zip(rows, passwords):
+            username, email = row["user"]["username"], row["user"]["email"]
+            if username in taken_usernames or email in taken_emails:
+                continue
+            taken_usernames.add(username)
+            taken_emails.add(email)
+            users.append(User(password=password, **row["user"]))
+            entries.append(row)
+        User.objects.bulk_create(users)
+
+        email_statuses, profiles, addresses = [], [], []
+        educations, work_experiences = [], []
+        for user, row in zip(users, entries):
+            email_statuses.append(
+                UserEmailStatus(user_id=user.id, is_verified=self.verified)
+            )
+            if row["profile"]:
+                profiles.append(UserProfile(user_id=user.id, **row["profile"]))
+            if row["address"]:
+                addresses.append(UserAddress(user_id=user.id, **row["address"]))
+            educations.extend(
+                UserEducation(user_id=user.id, **values)
+                for values in row["educations"]
+            )
+            work_experiences.extend(
+                UserWorkExperience(user_id=user.id, **values)
+                for values in row["work_experiences"]
+            )
+        UserEmailStatus.objects.bulk_create(email_statuses)
+        UserProfile.objects.bulk_create(profiles)
+        UserAddress.objects.bulk_create(addresses)
+        UserEducation.objects.bulk_create(educations)
+        UserWorkExperience.objects.bulk_create(work_experiences)
+        return users, len(rows) - len(users)
+
+    def report(self):
+        elapsed = time.monotonic() - self.started
+        self.stdout.write(
+            f"{self.stats['rows']} rows: {self.stats['created']} created, "
+            f"{self.stats['skipped']} skipped, {self.stats['invalid']} invalid "
+            f"({self.stats['rows'] / elapsed:.0f} rows/s)"
+        )
+
+    def queue_emails(self, user_ids, chunk_size):
+        """Queue the registration emails of the imported users, once they
+        are all written.
+        """
+        queued = 0
+        for index in range(0, len(user_ids), chunk_size):
+            users = User.objects.filter(id__in=list(user_ids[index:index + chunk_size])) \
+                .only("first_name", "email")
+            queued += send_mass_email(get_registration_email(user) for user in users)
+        self.stdout.write(f"Queued {queued} registration emails")
@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from account.facets import rebuild_facets
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the directory facets of all users and recount them, e.g. "
+        "after users were imported or generated in bulk. Saves keep the "
+        "counts up to date through background tasks otherwise."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--chunk-size", type=int, default=1000,
+            help="Number of users indexed per transaction.",
+        )
+
+    def handle(self, *args, **options):
+        if options["chunk_size"] < 1:
+            raise CommandError("The chunk size must be positive.")
+        started = time.monotonic()
+        indexed = 0
+        for indexed in rebuild_facets(options["chunk_size"]):
+            self.stdout.write(f"{indexed} users indexed")
+        self.stdout.write(self.style.SUCCESS(
+            f"Indexed {indexed} users in {time.monotonic() - started:.1f}s"
+        ))
@@ -0,0 +1,23 @@
+# Generated by Django 5.0.4 on 2026-10-18 12:10
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='usereducation',
+            index=models.Index(fields=['user', 'created', 'id'], name='account_use_user_id_369e62_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userworkexperience',
+            index=models.Index(fields=['user', 'created', 'id'], name='account_use_user_id_fe622e_idx'),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.0.4 on 2026-10-18 12:18
+
+import hashlib
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def hash_verification_tokens(apps, schema_editor):
+    """Hash the pending plaintext tokens, expiring them as before, i.e.
+    `TOKEN_VALIDITY` days after the row was created.
+    """
+    UserEmailStatus = apps.get_model("account", "UserEmailStatus")
+    email_statuses = UserEmailStatus.objects \
+        .filter(is_verified=False).exclude(verification_token="")
+    for email_status in email_statuses.iterator():
+        email_status.verification_token_hash = hashlib.sha256(
+            email_status.verification_token.encode()
+        ).hexdigest()
+        email_status.expires_at = email_status.created + timedelta(
+            days=settings.TOKEN_VALIDITY
+        )
+        email_status.save(update_fields=["verification_token_hash", "expires_at"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0002_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='useremailstatus',
+            name='expires_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='useremailstatus',
+            name='verification_token_hash',
+            field=models.CharField(blank=True, max_length=64, null=True, unique=True),
+        ),
+        migrations.RunPython(hash_verification_tokens, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='useremailstatus',
+            name='verification_token',
+        ),
+    ]
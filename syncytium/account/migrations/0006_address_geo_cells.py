@@ -0,0 +1,44 @@
+# Generated by Django 5.0.4 on 2026-10-18 12:51
+
+from django.conf import settings
+from django.db import migrations, models
+
+from core.geo import encode_geohash
+
+
+def fill_geo_cells(apps, schema_editor):
+    """Set the geohash cells of the existing addresses, one `UPDATE` per
+    city of the addresses.
+    """
+    City = apps.get_model("cities_light", "City")
+    UserAddress = apps.get_model("account", "UserAddress")
+    cities = City.objects \
+        .filter(id__in=UserAddress.objects.values("city_id")) \
+        .exclude(latitude=None).exclude(longitude=None) \
+        .values_list("id", "latitude", "longitude")
+    for city_id, latitude, longitude in cities.iterator():
+        UserAddress.objects.filter(city_id=city_id).update(
+            geo_cell=encode_geohash(latitude, longitude, 9)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0005_user_facets'),
+        ('cities_light', '0011_alter_city_country_alter_city_region_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='useraddress',
+            name='geo_cell',
+            field=models.CharField(blank=True, editable=False, max_length=9),
+        ),
+        migrations.AddIndex(
+            model_name='useraddress',
+            index=models.Index(fields=['geo_cell'], name='account_use_geo_cel_c0d6f8_idx'),
+        ),
+        migrations.RunPython(fill_geo_cells, migrations.RunPython.noop),
+    ]
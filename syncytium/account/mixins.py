@@ -1,5 +1,16 @@
-from rest_framework.exceptions import NotFound
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.permissions import SAFE_METHODS
+from rest_framework.response import Response
+from rest_framework.status import (
+    HTTP_200_OK, HTTP_201_CREATED, HTTP_400_BAD_REQUEST,
+)
+
+from core.utils import get_user_id_for_request
+
+from .cache import get_cached_response, invalidate_section, set_cached_response
+from .tasks import schedule_reindex
 
 
 class MustExistForUsernameAPIMixin:
@@ -10,6 +21,7 @@ class MustExistForUsernameAPIMixin:
 
         Preconditions:
         - The `model` attribute must be defined in the view.
+        - The view's `get_queryset` decides which rows the requester can see.
 
         Operations:
         - In case of read-only methods, if the object does not exist, raise a 404 error.
@@ -23,9 +35,135 @@ class MustExistForUsernameAPIMixin:
         or `create` is `False`.
         """
         username = self.kwargs.get("username")
+        user_id = get_user_id_for_request(self.request, username)
         try:
-            return self.model.objects.get(user__username=username)
+            return self.get_queryset().get(user_id=user_id)
         except self.model.DoesNotExist:
             if self.request.method in SAFE_METHODS or not create:
                 raise NotFound
-            return self.model.create(user_id=self.request.user.id)
+            return self.model.objects.create(user_id=self.request.user.id)
+
+
+class ProfileSectionCacheMixin:
+    """Mixin caching the `GET` responses of a profile section per owner and
+    viewer tier, see `account.cache`.
+
+    Preconditions:
+    - The `model` attribute must be a section of `account.cache.SECTIONS`.
+    - The `username` URL argument must identify the owner.
+    """
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.get_section_response(request, super().retrieve, *args, **kwargs)
+
+    def list(self, request, *args, **kwargs):
+        return self.get_section_response(request, super().list, *args, **kwargs)
+
+    def get_section_response(self, request, get_response, *args, **kwargs):
+        owner_id = get_user_id_for_request(request, self.kwargs.get("username"))
+        if owner_id is None:
+            return get_response(request, *args, **kwargs)
+        key, data = get_cached_response(
+            request.user, owner_id, self.model, request.build_absolute_uri()
+        )
+        if data is not None:
+            return Response(data)
+        response = get_response(request, *args, **kwargs)
+        if response.status_code == HTTP_200_OK:
+            set_cached_response(key, response.data)
+        return response
+
+
+class BulkModelViewSetMixin:
+    """Mixin adding list-based bulk actions to the viewsets of the rows the
+    current user owns.
+
+    Preconditions:
+    - The `model` attribute must be defined in the view, with a `user` field
+    and the `modified` field of `TimeStampedModel`.
+    - The serializer's `list_serializer_class` must create in bulk.
+    - The permissions must only allow the owner to write.
+
+    Operations:
+    - Every item is validated before anything is written, the whole batch
+    being rejected with the errors of each item otherwise.
+    - The batch is applied in one transaction, with a fixed number of
+    queries whatever its size.
+    """
+    bulk_max_items = 100
+
+    def get_bulk_items(self, request):
+        """Get the items of the request body.
+
+        Raises:
+        - `ValidationError`: If the body is not a list of at most
+        `bulk_max_items` items.
+        """
+        items = request.data
+        if not isinstance(items, list) or not items:
+            raise ValidationError("Expected a non-empty list.")
+        if len(items) > self.bulk_max_items:
+            raise ValidationError(f"At most {self.bulk_max_items} items are allowed.")
+        return items
+
+    def bulk_create(self, request, *args, **kwargs):
+        """Create the given items, returning them in the same order."""
+        serializer = self.get_serializer(data=self.get_bulk_items(request), many=True)
+        serializer.is_valid(raise_exception=True)
+        with transaction.atomic():
+            serializer.save(user_id=request.user.id)
+            # Bulk writes send no signals
+            invalidate_section(request.user.id, self.model)
+            schedule_reindex(self.model, request.user.id)
+        return Response(serializer.data, status=HTTP_201_CREATED)
+
+    def bulk_update(self, request, *args, **kwargs):
+        """Partially update the given items, identified by their `id`,
+        returning them in the same order.
+        """
+        items = self.get_bulk_items(request)
+        ids = [item.get("id") if isinstance(item, dict) else None for item in items]
+        instances = self.model.objects.filter(user_id=request.user.id) \
+            .in_bulk([id for id in ids if isinstance(id, int)])
+
+        serializers, errors, seen = [], [], set()
+        for id, item in zip(ids, items):
+            instance = instances.get(id) if isinstance(id, int) else None
+            if instance is None or id in seen:
+                message = "Duplicated." if id in seen else "Not found."
+                serializers.append(None)
+                errors.append({"id": [message]})
+                continue
+            seen.add(id)
+            serializer = self.get_serializer(instance, data=item, partial=True)
+            serializers.append(serializer)
+            errors.append({} if serializer.is_valid() else serializer.errors)
+        if any(errors):
+            return Response(errors, status=HTTP_400_BAD_REQUEST)
+
+        fields, now = {"modified"}, timezone.now()
+        for serializer in serializers:
+            for attr, value in serializer.validated_data.items():
+                setattr(serializer.instance, attr, value)
+                fields.add(attr)
+            serializer.instance.modified = now
+        with transaction.atomic():
+            self.model.objects.bulk_update(
+                [serializer.instance for serializer in serializers], list(fields)
+            )
+            invalidate_section(request.user.id, self.model)
+            schedule_reindex(self.model, request.user.id, fields)
+        return Response([serializer.data for serializer in serializers])
+
+    def bulk_destroy(self, request, *args, **kwargs):
+        """Delete the items with the given IDs, returning whether each one
+        was deleted.
+        """
+        ids = self.get_bulk_items(request)
+        if not all(isinstance(id, int) for id in ids):
+            raise ValidationError("Expected a list of IDs.")
+        with transaction.atomic():
+            queryset = self.model.objects.filter(user_id=request.user.id, id__in=ids)
+            deleted_ids = set(queryset.values_list("id", flat=True))
+            queryset.filter(id__in=deleted_ids).delete()
+        return Response([{"id": id, "deleted": id in deleted_ids} for id in ids])
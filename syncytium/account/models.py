@@ -2,11 +2,24 @@
 from django.contrib.auth import get_user_model
 from django.db import models
 
+from core.geo import encode_geohash
 from core.models import PrivatizedModel, TimeStampedModel, TokenMixin
 
 
 User = get_user_model()
 
+# About 5 meters, the addresses being looked up by prefixes of the cells
+GEO_CELL_PRECISION = 9
+
+
+def get_city_geo_cell(city):
+    """Get the geohash cell of the coordinates of a city, empty without
+    them.
+    """
+    if city is None or city.latitude is None or city.longitude is None:
+        return ""
+    return encode_geohash(city.latitude, city.longitude, GEO_CELL_PRECISION)
+
 
 class UserEmailStatus(TimeStampedModel, TokenMixin):
     """This model stores the user email status"""
@@ -59,8 +72,9 @@ class UserPhone(TimeStampedModel, PrivatizedModel):
     is_primary = models.BooleanField(default=False)
 
     def save(self, *args, **kwargs):
+        demote_others = self.is_primary and "is_primary" in self.get_dirty_fields()
         super().save(*args, **kwargs)
-        if self.is_primary:
+        if demote_others:
             UserPhone.objects.filter(user=self.user, is_primary=True) \
                 .exclude(pk=self.pk).update(is_primary=False)
 
@@ -80,13 +94,25 @@ class UserAddress(TimeStampedModel, PrivatizedModel):
     city = models.ForeignKey(
         "cities_light.City", on_delete=models.SET_NULL, null=True, blank=True
     )
+    # Geohash of the city coordinates, empty without them, see `core.geo`
+    geo_cell = models.CharField(max_length=GEO_CELL_PRECISION, blank=True, editable=False)
 
     class Meta:
         verbose_name_plural = "User addresses"
+        indexes = [models.Index(fields=["geo_cell"])]
 
     def __str__(self):
         return f"{self.user.username} – {self.city}, {self.country}"
 
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get("update_fields")
+        if "city" in self.get_dirty_fields() \
+                and (update_fields is None or "city" in update_fields):
+            self.geo_cell = get_city_geo_cell(self.city)
+            if update_fields is not None:
+                kwargs["update_fields"] = {*update_fields, "geo_cell"}
+        super().save(*args, **kwargs)
+
 
 class UserEducation(TimeStampedModel, PrivatizedModel):
     """This model stores the user education information"""
@@ -98,6 +124,9 @@ class UserEducation(TimeStampedModel, PrivatizedModel):
     end_date = models.DateField(null=True, blank=True)
     description = models.TextField(blank=True)
 
+    class Meta:
+        indexes = [models.Index(fields=["user", "created", "id"])]
+
     def __str__(self):
         return f"{self.user.username} studied {self.field_of_study} at {self.school}"
 
@@ -113,5 +142,77 @@ class UserWorkExperience(TimeStampedModel, PrivatizedModel):
     end_date = models.DateField(null=True, blank=True)
     description = models.TextField(blank=True)
 
+    class Meta:
+        indexes = [models.Index(fields=["user", "created", "id"])]
+
     def __str__(self):
         return f"{self.user.username} worked as a {self.position} at {self.company}"
+
+
+class UserSearchPosting(models.Model):
+    """This model stores the inverted index of the people search, one row
+    per normalized term of a user, weighted by the field it comes from.
+    It is maintained by `account.search.index_user`.
+    """
+    term = models.CharField(max_length=64)
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="search_postings"
+    )
+    weight = models.PositiveSmallIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["term", "user"], name="unique_user_search_posting"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.term} → {self.user_id}"
+
+
+class Facet(models.TextChoices):
+    """Choices for the facets of the user directory"""
+    CITY = "city", "City"
+    SCHOOL = "school", "School"
+    COMPANY = "company", "Company"
+
+
+class UserFacet(models.Model):
+    """This model stores the facet values of a user in the directory, i.e.
+    their city and the schools and companies they share publicly. It is
+    maintained by `account.facets.index_user_facets`.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="facets")
+    facet = models.CharField(choices=Facet.choices, max_length=16)
+    value = models.CharField(max_length=255)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["facet", "value", "user"], name="unique_user_facet"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} {self.facet}: {self.value}"
+
+
+class FacetCount(models.Model):
+    """This model stores the number of users having each facet value,
+    updated along with `UserFacet` rows. Values nobody has anymore keep a
+    zero count.
+    """
+    facet = models.CharField(choices=Facet.choices, max_length=16)
+    value = models.CharField(max_length=255)
+    label = models.CharField(max_length=255)
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["facet", "value"], name="unique_facet_count"),
+        ]
+        indexes = [models.Index(fields=["facet", "-count", "value"])]
+
+    def __str__(self):
+        return f"{self.facet}: {self.label} ({self.count})"
@@ -0,0 +1,64 @@
+"""Nearby users, looked up by the geohash cells of their addresses.
+
+The addresses store the cell of their city, see `UserAddress.geo_cell`.
+Candidates are read from the cell of the searched point and its
+neighbours, with cells at least as large as the radius, through range
+scans of the cell index. The database then computes their distances and
+drops the candidates outside of the radius.
+"""
+from functools import reduce
+from operator import or_
+
+from django.db.models import Q
+
+from core.geo import (
+    get_distance_expression, get_neighbour_cells, get_prefix_range,
+    get_search_precision,
+)
+
+from .models import GEO_CELL_PRECISION, UserAddress
+
+
+def get_cell_filter(latitude, longitude, radius):
+    """Get the filter of the addresses in the cells around a point that may
+    be within the radius.
+    """
+    precision = get_search_precision(latitude, radius, GEO_CELL_PRECISION)
+    if not precision:
+        return ~Q(geo_cell="")
+    conditions = []
+    for cell in sorted(get_neighbour_cells(latitude, longitude, precision)):
+        start, end = get_prefix_range(cell)
+        condition = Q(geo_cell__gte=start)
+        if end is not None:
+            condition &= Q(geo_cell__lt=end)
+        conditions.append(condition)
+    return reduce(or_, conditions)
+
+
+def find_nearby_addresses(viewer, latitude, longitude, radius, limit=10):
+    """Find the nearest addresses to a point visible to a viewer, other
+    than the viewer's own.
+
+    Args:
+        `viewer` (`User`): The user searching.
+        `latitude` (`float`): The latitude of the point.
+        `longitude` (`float`): The longitude of the point.
+        `radius` (`float`): The maximum distance in km.
+        `limit` (`int`): The maximum number of results.
+
+    Returns:
+        `list`: The `UserAddress` rows with their `user` and `city`, and
+        their `distance` in km, nearest first
+    """
+    distance = get_distance_expression(
+        "city__latitude", "city__longitude", latitude, longitude
+    )
+    queryset = UserAddress.objects.visible_to(viewer) \
+        .filter(get_cell_filter(latitude, longitude, radius), user__is_active=True) \
+        .exclude(user_id=viewer.id) \
+        .select_related("user", "city") \
+        .annotate(distance=distance) \
+        .filter(distance__lte=radius) \
+        .order_by("distance", "user_id")
+    return list(queryset[:limit])
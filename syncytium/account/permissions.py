@@ -1,6 +1,8 @@
 from rest_framework.exceptions import PermissionDenied
 from rest_framework.permissions import SAFE_METHODS, BasePermission
 
+from core.utils import get_user_id_for_request
+
 
 class IsCurrentUserPermission(BasePermission):
     """Permission class to check if the current user is the same as the user
@@ -8,8 +10,8 @@ class IsCurrentUserPermission(BasePermission):
     """
     def has_permission(self, request, view):
         username = view.kwargs.get("username")
-        current_user = request.user
-        is_current_user = current_user.username == username
+        user_id = get_user_id_for_request(request, username)
+        is_current_user = user_id is not None and user_id == request.user.id
         if is_current_user:
             return True
         raise PermissionDenied("You do not have permission to access this resource.")
@@ -0,0 +1,172 @@
+"""People search over an inverted index of names, schools and companies.
+
+Each user has a posting per normalized term of their names, username and
+public schools and companies, see `UserSearchPosting`. The postings of a
+user are recomputed in the background after the indexed fields change,
+and queries only read the postings of their terms.
+"""
+from functools import reduce
+from operator import add, or_
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import F, Max, Q
+
+from core.models import Privacy
+from core.utils import normalize_text
+
+from .models import UserEducation, UserSearchPosting, UserWorkExperience
+
+User = get_user_model()
+
+NAME_WEIGHT = 4
+USERNAME_WEIGHT = 3
+ORGANIZATION_WEIGHT = 2
+TERM_MAX_LENGTH = UserSearchPosting._meta.get_field("term").max_length
+QUERY_MAX_TERMS = 8
+
+# The fields the postings are computed from, by model
+SEARCH_FIELDS = {
+    User: {"username", "first_name", "last_name", "is_active"},
+    UserEducation: {"user", "school", "privacy"},
+    UserWorkExperience: {"user", "company", "privacy"},
+}
+
+
+def get_terms(text):
+    """Get the distinct normalized terms of a text, in order."""
+    terms = (term[:TERM_MAX_LENGTH] for term in normalize_text(text).split())
+    return list(dict.fromkeys(terms))
+
+
+def get_user_terms(user_ids):
+    """Get the weighted terms of users, from their names and username, and
+    the schools and companies they share publicly. Inactive users have no
+    terms.
+
+    Args:
+        `user_ids` (`list`): The IDs of the users.
+
+    Returns:
+        `dict`: The `{term: weight}` dictionary of each existing user ID,
+        keeping the highest weight of terms found in several fields.
+    """
+    users = User.objects.filter(id__in=user_ids, is_active=True) \
+        .values_list("id", "username", "first_name", "last_name")
+    terms = {}
+
+    def add_terms(user_id, text, weight):
+        user_terms = terms[user_id]
+        for term in get_terms(text):
+            user_terms[term] = max(user_terms.get(term, 0), weight)
+
+    for user_id, username, first_name, last_name in users:
+        terms[user_id] = {}
+        add_terms(user_id, f"{first_name} {last_name}", NAME_WEIGHT)
+        add_terms(user_id, username, USERNAME_WEIGHT)
+    for model, field in [(UserEducation, "school"), (UserWorkExperience, "company")]:
+        rows = model.objects \
+            .filter(user_id__in=terms, privacy=Privacy.PUBLIC) \
+            .values_list("user_id", field)
+        for user_id, text in rows:
+            add_terms(user_id, text, ORGANIZATION_WEIGHT)
+    return terms
+
+
+def index_user(user_id):
+    """Bring the postings of a user up to date, only writing the postings
+    that changed.
+
+    Returns:
+        `int`: The number of added, removed or reweighted postings
+    """
+    terms = get_user_terms([user_id]).get(user_id, {})
+    with transaction.atomic():
+        postings = dict(
+            UserSearchPosting.objects.select_for_update()
+            .filter(user_id=user_id).values_list("term", "weight")
+        )
+        stale = [term for term, weight in postings.items() if terms.get(term) != weight]
+        if stale:
+            UserSearchPosting.objects.filter(user_id=user_id, term__in=stale).delete()
+        UserSearchPosting.objects.bulk_create(
+            UserSearchPosting(term=term, user_id=user_id, weight=weight)
+            for term, weight in terms.items()
+            if postings.get(term) != weight
+        )
+    return len(stale) + sum(1 for term in terms if term not in postings)
+
+
+def index_users(user_ids):
+    """Replace the postings of users in one transaction, e.g. after rows
+    were written in bulk without signals.
+
+    Returns:
+        `int`: The number of written postings
+    """
+    terms = get_user_terms(user_ids)
+    with transaction.atomic():
+        UserSearchPosting.objects.filter(user_id__in=user_ids).delete()
+        postings = UserSearchPosting.objects.bulk_create(
+            UserSearchPosting(term=term, user_id=user_id, weight=weight)
+            for user_id, user_terms in terms.items()
+            for term, weight in user_terms.items()
+        )
+    return len(postings)
+
+
+def rebuild_index(chunk_size=1000):
+    """Recompute the postings of all users, a chunk of users per
+    transaction.
+
+    Yields:
+        `int`: The number of users indexed so far, after each chunk
+    """
+    indexed, last_id = 0, 0
+    while True:
+        user_ids = list(
+            User.objects.filter(id__gt=last_id).order_by("id")
+            .values_list("id", flat=True)[:chunk_size]
+        )
+        if not user_ids:
+            return
+        index_users(user_ids)
+        indexed += len(user_ids)
+        last_id = user_ids[-1]
+        yield indexed
+
+
+def search_users(query, limit=10):
+    """Find the users matching all the terms of a query, in one grouped
+    query over the postings of the terms.
+
+    Operations:
+    - The last term matches as a prefix, as it may still be typed.
+    - Users are ranked by the sum of the weights of their matched terms,
+    then by ID.
+
+    Args:
+        `query` (`str`): The searched text, normalized before matching.
+        `limit` (`int`): The maximum number of results.
+
+    Returns:
+        `list`: `(user_id, rank)` tuples
+    """
+    terms = get_terms(query)[:QUERY_MAX_TERMS]
+    if not terms:
+        return []
+    conditions = [Q(term=term) for term in terms[:-1]]
+    conditions.append(Q(term__startswith=terms[-1]))
+    weights = {
+        f"weight_{index}": Max("weight", filter=condition)
+        for index, condition in enumerate(conditions)
+    }
+    rows = UserSearchPosting.objects \
+        .filter(reduce(or_, conditions)) \
+        .values("user_id") \
+        .annotate(**weights) \
+        .filter(**{f"{name}__isnull": False for name in weights}) \
+        .annotate(rank=reduce(add, (F(name) for name in weights))) \
+        .order_by("-rank", "user_id") \
+        .values_list("user_id", "rank")[:limit]
+    return list(rows)
@@ -4,11 +4,15 @@ from django.contrib.auth.password_validation import (
 )
 from rest_framework import serializers
 
-from core.serializers import CitySerializer, CountrySerializer
-from core.utils import validate_country_and_city
+from core.models import Friendship
+from core.serializers import (
+    BulkCreateListSerializer, CitySerializer, CountrySerializer,
+)
+from core.utils import validate_country_and_city, validate_username
 
 from .models import (
-    UserAddress, UserEducation, UserProfile, UserWorkExperience
+    UserAddress, UserAvatar, UserBirthDate, UserEducation, UserLink, UserPhone,
+    UserProfile, UserWorkExperience,
 )
 
 User = get_user_model()
@@ -35,6 +39,9 @@ class UserSerializer(serializers.ModelSerializer):
             "full_name": {"read_only": True}
         }
 
+    def validate_username(self, username):
+        return validate_username(username)
+
     def validate_password(self, password):
         validate_password_django(password)
         return password
@@ -43,6 +50,30 @@ class UserSerializer(serializers.ModelSerializer):
         return f"{obj.first_name} {obj.last_name}".strip()
 
 
+class UserPublicSerializer(serializers.ModelSerializer):
+    """User serializer exposing only the public fields"""
+
+    full_name = serializers.SerializerMethodField()
+
+    class Meta:
+        model = User
+        fields = ["id", "first_name", "last_name", "full_name", "username"]
+
+    def get_full_name(self, obj):
+        return f"{obj.first_name} {obj.last_name}".strip()
+
+
+class FriendshipSerializer(serializers.ModelSerializer):
+    """Friendship serializer"""
+
+    from_user = serializers.SlugRelatedField(slug_field="username", read_only=True)
+    to_user = serializers.SlugRelatedField(slug_field="username", read_only=True)
+
+    class Meta:
+        model = Friendship
+        fields = ["id", "from_user", "to_user", "status", "created"]
+
+
 class ChangeEmailSerializer(serializers.ModelSerializer):
     """Change email serializer"""
 
@@ -106,6 +137,7 @@ class UserEducationSerializer(serializers.ModelSerializer):
             "start_date", "end_date", "description"
         ]
         extra_kwargs = {"user": {"read_only": True}}
+        list_serializer_class = BulkCreateListSerializer
 
 
 class UserWorkExperienceSerializer(serializers.ModelSerializer):
@@ -118,3 +150,61 @@ class UserWorkExperienceSerializer(serializers.ModelSerializer):
             "end_date", "description"
         ]
         extra_kwargs = {"user": {"read_only": True}}
+        list_serializer_class = BulkCreateListSerializer
+
+
+class UserBirthDateSerializer(serializers.ModelSerializer):
+    """User birth date serializer"""
+
+    class Meta:
+        model = UserBirthDate
+        fields = ["id", "user", "birth_date"]
+        extra_kwargs = {"user": {"read_only": True}}
+
+
+class UserAvatarSerializer(serializers.ModelSerializer):
+    """User avatar serializer"""
+
+    class Meta:
+        model = UserAvatar
+        fields = ["id", "user", "birth_date"]
+        extra_kwargs = {"user": {"read_only": True}}
+
+
+class UserLinkSerializer(serializers.ModelSerializer):
+    """User link serializer"""
+
+    class Meta:
+        model = UserLink
+        fields = ["id", "user", "link"]
+        extra_kwargs = {"user": {"read_only": True}}
+
+
+class UserPhoneSerializer(serializers.ModelSerializer):
+    """User phone serializer"""
+
+    class Meta:
+        model = UserPhone
+        fields = ["id", "user", "phone", "is_primary"]
+        extra_kwargs = {"user": {"read_only": True}}
+
+
+class UserFullProfileSerializer(UserPublicSerializer):
+    """Read-only serializer for the full profile of a user. Expects the
+    sections to be prefetched, already filtered for the viewer.
+    """
+
+    profile = UserProfileSerializer(read_only=True)
+    address = UserAddressSerializer(read_only=True)
+    birth_date = UserBirthDateSerializer(source="user_birth_date", read_only=True)
+    avatar = UserAvatarSerializer(source="user_avatar", read_only=True)
+    links = UserLinkSerializer(source="user_links", many=True, read_only=True)
+    phones = UserPhoneSerializer(source="user_phones", many=True, read_only=True)
+    educations = UserEducationSerializer(many=True, read_only=True)
+    work_experiences = UserWorkExperienceSerializer(many=True, read_only=True)
+
+    class Meta(UserPublicSerializer.Meta):
+        fields = UserPublicSerializer.Meta.fields + [
+            "profile", "address", "birth_date", "avatar", "links", "phones",
+            "educations", "work_experiences",
+        ]
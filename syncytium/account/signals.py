@@ -0,0 +1,86 @@
+from cities_light.models import City
+from django.contrib.auth import get_user_model
+from django.db.models.signals import (
+    m2m_changed, post_delete, post_save, pre_delete,
+)
+from django.dispatch import receiver
+
+from .cache import SECTIONS, invalidate_section
+from .facets import FACET_FIELDS, index_user_facets
+from .models import UserAddress, get_city_geo_cell
+from .search import SEARCH_FIELDS
+from .tasks import schedule_reindex
+
+User = get_user_model()
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def invalidate_cached_section(sender, instance, **kwargs):
+    """Invalidate the cached responses of the section of a saved or deleted
+    row.
+    """
+    if sender in SECTIONS:
+        invalidate_section(instance.user_id, sender)
+
+
+def invalidate_cached_custom_people(sender, instance, action, reverse, model, pk_set, **kwargs):
+    """Invalidate the cached responses of the sections whose custom people
+    changed, from either side of the relation.
+    """
+    if not reverse:
+        if action in ("post_add", "post_remove", "post_clear"):
+            invalidate_section(instance.user_id, type(instance))
+        return
+    # The instance is a user added to or removed from the custom people of
+    # the rows, which are only known before a clear
+    if action in ("post_add", "post_remove"):
+        rows = model.objects.filter(pk__in=pk_set)
+    elif action == "pre_clear":
+        rows = model.objects.filter(custom_people=instance)
+    else:
+        return
+    for owner_id in set(rows.values_list("user_id", flat=True)):
+        invalidate_section(owner_id, model)
+
+
+for section_model in SECTIONS:
+    if hasattr(section_model, "custom_people"):
+        m2m_changed.connect(
+            invalidate_cached_custom_people,
+            sender=section_model.custom_people.through,
+            dispatch_uid=f"invalidate_cached_custom_people_{section_model.__name__}",
+        )
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def reindex_user(sender, instance, signal, update_fields=None, **kwargs):
+    """Reindex the user of a saved or deleted row in the people search and
+    the directory facets. The indexes of deleted users are cleared before
+    they are deleted.
+    """
+    if sender not in SEARCH_FIELDS and sender not in FACET_FIELDS:
+        return
+    if sender is User and signal is post_delete:
+        return
+    user_id = instance.id if sender is User else instance.user_id
+    schedule_reindex(sender, user_id, update_fields)
+
+
+@receiver(pre_delete, sender=User)
+def clear_user_facets(sender, instance, **kwargs):
+    """Remove a deleted user from the facet counts, their `UserFacet` rows
+    being deleted along with them.
+    """
+    index_user_facets(instance.id, facets={})
+
+
+@receiver(post_save, sender=City)
+def update_address_geo_cells(sender, instance, **kwargs):
+    """Move the addresses in a city to the cell of its new coordinates,
+    e.g. while `cities_light` data is reimported.
+    """
+    geo_cell = get_city_geo_cell(instance)
+    UserAddress.objects.filter(city=instance).exclude(geo_cell=geo_cell) \
+        .update(geo_cell=geo_cell)
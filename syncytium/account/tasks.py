@@ -1,8 +1,15 @@
+from functools import partial
+
 from celery import shared_task
-from core.utils import send_email
+from core.models import Friendship, UserConnection
+from core.utils import clear_expired_tokens, send_email
 from decouple import config
 from django.contrib.auth import get_user_model
+from django.db import IntegrityError, transaction
 
+from .facets import FACET_FIELDS, index_user_facets
+from .models import UserEmailStatus
+from .search import SEARCH_FIELDS, index_user
 from .utils import generate_email_verification_token
 
 User = get_user_model()
@@ -11,20 +18,24 @@ FRONTEND_APP_URL = config("FRONTEND_APP_URL", "http://localhost:3000")
 BACKEND_APP_URL = config("BACKEND_APP_URL", "http://localhost:8000")
 
 
+def get_registration_email(user):
+    """Get the `(subject, message, recipient_list)` of the registration email"""
+    subject = "Welcome to Synco"
+    message = (
+        f"Hi {user.first_name}, welcome to Synco! We are glad to have "
+        f"you joined. Visit our app here: {FRONTEND_APP_URL}"
+    )
+    return subject, message, [user.email]
+
+
 @shared_task
 def send_registration_email(user_id):
     user = User.objects.filter(id=user_id).first()
     if not user:
         print("Registration email not sent. User not found.")
         return
-    subject = "Welcome to Synco"
-    message = (
-        f"Hi {user.first_name}, welcome to Synco! We are glad to have "
-        f"you joined. Visit our app here: {FRONTEND_APP_URL}"
-    )
-    recipient_list = [user.email]
-    send_email(subject, message, recipient_list)
-    print(f"Registration email sent to {user.email}")
+    send_email(*get_registration_email(user))
+    print(f"Registration email queued for {user.email}")
 
 
 @shared_task
@@ -48,4 +59,60 @@ def send_email_verification_link_email(user_id, is_new=False):
         )
     recipient_list = [user.email]
     send_email(subject, message, recipient_list)
-    print(f"Email verification link email sent to {user.email}")
+    print(f"Email verification link email queued for {user.email}")
+
+
+@shared_task(autoretry_for=(IntegrityError,), retry_backoff=True, max_retries=5)
+def add_friend_connection(user_id, friend_id):
+    """Add an accepted friendship to the `UserConnection` graph. Skipped
+    if the friendship was removed before the task ran.
+    """
+    if not Friendship.objects.are_friends(user_id, friend_id):
+        return
+    UserConnection.objects.link(user_id, friend_id)
+
+
+@shared_task(autoretry_for=(IntegrityError,), retry_backoff=True, max_retries=5)
+def remove_friend_connection(user_id, friend_id):
+    """Remove a friendship from the `UserConnection` graph. Skipped if
+    the users became friends again before the task ran.
+    """
+    if Friendship.objects.are_friends(user_id, friend_id):
+        return
+    UserConnection.objects.unlink(user_id, friend_id)
+
+
+@shared_task
+def clear_expired_email_tokens(batch_size=None):
+    cleared = clear_expired_tokens(UserEmailStatus, batch_size)
+    print(f"Cleared {cleared} expired email verification tokens")
+
+
+@shared_task(autoretry_for=(IntegrityError,), retry_backoff=True, max_retries=5)
+def reindex_user_search(user_id):
+    """Bring the people search postings of a user up to date."""
+    return index_user(user_id)
+
+
+@shared_task(autoretry_for=(IntegrityError,), retry_backoff=True, max_retries=5)
+def reindex_user_facets(user_id):
+    """Bring the directory facet values and counts of a user up to date."""
+    return index_user_facets(user_id)
+
+
+def schedule_reindex(model, user_id, fields=None):
+    """Reindex a user in the background once the current transaction is
+    committed, so the tasks read the new rows. Only the people search and
+    directory facets computed from the written fields are reindexed.
+
+    Args:
+        `model` (`Model`): The model of the written rows.
+        `user_id` (`int`): The user the rows belong to.
+        `fields` (`iterable`): The written fields, all of them by default.
+    """
+    for indexed_fields, task in [
+        (SEARCH_FIELDS, reindex_user_search),
+        (FACET_FIELDS, reindex_user_facets),
+    ]:
+        if model in indexed_fields and (fields is None or indexed_fields[model] & set(fields)):
+            transaction.on_commit(partial(task.delay, user_id))
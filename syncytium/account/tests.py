@@ -1,3 +1,1230 @@
-from django.test import TestCase
+import json
+import tempfile
+from datetime import date, timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest.mock import patch
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from cities_light.models import City, Country
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from authentication.utils import generate_tokens_for_user
+from core.models import (
+    Friendship, FriendshipStatus, OutboxEmail, Privacy, UserConnection,
+)
+from core.testing import (
+    DATABASE_CACHES, QueryBudgetTestMixin, eager_tasks, get_process_caches,
+)
+from core.utils import RESERVED_USERNAMES, clear_expired_tokens, username_cache
+
+from . import urls
+from .cache import get_metrics, reset_metrics
+from .export import export_users
+from .management.commands.import_users import Command as ImportUsersCommand
+from .models import (
+    Facet, FacetCount, UserAddress, UserBirthDate, UserEducation,
+    UserEmailStatus, UserLink, UserPhone, UserProfile, UserSearchPosting,
+    UserWorkExperience, get_city_geo_cell,
+)
+from .search import index_user
+from .utils import generate_email_verification_token
+
+User = get_user_model()
+
+
+class VisibleToTestCase(TestCase):
+    """Tests for `PrivatizedQuerySet.visible_to`"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create(username="owner", email="owner@example.com")
+        cls.friend = User.objects.create(username="friend", email="friend@example.com")
+        cls.stranger = User.objects.create(
+            username="stranger", email="stranger@example.com"
+        )
+        cls.friend_of_friend = User.objects.create(
+            username="fof", email="fof@example.com"
+        )
+        UserConnection.objects.link(cls.owner.id, cls.friend.id)
+        UserConnection.objects.link(cls.friend.id, cls.friend_of_friend.id)
+        for privacy in Privacy.values:
+            UserEducation.objects.create(
+                user=cls.owner,
+                school=privacy,
+                degree="BSc",
+                field_of_study="CS",
+                start_date=date(2020, 1, 1),
+                privacy=privacy,
+            )
+        custom = UserEducation.objects.get(school=Privacy.CUSTOM)
+        custom.custom_people.add(cls.friend)
+
+    def get_visible_schools(self, viewer):
+        queryset = UserEducation.objects.visible_to(viewer)
+        return set(queryset.values_list("school", flat=True))
+
+    def test_anonymous_sees_public_only(self):
+        self.assertEqual(self.get_visible_schools(AnonymousUser()), {Privacy.PUBLIC})
+
+    def test_owner_sees_everything(self):
+        self.assertEqual(self.get_visible_schools(self.owner), set(Privacy.values))
+
+    def test_friends_see_friend_rows(self):
+        self.assertEqual(
+            self.get_visible_schools(self.friend),
+            {
+                Privacy.PUBLIC, Privacy.FRIENDS_OF_FRIENDS, Privacy.FRIENDS,
+                Privacy.CUSTOM,
+            },
+        )
+        self.assertEqual(
+            self.get_visible_schools(self.friend_of_friend),
+            {Privacy.PUBLIC, Privacy.FRIENDS_OF_FRIENDS},
+        )
+
+    def test_custom_people_see_custom_rows(self):
+        custom = UserEducation.objects.get(school=Privacy.CUSTOM)
+        custom.custom_people.set([self.stranger])
+        self.assertEqual(
+            self.get_visible_schools(self.stranger), {Privacy.PUBLIC, Privacy.CUSTOM}
+        )
+        self.assertNotIn(Privacy.CUSTOM, self.get_visible_schools(self.friend))
+
+    def test_single_query(self):
+        with self.assertNumQueries(1):
+            self.get_visible_schools(self.friend)
+
+
+class FriendshipAPITestCase(TestCase):
+    """Tests for the friend request, friendship and friend list endpoints"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.ali = User.objects.create(username="ali", email="ali@example.com")
+        cls.bilal = User.objects.create(username="bilal", email="bilal@example.com")
+
+    def request(self, method, name, user, username):
+        access_token, _ = generate_tokens_for_user(user)
+        with eager_tasks(), self.captureOnCommitCallbacks(execute=True):
+            return getattr(self.client, method)(
+                reverse(f"account:{name}", args=[username]),
+                HTTP_AUTHORIZATION=f"Bearer {access_token}",
+            )
+
+    def test_sends_and_accepts_requests(self):
+        response = self.request("post", "user_friendship", self.ali, "bilal")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            (response.data["from_user"], response.data["status"]),
+            ("ali", FriendshipStatus.PENDING),
+        )
+        # One row per pair, whoever sends the request
+        for user, username in [(self.ali, "bilal"), (self.bilal, "ali")]:
+            response = self.request("post", "user_friendship", user, username)
+            self.assertEqual(response.status_code, 400)
+        self.assertEqual(Friendship.objects.count(), 1)
+
+        response = self.request("get", "user_friend_requests", self.bilal, "bilal")
+        self.assertEqual([row["from_user"] for row in response.data["results"]], ["ali"])
+        self.assertEqual(
+            self.request("get", "user_friend_requests", self.ali, "bilal").status_code, 403
+        )
+        self.assertEqual(
+            self.request("post", "user_friendship_accept", self.ali, "bilal").status_code,
+            404,
+        )
+
+        response = self.request("post", "user_friendship_accept", self.bilal, "ali")
+        self.assertEqual(response.data["status"], FriendshipStatus.ACCEPTED)
+        response = self.request("get", "user_friends", self.ali, "ali")
+        self.assertEqual([user["username"] for user in response.data["results"]], ["bilal"])
+        self.assertEqual(
+            UserConnection.objects.get_tier(self.ali, self.bilal.id), Privacy.FRIENDS
+        )
+
+    def test_rejects_reversed_duplicates(self):
+        Friendship.objects.create(from_user=self.bilal, to_user=self.ali)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Friendship.objects.create(from_user=self.ali, to_user=self.bilal)
+        self.assertEqual(
+            self.request("post", "user_friendship", self.ali, "bilal").status_code, 400
+        )
+        self.assertEqual(
+            self.request("post", "user_friendship", self.ali, "ali").status_code, 400
+        )
+        self.assertEqual(
+            self.request("post", "user_friendship", self.ali, "nobody").status_code, 404
+        )
+
+    def test_unfriends(self):
+        self.request("post", "user_friendship", self.ali, "bilal")
+        self.request("post", "user_friendship_accept", self.bilal, "ali")
+        self.assertEqual(
+            self.request("get", "user_friendship", self.bilal, "ali").data["status"],
+            FriendshipStatus.ACCEPTED,
+        )
+        response = self.request("delete", "user_friendship", self.bilal, "ali")
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(Friendship.objects.exists())
+        self.assertEqual(self.request("get", "user_friends", self.ali, "ali").data["results"], [])
+        self.assertEqual(
+            UserConnection.objects.get_tier(self.ali, self.bilal.id), Privacy.PUBLIC
+        )
+        self.assertEqual(
+            self.request("delete", "user_friendship", self.bilal, "ali").status_code, 404
+        )
+
+
+class UserFullProfileAPIViewTestCase(QueryBudgetTestMixin, TestCase):
+    """Tests for `UserFullProfileAPIView`"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username="owner", email="owner@example.com")
+        country = Country.objects.create(name="Pakistan", code2="PK", code3="PAK")
+        city = City.objects.create(name="Lahore", country=country)
+        UserProfile.objects.create(user=cls.user, bio="Hello")
+        UserAddress.objects.create(user=cls.user, country=country, city=city)
+        UserBirthDate.objects.create(user=cls.user, birth_date=date(1990, 1, 1))
+        UserLink.objects.create(user=cls.user, link="https://example.com")
+        UserPhone.objects.create(user=cls.user, phone="123", is_primary=True)
+        cls.url = reverse("account:user_full_profile", args=[cls.user.username])
+
+    def setUp(self):
+        username_cache.clear()
+        cache.clear()
+
+    def add_rows(self, count):
+        for index in range(count):
+            UserEducation.objects.create(
+                user=self.user,
+                school=f"School {index}",
+                degree="BSc",
+                field_of_study="CS",
+                start_date=date(2010 + index, 1, 1),
+            )
+            UserWorkExperience.objects.create(
+                user=self.user,
+                company=f"Company {index}",
+                position="Engineer",
+                start_date=date(2015 + index, 1, 1),
+            )
+
+    def test_returns_every_section(self):
+        self.add_rows(1)
+        data = self.client.get(self.url).json()
+        self.assertEqual(data["username"], "owner")
+        self.assertEqual(data["profile"]["bio"], "Hello")
+        self.assertEqual(data["address"]["city"]["name"], "Lahore")
+        self.assertEqual(data["birth_date"]["birth_date"], "1990-01-01")
+        self.assertIsNone(data["avatar"])
+        self.assertEqual(len(data["links"]), 1)
+        self.assertEqual(len(data["phones"]), 1)
+        self.assertEqual(len(data["educations"]), 1)
+        self.assertEqual(len(data["work_experiences"]), 1)
+
+    def test_hides_sections_from_other_viewers(self):
+        UserBirthDate.objects.filter(user=self.user).update(privacy=Privacy.PRIVATE)
+        data = self.client.get(self.url).json()
+        self.assertIsNone(data["birth_date"])
+
+    def test_query_count_is_constant(self):
+        # Resolve the username once, later requests reuse the cached ID
+        self.client.get(self.url)
+        for count in [1, 10]:
+            self.add_rows(count)
+            with self.assertNumQueries(8):
+                response = self.client.get(self.url)
+            self.assertEqual(response.status_code, 200)
+
+    def test_unknown_user(self):
+        url = reverse("account:user_full_profile", args=["nobody"])
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+
+class UserCreateAPIViewTestCase(QueryBudgetTestMixin, TestCase):
+    """Tests for `UserCreateAPIView`"""
+
+    def test_queues_emails_in_outbox(self):
+        response = self.client.post(
+            reverse("account:register_user"),
+            {
+                "first_name": "Sara",
+                "last_name": "Khan",
+                "username": "sara",
+                "email": "sara@example.com",
+                "password": "s3cure-Passw0rd",
+            },
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            OutboxEmail.objects.filter(recipients=["sara@example.com"]).count(), 2
+        )
+
+    def test_rejects_reserved_usernames(self):
+        response = self.client.post(
+            reverse("account:register_user"),
+            {
+                "first_name": "Sara",
+                "last_name": "Khan",
+                "username": "Nearby",
+                "email": "sara@example.com",
+                "password": "s3cure-Passw0rd",
+            },
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("username", response.json())
+
+    def test_fixed_routes_are_reserved(self):
+        segments = set()
+        for pattern in urls.urlpatterns:
+            segment = str(pattern.pattern).split("/")[0]
+            if not segment.startswith("(?P<username>"):
+                segments.add(segment)
+        self.assertEqual(segments, RESERVED_USERNAMES)
+
+
+class VerifyEmailTestCase(TestCase):
+    """Tests for `verify_email` and the hashed verification tokens"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username="sara", email="sara@example.com")
+
+    def verify(self, token):
+        response = self.client.get(reverse("account:verify_email", args=[token]))
+        return response.context["detail"]
+
+    def test_verifies_once(self):
+        token = generate_email_verification_token(self.user.id)
+        email_status = UserEmailStatus.objects.get(user=self.user)
+        self.assertNotEqual(email_status.verification_token_hash, token)
+        self.assertEqual(self.verify(token), "Email verified successfully.")
+        self.assertEqual(self.verify(token), "Email is already verified.")
+        self.assertEqual(self.verify("0" * 32), "Invalid link")
+
+    def test_new_token_replaces_previous(self):
+        old_token = generate_email_verification_token(self.user.id)
+        token = generate_email_verification_token(self.user.id)
+        self.assertEqual(self.verify(old_token), "Invalid link")
+        self.assertEqual(self.verify(token), "Email verified successfully.")
+
+    def test_expired_tokens(self):
+        token = generate_email_verification_token(self.user.id)
+        UserEmailStatus.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(self.verify(token), "Link expired. Please generate a new link.")
+        self.assertEqual(clear_expired_tokens(UserEmailStatus), 1)
+        self.assertEqual(self.verify(token), "Invalid link")
+
+    def test_clears_in_batches(self):
+        expired = timezone.now() - timedelta(seconds=1)
+        for index in range(5):
+            user = User.objects.create(username=f"user{index}", email=f"user{index}@example.com")
+            generate_email_verification_token(user.id)
+        generate_email_verification_token(self.user.id)
+        UserEmailStatus.objects.exclude(user=self.user).update(expires_at=expired)
+        with self.assertNumQueries(6):
+            self.assertEqual(clear_expired_tokens(UserEmailStatus, batch_size=2), 5)
+        self.assertEqual(
+            UserEmailStatus.objects.filter(verification_token_hash__isnull=False).count(), 1
+        )
+
+
+class ImportUsersTestCase(TestCase):
+    """Tests for the `import_users` command"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.country = Country.objects.create(name="Pakistan", code2="PK", code3="PAK")
+        cls.city = City.objects.create(name="Lahore", country=cls.country)
+        User.objects.create(username="taken", email="taken@example.com")
+
+    def import_users(self, content, suffix, **options):
+        with tempfile.NamedTemporaryFile("w", suffix=suffix) as file:
+            file.write(content)
+            file.flush()
+            out = StringIO()
+            call_command("import_users", file.name, stdout=out, **options)
+        return out.getvalue()
+
+    def test_imports_jsonl_with_related_rows(self):
+        rows = [
+            {
+                "username": "sara", "email": "sara@example.com", "first_name": "Sara",
+                "password": "s3cure-Passw0rd", "bio": "Hello", "country": "PK",
+                "city": "Lahore",
+                "educations": [{
+                    "school": "LUMS", "degree": "BSc", "field_of_study": "CS",
+                    "start_date": "2015-09-01", "privacy": Privacy.FRIENDS,
+                }],
+                "work_experiences": [{
+                    "company": "Acme", "position": "Engineer", "start_date": "2019-07-01",
+                }],
+            },
+            {"username": "taken", "email": "other@example.com"},
+            {"username": "bad", "email": "bad@example.com", "country": "XX"},
+            {"username": "bilal", "email": "bilal@example.com", "first_name": "Bilal"},
+        ]
+        content = "\n".join(json.dumps(row) for row in rows)
+        out = self.import_users(content, ".jsonl", workers=0, chunk_size=2)
+        self.assertIn("4 rows: 2 created, 1 skipped, 1 invalid", out)
+        user = User.objects.get(username="sara")
+        self.assertTrue(user.check_password("s3cure-Passw0rd"))
+        self.assertFalse(User.objects.get(username="bilal").has_usable_password())
+        self.assertEqual(user.profile.bio, "Hello")
+        self.assertEqual(user.address.city, self.city)
+        self.assertEqual(user.educations.get().privacy, Privacy.FRIENDS)
+        self.assertEqual(user.work_experiences.get().company, "Acme")
+        self.assertFalse(user.email_status.is_verified)
+        self.assertEqual(
+            OutboxEmail.objects.filter(subject="Welcome to Synco").count(), 2
+        )
+
+    def test_imports_csv_in_process_pool(self):
+        content = (
+            "username,email,first_name,last_name,password\n"
+            "ali,ali@example.com,Ali,Khan,s3cure-Passw0rd\n"
+            "ali,ali2@example.com,Ali,Raza,s3cure-Passw0rd\n"
+            "zara,zara@example.com,Zara,Ali,0ther-Passw0rd\n"
+        )
+        self.import_users(content, ".csv", workers=2, verified=True, no_email=True)
+        self.assertEqual(User.objects.get(username="ali").last_name, "Khan")
+        self.assertTrue(User.objects.get(username="zara").check_password("0ther-Passw0rd"))
+        self.assertTrue(UserEmailStatus.objects.get(user__username="zara").is_verified)
+        self.assertFalse(OutboxEmail.objects.exists())
+
+    def test_validates_like_user_model(self):
+        rows = [
+            {"username": "bad name!", "email": "bad1@example.com"},
+            {"username": "a" * 151, "email": "bad2@example.com"},
+            {"username": "bad3", "email": "not-an-email"},
+            {"username": "bad4", "email": "bad4@example.com", "first_name": "a" * 151},
+            {"username": "search", "email": "bad5@example.com"},
+            {"username": "sara", "email": "sara@EXAMPLE.com"},
+        ]
+        content = "\n".join(json.dumps(row) for row in rows)
+        out = self.import_users(content, ".jsonl", workers=0, no_email=True)
+        self.assertIn("6 rows: 1 created, 0 skipped, 5 invalid", out)
+        self.assertEqual(User.objects.get(username="sara").email, "sara@example.com")
+
+    def test_retries_concurrent_sign_ups(self):
+        write_rows = ImportUsersCommand.write_rows
+        attempts = []
+
+        def write_rows_racing(command, rows, passwords):
+            attempts.append(rows)
+            if len(attempts) > 1:
+                return write_rows(command, rows, passwords)
+            # The taken usernames and emails are read before "taken" signs up
+            with patch.object(User.objects, "filter", return_value=User.objects.none()):
+                return write_rows(command, rows, passwords)
+
+        content = (
+            '{"username": "taken", "email": "new@example.com"}\n'
+            '{"username": "sara", "email": "sara@example.com"}\n'
+        )
+        with patch.object(ImportUsersCommand, "write_rows", write_rows_racing):
+            out = self.import_users(content, ".jsonl", workers=0, no_email=True)
+        self.assertEqual(len(attempts), 2)
+        self.assertIn("2 rows: 1 created, 1 skipped, 0 invalid", out)
+        self.assertTrue(User.objects.filter(username="sara").exists())
+
+
+class GeneratePopulationTestCase(TestCase):
+    """Tests for the `generate_population` command"""
+
+    @classmethod
+    def setUpTestData(cls):
+        country = Country.objects.create(name="Pakistan", code2="PK", code3="PAK")
+        City.objects.create(name="Lahore", country=country, population=13_000_000)
+        City.objects.create(name="Multan", country=country, population=2_000_000)
+
+    def generate_population(self, users, **options):
+        call_command(
+            "generate_population", users, workers=0, stdout=StringIO(),
+            stderr=StringIO(), **options
+        )
+
+    def get_population(self):
+        """Get the generated rows by username, without their IDs."""
+        educations = UserEducation.objects.order_by("user__username", "id")
+        return {
+            "users": list(User.objects.order_by("username").values_list(
+                "username", "first_name", "last_name"
+            )),
+            "addresses": list(UserAddress.objects.order_by("user__username").values_list(
+                "user__username", "city__name", "privacy"
+            )),
+            "educations": [
+                (
+                    education.user.username, education.school, education.start_date,
+                    education.privacy,
+                    sorted(user.username for user in education.custom_people.all()),
+                )
+                for education in educations.select_related("user")
+                .prefetch_related("custom_people")
+            ],
+            "phones": list(UserPhone.objects.order_by("user__username", "id").values_list(
+                "user__username", "phone", "is_primary"
+            )),
+        }
+
+    def test_generates_related_rows(self):
+        self.generate_population(40, chunk_size=15)
+        self.assertEqual(User.objects.filter(username__startswith="pop").count(), 40)
+        self.assertEqual(UserProfile.objects.count(), 40)
+        self.assertEqual(UserAddress.objects.filter(city__isnull=False).count(), 40)
+        self.assertTrue(UserEducation.objects.exists())
+        self.assertTrue(UserWorkExperience.objects.exists())
+        self.assertTrue(UserLink.objects.exists())
+        self.assertFalse(
+            User.objects.filter(user_phones__is_primary=True)
+            .annotate(primaries=Count("user_phones")).filter(primaries__gt=1).exists()
+        )
+        self.assertTrue(User.objects.get(username="pop0").check_password(
+            "Population-Passw0rd"
+        ))
+
+        custom = UserEducation.objects.filter(privacy=Privacy.CUSTOM) \
+            .prefetch_related("custom_people")
+        self.assertTrue(custom.exists())
+        for education in custom:
+            self.assertNotIn(education.user, education.custom_people.all())
+
+        # The users are indexed as if rebuilt
+        counts = set(FacetCount.objects.filter(count__gt=0).values_list("facet", "value", "count"))
+        postings = set(UserSearchPosting.objects.values_list("term", "user_id", "weight"))
+        self.assertTrue(counts)
+        call_command("rebuild_user_facets", stdout=StringIO())
+        call_command("rebuild_search_index", stdout=StringIO())
+        self.assertEqual(
+            set(FacetCount.objects.filter(count__gt=0).values_list("facet", "value", "count")),
+            counts,
+        )
+        self.assertEqual(
+            set(UserSearchPosting.objects.values_list("term", "user_id", "weight")), postings
+        )
+
+    def test_same_seed_generates_same_population(self):
+        self.generate_population(30, seed=7, chunk_size=10)
+        population = self.get_population()
+        User.objects.all().delete()
+        self.generate_population(30, seed=7, chunk_size=10)
+        self.assertEqual(self.get_population(), population)
+
+        self.generate_population(10, seed=8, offset=30, chunk_size=10)
+        self.assertEqual(User.objects.count(), 40)
+        with self.assertRaises(CommandError):
+            self.generate_population(10, seed=8, offset=30)
+
+
+class ExportUsersTestCase(QueryBudgetTestMixin, TestCase):
+    """Tests for the account data export"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = []
+        for index in range(5):
+            user = User.objects.create(
+                username=f"user{index}", email=f"user{index}@example.com"
+            )
+            UserProfile.objects.create(user=user, bio=f"Bio {index}")
+            UserLink.objects.create(user=user, link="https://example.com")
+            UserPhone.objects.create(user=user, phone="123", privacy=Privacy.PRIVATE)
+            cls.users.append(user)
+        cls.staff = User.objects.create(
+            username="staff", email="staff@example.com", is_staff=True
+        )
+
+    def get_lines(self, response):
+        content = b"".join(response.streaming_content).decode()
+        return [json.loads(line) for line in content.splitlines()]
+
+    def authorize(self, user):
+        access_token, _ = generate_tokens_for_user(user)
+        return {"HTTP_AUTHORIZATION": f"Bearer {access_token}"}
+
+    def test_exports_own_data(self):
+        user = self.users[0]
+        url = reverse("account:user_export", args=[user.username])
+        response = self.client.get(url, **self.authorize(user))
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        [data] = self.get_lines(response)
+        self.assertEqual(data["user"]["username"], "user0")
+        self.assertNotIn("password", data["user"])
+        self.assertEqual(data["profile"]["bio"], "Bio 0")
+        self.assertEqual(data["phones"][0]["privacy"], Privacy.PRIVATE)
+        self.assertIsNone(data["address"])
+        self.assertEqual(data["educations"], [])
+        response = self.client.get(url, **self.authorize(self.users[1]))
+        self.assertEqual(response.status_code, 403)
+
+    def test_bulk_export_queries_per_chunk(self):
+        url = reverse("account:export_users")
+        self.assertEqual(self.client.get(url, **self.authorize(self.users[0])).status_code, 403)
+        response = self.client.get(url, **self.authorize(self.staff))
+        self.assertEqual(len(self.get_lines(response)), 6)
+        # One query for the users, then one per section for each chunk
+        with self.assertNumQueries(1 + 2 * 7):
+            lines = list(export_users(User.objects.all(), chunk_size=3))
+        self.assertEqual(len(lines), 6)
+
+    def test_bulk_export_checks_stored_staff_status(self):
+        url = reverse("account:export_users")
+        headers = self.authorize(self.staff)
+        User.objects.filter(id=self.staff.id).update(is_staff=False)
+        self.assertEqual(self.client.get(url, **headers).status_code, 403)
+
+    def test_command(self):
+        out = StringIO()
+        call_command("export_users", "user1", "user2", stdout=out, stderr=StringIO())
+        lines = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual([data["user"]["username"] for data in lines], ["user1", "user2"])
+
+
+class ChangeTrackingTestCase(QueryBudgetTestMixin, TestCase):
+    """Tests for the writes skipped by `ChangeTrackingModel`"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username="sara", email="sara@example.com")
+        cls.friend = User.objects.create(username="ali", email="ali@example.com")
+        UserProfile.objects.create(user=cls.user, bio="Hello")
+        cls.education = UserEducation.objects.create(
+            user=cls.user, school="LUMS", degree="BSc", field_of_study="CS",
+            start_date=date(2015, 9, 1), privacy=Privacy.CUSTOM,
+        )
+        cls.education.custom_people.add(cls.friend)
+
+    def setUp(self):
+        cache.clear()
+
+    def get_writes(self, func):
+        with CaptureQueriesContext(connection) as context:
+            func()
+        return [
+            query["sql"] for query in context.captured_queries
+            if query["sql"].startswith(("INSERT", "UPDATE", "DELETE"))
+        ]
+
+    def test_noop_patch_writes_nothing(self):
+        access_token, _ = generate_tokens_for_user(self.user)
+        url = reverse("account:user_profile", args=["sara"])
+        writes = self.get_writes(lambda: self.client.patch(
+            url, {"bio": "Hello"}, content_type="application/json",
+            HTTP_AUTHORIZATION=f"Bearer {access_token}",
+        ))
+        self.assertEqual(writes, [])
+
+    def test_updates_changed_columns_only(self):
+        education = UserEducation.objects.get()
+        education.school = "FAST"
+        [update] = self.get_writes(education.save)
+        self.assertIn('"school"', update)
+        self.assertIn('"modified"', update)
+        self.assertNotIn('"degree"', update)
+        self.assertEqual(self.get_writes(education.save), [])
+
+    def test_custom_people_cleared_when_leaving_custom(self):
+        education = UserEducation.objects.get()
+        education.description = "Computer Science"
+        self.get_writes(education.save)
+        self.assertEqual(education.custom_people.count(), 1)
+        education.privacy = Privacy.FRIENDS
+        self.assertTrue(any(
+            write.startswith("DELETE") for write in self.get_writes(education.save)
+        ))
+        self.assertEqual(education.custom_people.count(), 0)
+        education.description = ""
+        writes = self.get_writes(education.save)
+        self.assertFalse(any(write.startswith("DELETE") for write in writes))
+
+
+class BulkEducationTestCase(QueryBudgetTestMixin, TestCase):
+    """Tests for the bulk actions of `UserEducationViewSet`"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username="sara", email="sara@example.com")
+        cls.other = User.objects.create(username="ali", email="ali@example.com")
+        cls.url = reverse("account:user_education_bulk", args=["sara"])
+
+    def setUp(self):
+        access_token, _ = generate_tokens_for_user(self.user)
+        self.headers = {"HTTP_AUTHORIZATION": f"Bearer {access_token}"}
+
+    def request(self, method, data):
+        return getattr(self.client, method)(
+            self.url, data, content_type="application/json", **self.headers
+        )
+
+    def get_items(self, count):
+        return [
+            {
+                "school": f"School {index}", "degree": "BSc",
+                "field_of_study": "CS", "start_date": f"{2000 + index}-09-01",
+            }
+            for index in range(count)
+        ]
+
+    def test_fixed_query_count(self):
+        self.request("post", self.get_items(1))
+        for count in [1, 10]:
+            with self.assertNumQueries(3):
+                response = self.request("post", self.get_items(count))
+            self.assertEqual(response.status_code, 201)
+            ids = [item["id"] for item in response.json()]
+            with self.assertNumQueries(4):
+                response = self.request(
+                    "patch", [{"id": id, "degree": "MSc"} for id in ids]
+                )
+            self.assertEqual(response.status_code, 200)
+            with self.assertNumQueries(6):
+                response = self.request("delete", ids)
+            self.assertEqual(response.json()[0], {"id": ids[0], "deleted": True})
+
+    def test_rejects_batch_with_invalid_item(self):
+        items = self.get_items(2)
+        del items[1]["school"]
+        response = self.request("post", items)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()[0], {})
+        self.assertIn("school", response.json()[1])
+        self.assertFalse(UserEducation.objects.exists())
+
+    def test_update_reports_unknown_rows(self):
+        education = UserEducation.objects.create(
+            user=self.user, school="LUMS", degree="BSc", field_of_study="CS",
+            start_date=date(2015, 9, 1),
+        )
+        foreign = UserEducation.objects.create(
+            user=self.other, school="LUMS", degree="BSc", field_of_study="CS",
+            start_date=date(2015, 9, 1),
+        )
+        response = self.request(
+            "patch", [{"id": education.id, "degree": "MSc"}, {"id": foreign.id}]
+        )
+        self.assertEqual(response.json(), [{}, {"id": ["Not found."]}])
+        education.refresh_from_db()
+        self.assertEqual(education.degree, "BSc")
+        response = self.request("delete", [education.id, foreign.id])
+        self.assertEqual(
+            response.json(),
+            [{"id": education.id, "deleted": True}, {"id": foreign.id, "deleted": False}],
+        )
+        self.assertTrue(UserEducation.objects.filter(id=foreign.id).exists())
+
+    def test_only_owner_can_write(self):
+        access_token, _ = generate_tokens_for_user(self.other)
+        response = self.client.post(
+            self.url, self.get_items(1), content_type="application/json",
+            HTTP_AUTHORIZATION=f"Bearer {access_token}",
+        )
+        self.assertEqual(response.status_code, 403)
+
+
+class UserAddressAPIViewTestCase(QueryBudgetTestMixin, TestCase):
+    """Tests for `UserAddressAPIView`"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username="sara", email="sara@example.com")
+        country = Country.objects.create(name="Pakistan", code2="PK", code3="PAK")
+        city = City.objects.create(name="Lahore", country=country)
+        UserAddress.objects.create(user=cls.user, country=country, city=city)
+        cls.url = reverse("account:user_address", args=["sara"])
+
+    def setUp(self):
+        cache.clear()
+
+    def test_loads_city_and_country_with_address(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.json()["city"]["name"], "Lahore")
+        self.assertEqual(response.json()["country"]["name"], "Pakistan")
+        # Resolving the username, then the address with its city and country
+        self.assertLessEqual(response.query_stats.count, 2)
+
+
+class AsyncReadViewsTestCase(QueryBudgetTestMixin, TestCase):
+    """Tests for the async read views served to ASGI requests"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create(username="sara", email="sara@example.com")
+        cls.viewer = User.objects.create(username="ali", email="ali@example.com")
+        country = Country.objects.create(name="Pakistan", code2="PK", code3="PAK")
+        city = City.objects.create(name="Lahore", country=country)
+        UserProfile.objects.create(user=cls.owner, bio="Hello")
+        UserAddress.objects.create(user=cls.owner, country=country, city=city)
+        for year in range(2010, 2014):
+            UserEducation.objects.create(
+                user=cls.owner, school=f"School {year}", degree="BSc",
+                field_of_study="CS", start_date=date(year, 9, 1),
+            )
+        UserEducation.objects.create(
+            user=cls.owner, school="Hidden", degree="MSc", field_of_study="CS",
+            start_date=date(2015, 9, 1), privacy=Privacy.PRIVATE,
+        )
+        UserWorkExperience.objects.create(
+            user=cls.owner, company="Acme", position="Engineer",
+            start_date=date(2019, 7, 1), privacy=Privacy.FRIENDS,
+        )
+        UserConnection.objects.create(user=cls.viewer, other=cls.owner, is_friend=True)
+        cls.headers = {
+            "Authorization": f"Bearer {generate_tokens_for_user(cls.viewer)[0]}"
+        }
+
+    def setUp(self):
+        cache.clear()
+
+    async def test_matches_sync_views(self):
+        for name, query in [
+            ("account:user_profile", ""),
+            ("account:user_address", ""),
+            ("account:user_education", "?limit=2"),
+            ("account:user_work_experience", ""),
+        ]:
+            url = reverse(name, args=["sara"]) + query
+            response = await self.async_client.get(url, headers=self.headers)
+            self.assertEqual(response.status_code, 200)
+            self.assertIn("Async", response.resolver_match.func.view_class.__name__)
+            self.assertGreater(response.query_stats.count, 0)
+            sync_response = await sync_to_async(self.client.get)(url, headers=self.headers)
+            self.assertEqual(response.json(), sync_response.json())
+
+    async def test_paginates_visible_rows(self):
+        url = reverse("account:user_education", args=["sara"])
+        response = await self.async_client.get(f"{url}?limit=3")
+        data = response.json()
+        self.assertEqual([row["school"] for row in data["results"]], [
+            "School 2010", "School 2011", "School 2012",
+        ])
+        response = await self.async_client.get(data["next"])
+        self.assertEqual(
+            [row["school"] for row in response.json()["results"]], ["School 2013"]
+        )
+
+        url = reverse("account:user_work_experience", args=["sara"])
+        response = await self.async_client.get(url)
+        self.assertEqual(response.json()["results"], [])
+
+    async def test_errors(self):
+        url = reverse("account:user_profile", args=["nobody"])
+        response = await self.async_client.get(url)
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json(), {"detail": "Not found."})
+
+        url = reverse("account:user_profile", args=["sara"])
+        response = await self.async_client.get(url, headers={"Authorization": "Bearer bad"})
+        self.assertEqual(response.status_code, 401)
+        self.assertIn("WWW-Authenticate", response.headers)
+
+    async def test_delegates_writes_to_sync_views(self):
+        url = reverse("account:user_profile", args=["ali"])
+        response = await self.async_client.patch(
+            url, {"bio": "Updated"}, content_type="application/json",
+            headers=self.headers,
+        )
+        self.assertEqual(response.status_code, 200)
+        profile = await UserProfile.objects.aget(user=self.viewer)
+        self.assertEqual(profile.bio, "Updated")
+
+        response = await self.async_client.patch(
+            reverse("account:user_profile", args=["sara"]), {"bio": "Hacked"},
+            content_type="application/json", headers=self.headers,
+        )
+        self.assertEqual(response.status_code, 403)
+
+
+class ProfileSectionCacheTestCase(QueryBudgetTestMixin, TestCase):
+    """Tests for the cached responses of the profile sections"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create(username="sara", email="sara@example.com")
+        cls.friend = User.objects.create(username="ali", email="ali@example.com")
+        cls.stranger = User.objects.create(username="zara", email="zara@example.com")
+        cls.admin = User.objects.create(
+            username="admin", email="admin@example.com", is_staff=True
+        )
+        UserConnection.objects.create(user=cls.friend, other=cls.owner, is_friend=True)
+        UserEducation.objects.create(
+            user=cls.owner, school="LUMS", degree="BSc", field_of_study="CS",
+            start_date=date(2015, 9, 1),
+        )
+        cls.hidden = UserEducation.objects.create(
+            user=cls.owner, school="NUST", degree="MSc", field_of_study="CS",
+            start_date=date(2019, 9, 1), privacy=Privacy.FRIENDS,
+        )
+        cls.url = reverse("account:user_education", args=["sara"])
+
+    def setUp(self):
+        cache.clear()
+        username_cache.clear()
+
+    def get_schools(self, viewer=None):
+        headers = {}
+        if viewer:
+            headers["Authorization"] = f"Bearer {generate_tokens_for_user(viewer)[0]}"
+        response = self.client.get(self.url, headers=headers)
+        return [row["school"] for row in response.json()["results"]]
+
+    def test_served_from_cache_per_tier(self):
+        self.assertEqual(self.get_schools(), ["LUMS"])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get_schools(), ["LUMS"])
+        self.assertEqual(self.get_schools(self.friend), ["LUMS", "NUST"])
+        self.assertEqual(self.get_schools(self.stranger), ["LUMS"])
+        # Only the friendship is looked up for the cached tier
+        with self.assertNumQueries(1):
+            self.assertEqual(self.get_schools(self.friend), ["LUMS", "NUST"])
+
+    def test_invalidated_on_write(self):
+        self.assertEqual(self.get_schools(), ["LUMS"])
+        self.hidden.privacy = Privacy.PUBLIC
+        self.hidden.save()
+        self.assertEqual(self.get_schools(), ["LUMS", "NUST"])
+        self.hidden.delete()
+        self.assertEqual(self.get_schools(), ["LUMS"])
+
+        headers = {"Authorization": f"Bearer {generate_tokens_for_user(self.owner)[0]}"}
+        response = self.client.post(
+            reverse("account:user_education_bulk", args=["sara"]),
+            [{
+                "school": "GIKI", "degree": "BS", "field_of_study": "EE",
+                "start_date": "2012-09-01",
+            }],
+            content_type="application/json", headers=headers,
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.get_schools(), ["LUMS", "GIKI"])
+
+    def test_invalidated_on_custom_people_change(self):
+        self.hidden.privacy = Privacy.CUSTOM
+        self.hidden.save()
+        self.assertEqual(self.get_schools(self.stranger), ["LUMS"])
+        self.hidden.custom_people.add(self.stranger)
+        self.assertEqual(self.get_schools(self.stranger), ["LUMS", "NUST"])
+        self.assertEqual(self.get_schools(self.friend), ["LUMS"])
+        self.stranger.usereducation_set.remove(self.hidden)
+        self.assertEqual(self.get_schools(self.stranger), ["LUMS"])
+
+    def test_metrics(self):
+        reset_metrics()
+        self.get_schools()
+        self.get_schools()
+        self.hidden.privacy = Privacy.PRIVATE
+        self.hidden.save()
+        headers = {"Authorization": f"Bearer {generate_tokens_for_user(self.admin)[0]}"}
+        response = self.client.get(reverse("account:profile_cache_metrics"), headers=headers)
+        metrics = response.json()
+        self.assertEqual(
+            (metrics["hits"], metrics["misses"], metrics["invalidations"]), (1, 1, 1)
+        )
+        self.assertEqual(metrics["hit_rate"], 0.5)
+        self.assertIsNotNone(metrics["mean_hit_age"])
+
+    # The database cache writes add savepoints to the test transaction,
+    # counted by the query budgets
+    @override_settings(
+        CACHES=DATABASE_CACHES, QUERY_BUDGET_ENFORCE=False, QUERY_BUDGET_SAMPLE_RATE=0.0
+    )
+    def test_shared_across_processes(self):
+        worker_cache, other_cache = get_process_caches()
+        with patch("account.cache.cache", worker_cache):
+            reset_metrics()
+            self.assertEqual(self.get_schools(), ["LUMS"])
+        with patch("account.cache.cache", other_cache):
+            self.assertEqual(self.get_schools(), ["LUMS"])
+            self.hidden.privacy = Privacy.PUBLIC
+            self.hidden.save()
+        with patch("account.cache.cache", worker_cache):
+            self.assertEqual(self.get_schools(), ["LUMS", "NUST"])
+            metrics = get_metrics()
+        self.assertEqual(
+            (metrics["hits"], metrics["misses"], metrics["invalidations"]), (1, 2, 1)
+        )
+
+
+class UserSearchTestCase(QueryBudgetTestMixin, TestCase):
+    """Tests for the people search and its index"""
+
+    def setUp(self):
+        with eager_tasks(), self.captureOnCommitCallbacks(execute=True):
+            self.ali = User.objects.create(
+                username="ali_k", email="ali@example.com", first_name="Ali", last_name="Khan",
+            )
+            self.alina = User.objects.create(
+                username="alina", email="alina@example.com", first_name="Alina",
+                last_name="Malik",
+            )
+            UserEducation.objects.create(
+                user=self.ali, school="NUST", degree="BS", field_of_study="CS",
+                start_date=date(2015, 9, 1), privacy=Privacy.PUBLIC,
+            )
+            UserWorkExperience.objects.create(
+                user=self.ali, company="Careem", position="Engineer",
+                start_date=date(2020, 1, 1), privacy=Privacy.FRIENDS,
+            )
+            UserWorkExperience.objects.create(
+                user=self.alina, company="Khan Academy", position="Teacher",
+                start_date=date(2020, 1, 1), privacy=Privacy.PUBLIC,
+            )
+
+    def search(self, query):
+        response = self.client.get(reverse("account:search_users"), {"q": query})
+        self.assertEqual(response.status_code, 200)
+        return [(user["username"], user["rank"]) for user in response.data["results"]]
+
+    def test_indexes_public_fields_on_save(self):
+        terms = set(UserSearchPosting.objects.filter(user=self.ali).values_list("term", flat=True))
+        self.assertEqual(terms, {"ali", "khan", "k", "nust"})
+
+        with eager_tasks(), self.captureOnCommitCallbacks(execute=True):
+            experience = UserWorkExperience.objects.get(user=self.ali)
+            experience.privacy = Privacy.PUBLIC
+            experience.save()
+        self.assertEqual(self.search("careem"), [("ali_k", 2)])
+
+    def test_skips_unindexed_fields(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.ali.save(update_fields=["last_login"])
+        self.assertEqual(callbacks, [])
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.ali.last_name = "Ahmed"
+            self.ali.save(update_fields=["last_name"])
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(index_user(self.ali.id), 2)
+        self.assertEqual(index_user(self.ali.id), 0)
+
+    def test_search(self):
+        # Names rank above organizations, the last term matches as a prefix
+        self.assertEqual(self.search("khan"), [("ali_k", 4), ("alina", 2)])
+        self.assertEqual(self.search("ali"), [("ali_k", 4), ("alina", 4)])
+        self.assertEqual(self.search("Ali NU"), [("ali_k", 6)])
+        self.assertEqual(self.search("alina khan"), [("alina", 6)])
+        self.assertEqual(self.search("careem"), [])
+        self.assertEqual(self.search("  "), [])
+
+    def test_finds_imported_users(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".csv") as file:
+            file.write(
+                "username,email,first_name,last_name\n"
+                "zara_k,zara@example.com,Zara,Khan\n"
+            )
+            file.flush()
+            call_command(
+                "import_users", file.name, workers=0, no_email=True, stdout=StringIO()
+            )
+        self.assertEqual(self.search("zara"), [("zara_k", 4)])
+        self.assertEqual(self.search("khan"), [("ali_k", 4), ("zara_k", 4), ("alina", 2)])
+
+    def test_rebuild_command(self):
+        UserSearchPosting.objects.all().delete()
+        User.objects.filter(id=self.alina.id).update(is_active=False)
+        call_command("rebuild_search_index", chunk_size=1, stdout=StringIO())
+        self.assertEqual(self.search("khan"), [("ali_k", 4)])
+
+
+class UserDirectoryTestCase(QueryBudgetTestMixin, TestCase):
+    """Tests for the directory facets and their counts"""
+
+    def setUp(self):
+        self.country = Country.objects.create(name="Pakistan", code2="PK", code3="PAK")
+        self.lahore = City.objects.create(name="Lahore", country=self.country)
+        with eager_tasks(), self.captureOnCommitCallbacks(execute=True):
+            self.users = [
+                User.objects.create(username=username, email=f"{username}@example.com")
+                for username in ["amna", "bilal", "danish"]
+            ]
+            for user in self.users[:2]:
+                UserAddress.objects.create(
+                    user=user, country=self.country, city=self.lahore,
+                    privacy=Privacy.PUBLIC,
+                )
+            for user, school in zip(self.users, ["NUST", "nust ", "LUMS"]):
+                UserEducation.objects.create(
+                    user=user, school=school, degree="BS", field_of_study="CS",
+                    start_date=date(2015, 9, 1), privacy=Privacy.PUBLIC,
+                )
+            UserWorkExperience.objects.create(
+                user=self.users[2], company="Careem", position="Engineer",
+                start_date=date(2020, 1, 1), privacy=Privacy.FRIENDS,
+            )
+
+    def get_counts(self):
+        return {
+            (row.facet, row.label): row.count
+            for row in FacetCount.objects.filter(count__gt=0)
+        }
+
+    def test_counts_public_values(self):
+        self.assertEqual(self.get_counts(), {
+            (Facet.CITY, "Lahore"): 2, (Facet.SCHOOL, "NUST"): 2, (Facet.SCHOOL, "LUMS"): 1,
+        })
+
+    def test_applies_deltas(self):
+        amna, bilal, danish = self.users
+        with eager_tasks(), self.captureOnCommitCallbacks(execute=True):
+            address = UserAddress.objects.get(user=amna)
+            address.privacy = Privacy.PRIVATE
+            address.save()
+            UserEducation.objects.filter(user=bilal).delete()
+            experience = UserWorkExperience.objects.get(user=danish)
+            experience.privacy = Privacy.PUBLIC
+            experience.save()
+        self.assertEqual(self.get_counts(), {
+            (Facet.CITY, "Lahore"): 1, (Facet.SCHOOL, "NUST"): 1, (Facet.SCHOOL, "LUMS"): 1,
+            (Facet.COMPANY, "Careem"): 1,
+        })
+
+        amna.delete()
+        self.assertEqual(self.get_counts(), {
+            (Facet.CITY, "Lahore"): 1, (Facet.SCHOOL, "LUMS"): 1, (Facet.COMPANY, "Careem"): 1,
+        })
+
+    def test_directory(self):
+        response = self.client.get(
+            reverse("account:user_directory"), {"city": self.lahore.id, "school": "Nust"}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [user["username"] for user in response.data["results"]], ["amna", "bilal"]
+        )
+        facets = response.data["facets"]
+        self.assertEqual(facets["city"], [
+            {"value": str(self.lahore.id), "label": "Lahore", "count": 2},
+        ])
+        self.assertEqual([row["label"] for row in facets["school"]], ["NUST", "LUMS"])
+        self.assertEqual(facets["company"], [])
+
+        response = self.client.get(
+            reverse("account:user_directory"), {"school": "lums", "limit": 1}
+        )
+        self.assertEqual([user["username"] for user in response.data["results"]], ["danish"])
+
+    def test_counts_imported_users(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".jsonl") as file:
+            for username, school in [("erum", "NUST"), ("faraz", "GIKI")]:
+                file.write(json.dumps({
+                    "username": username, "email": f"{username}@example.com",
+                    "country": "PK", "city": "Lahore",
+                    "educations": [{
+                        "school": school, "degree": "BS", "field_of_study": "CS",
+                        "start_date": "2015-09-01", "privacy": Privacy.PUBLIC,
+                    }],
+                }) + "\n")
+            file.flush()
+            call_command(
+                "import_users", file.name, workers=0, chunk_size=1, no_email=True,
+                stdout=StringIO(),
+            )
+        self.assertEqual(self.get_counts(), {
+            (Facet.CITY, "Lahore"): 4, (Facet.SCHOOL, "NUST"): 3, (Facet.SCHOOL, "LUMS"): 1,
+            (Facet.SCHOOL, "GIKI"): 1,
+        })
+
+    def test_rebuild_command(self):
+        counts = self.get_counts()
+        FacetCount.objects.update(count=0)
+        call_command("rebuild_user_facets", chunk_size=2, stdout=StringIO())
+        self.assertEqual(self.get_counts(), counts)
+
+
+class NearbyUsersTestCase(QueryBudgetTestMixin, TestCase):
+    """Tests for the geohash cells of the addresses and the nearby users"""
+
+    @classmethod
+    def setUpTestData(cls):
+        country = Country.objects.create(name="Pakistan", code2="PK", code3="PAK")
+        cls.cities = {
+            name: City.objects.create(
+                name=name, country=country,
+                latitude=Decimal(latitude), longitude=Decimal(longitude),
+            )
+            for name, latitude, longitude in [
+                ("Lahore", "31.54970", "74.34360"),
+                ("Kasur", "31.11560", "74.44670"),
+                ("Sheikhupura", "31.71670", "73.98500"),
+                ("Islamabad", "33.68440", "73.04790"),
+            ]
+        }
+        cls.user = User.objects.create(username="viewer", email="viewer@example.com")
+        UserAddress.objects.create(user=cls.user, city=cls.cities["Lahore"])
+        for username, city, privacy in [
+            ("lahori", "Lahore", Privacy.PUBLIC),
+            ("kasuri", "Kasur", Privacy.PUBLIC),
+            ("hidden", "Sheikhupura", Privacy.PRIVATE),
+            ("capital", "Islamabad", Privacy.PUBLIC),
+        ]:
+            user = User.objects.create(username=username, email=f"{username}@example.com")
+            UserAddress.objects.create(user=user, city=cls.cities[city], privacy=privacy)
+
+    def get_nearby(self, **params):
+        access_token, _ = generate_tokens_for_user(self.user)
+        response = self.client.get(
+            reverse("account:nearby_users"), params,
+            HTTP_AUTHORIZATION=f"Bearer {access_token}",
+        )
+        self.assertEqual(response.status_code, 200, response.data)
+        return [(user["username"], user["distance"]) for user in response.data["results"]]
+
+    def test_sets_geo_cell(self):
+        address = UserAddress.objects.get(user=self.user)
+        self.assertEqual(address.geo_cell[:5], "ttsg7")
+        address.city = self.cities["Islamabad"]
+        address.save()
+        self.assertEqual(UserAddress.objects.get(user=self.user).geo_cell[:5], "ttgzw")
+
+        city = self.cities["Islamabad"]
+        city.latitude, city.longitude = self.cities["Lahore"].latitude, city.longitude
+        city.save()
+        address.refresh_from_db()
+        self.assertEqual(address.geo_cell, get_city_geo_cell(city))
+
+    def test_finds_imported_users(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".csv") as file:
+            file.write(
+                "username,email,country,city\n"
+                "imported,imported@example.com,PK,Kasur\n"
+            )
+            file.flush()
+            call_command(
+                "import_users", file.name, workers=0, no_email=True, stdout=StringIO()
+            )
+        nearby = self.get_nearby(radius=60)
+        self.assertIn("imported", [username for username, _ in nearby])
+
+    def test_nearby(self):
+        nearby = self.get_nearby(radius=60)
+        self.assertEqual([username for username, _ in nearby], ["lahori", "kasuri"])
+        self.assertEqual(nearby[0][1], 0)
+        self.assertAlmostEqual(nearby[1][1], 49.5, delta=1)
+
+        nearby = self.get_nearby(radius=300)
+        self.assertEqual(
+            [username for username, _ in nearby], ["lahori", "kasuri", "capital"]
+        )
+        self.assertEqual(self.get_nearby(radius=300, limit=1), [("lahori", 0)])
+
+    def test_validates_request(self):
+        access_token, _ = generate_tokens_for_user(self.user)
+        headers = {"HTTP_AUTHORIZATION": f"Bearer {access_token}"}
+        response = self.client.get(reverse("account:nearby_users"), {"radius": 1000}, **headers)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("radius", response.data)
+
+        UserAddress.objects.filter(user=self.user).update(city=None)
+        response = self.client.get(reverse("account:nearby_users"), **headers)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("city", response.data)
@@ -1,15 +1,30 @@
 from django.urls import path, re_path
 
 from .views import (
-    UserAddressAPIView, UserChangeEmailAPIView, UserCreateAPIView, 
-    UserEducationViewSet, UserProfileAPIView, UserWorkExperienceViewSet,
-    get_email_token, verify_email,
+    FriendListAPIView, FriendRequestListAPIView, FriendshipAPIView,
+    NearbyUserListAPIView, UserAddressAPIView, UserBulkExportAPIView,
+    UserChangeEmailAPIView, UserCreateAPIView, UserDirectoryAPIView,
+    UserEducationViewSet, UserExportAPIView, UserFullProfileAPIView,
+    UserProfileAPIView, UserSearchAPIView, UserWorkExperienceViewSet,
+    accept_friend_request, get_email_token, get_profile_cache_metrics,
+    verify_email,
 )
 
 app_name = "account"
 
+# The first segments of the fixed routes, matched before the usernames, are
+# listed in `core.utils.RESERVED_USERNAMES`
 urlpatterns = [
     path("register/", UserCreateAPIView.as_view(), name="register_user"),
+    path("export/", UserBulkExportAPIView.as_view(), name="export_users"),
+    path("search/", UserSearchAPIView.as_view(), name="search_users"),
+    path("directory/", UserDirectoryAPIView.as_view(), name="user_directory"),
+    path("nearby/", NearbyUserListAPIView.as_view(), name="nearby_users"),
+    path(
+        "profile-cache/metrics/",
+        get_profile_cache_metrics,
+        name="profile_cache_metrics",
+    ),
     re_path(
         r"(?P<username>[\w.@+-]+)/email-token/$",
         get_email_token,
@@ -40,6 +55,13 @@ urlpatterns = [
         UserEducationViewSet.as_view({"get": "list", "post": "create"}),
         name="user_education",
     ),
+    re_path(
+        r"(?P<username>[\w.@+-]+)/education/bulk/$",
+        UserEducationViewSet.as_view(
+            {"post": "bulk_create", "patch": "bulk_update", "delete": "bulk_destroy"}
+        ),
+        name="user_education_bulk",
+    ),
     re_path(
         r"(?P<username>[\w.@+-]+)/education/(?P<pk>\d+)/$",
         UserEducationViewSet.as_view(
@@ -52,6 +74,13 @@ urlpatterns = [
         UserWorkExperienceViewSet.as_view({"get": "list", "post": "create"}),
         name="user_work_experience",
     ),
+    re_path(
+        r"(?P<username>[\w.@+-]+)/work-experience/bulk/$",
+        UserWorkExperienceViewSet.as_view(
+            {"post": "bulk_create", "patch": "bulk_update", "delete": "bulk_destroy"}
+        ),
+        name="user_work_experience_bulk",
+    ),
     re_path(
         r"(?P<username>[\w.@+-]+)/work-experience/(?P<pk>\d+)/$",
         UserWorkExperienceViewSet.as_view(
@@ -59,4 +88,34 @@ urlpatterns = [
         ),
         name="user_work_experience",
     ),
+    re_path(
+        r"(?P<username>[\w.@+-]+)/export/$",
+        UserExportAPIView.as_view(),
+        name="user_export",
+    ),
+    re_path(
+        r"(?P<username>[\w.@+-]+)/friends/$",
+        FriendListAPIView.as_view(),
+        name="user_friends",
+    ),
+    re_path(
+        r"(?P<username>[\w.@+-]+)/friend-requests/$",
+        FriendRequestListAPIView.as_view(),
+        name="user_friend_requests",
+    ),
+    re_path(
+        r"(?P<username>[\w.@+-]+)/friendship/$",
+        FriendshipAPIView.as_view(),
+        name="user_friendship",
+    ),
+    re_path(
+        r"(?P<username>[\w.@+-]+)/friendship/accept/$",
+        accept_friend_request,
+        name="user_friendship_accept",
+    ),
+    re_path(
+        r"(?P<username>[\w.@+-]+)/$",
+        UserFullProfileAPIView.as_view(),
+        name="user_full_profile",
+    ),
 ]
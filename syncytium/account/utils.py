@@ -1,5 +1,3 @@
-from secrets import token_hex
-
 from .models import UserEmailStatus
 
 
@@ -17,7 +15,6 @@ def generate_email_verification_token(user_id):
         `str`: The generated token
     """
     email_status = UserEmailStatus.objects.get_or_create(user_id=user_id)[0]
-    email_status.verification_token = token_hex(16)
-    email_status.is_verified = False
+    token = email_status.set_verification_token()
     email_status.save()
-    return email_status.verification_token
+    return token
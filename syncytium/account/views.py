@@ -1,27 +1,60 @@
 from django.contrib.auth import get_user_model
+from django.db import IntegrityError, transaction
+from django.db.models import Prefetch
+from django.http import StreamingHttpResponse
 from django.shortcuts import render
 from rest_framework.decorators import api_view, permission_classes
-from rest_framework.generics import CreateAPIView, RetrieveUpdateAPIView, UpdateAPIView
-from rest_framework.permissions import IsAuthenticated, IsAuthenticatedOrReadOnly
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.generics import (
+    CreateAPIView, ListAPIView, RetrieveAPIView, RetrieveUpdateAPIView,
+    UpdateAPIView,
+)
+from rest_framework.permissions import (
+    IsAdminUser, IsAuthenticated, IsAuthenticatedOrReadOnly,
+)
 from rest_framework.response import Response
-from rest_framework.status import HTTP_200_OK, HTTP_400_BAD_REQUEST, HTTP_404_NOT_FOUND
+from rest_framework.status import (
+    HTTP_200_OK, HTTP_201_CREATED, HTTP_204_NO_CONTENT, HTTP_400_BAD_REQUEST,
+    HTTP_404_NOT_FOUND,
+)
+from rest_framework.views import APIView
 from rest_framework.viewsets import ModelViewSet
 
-from core.models import RegistrationMethod
+from authentication.authentication import (
+    ClaimsJWTAuthentication, VersionedJWTAuthentication,
+)
+from core.middleware import QueryBudget
+from core.models import (
+    Friendship, FriendshipStatus, RegistrationMethod, UserConnection,
+)
+from core.paginators import KeysetPagination
+from core.utils import get_user_id_for_request
 
-from .mixins import MustExistForUsernameAPIMixin
+from .cache import get_metrics
+from .export import export_users
+from .facets import get_facet_counts, get_facet_value
+from .mixins import (
+    BulkModelViewSetMixin, MustExistForUsernameAPIMixin, ProfileSectionCacheMixin,
+)
 from .models import (
-    UserAddress, UserEducation, UserEmailStatus, UserProfile,
+    Facet, UserAddress, UserAvatar, UserBirthDate, UserEducation,
+    UserEmailStatus, UserFacet, UserLink, UserPhone, UserProfile,
     UserWorkExperience,
 )
+from .nearby import find_nearby_addresses
 from .permissions import (
     IsCurrentUserOrReadOnlyPermission, IsCurrentUserPermission,
 )
+from .search import search_users
 from .serializers import (
-    ChangeEmailSerializer, UserAddressSerializer, UserEducationSerializer, 
-    UserProfileSerializer, UserSerializer, UserWorkExperienceSerializer,
+    ChangeEmailSerializer, FriendshipSerializer, UserAddressSerializer,
+    UserEducationSerializer, UserFullProfileSerializer, UserProfileSerializer,
+    UserPublicSerializer, UserSerializer, UserWorkExperienceSerializer,
+)
+from .tasks import (
+    add_friend_connection, remove_friend_connection,
+    send_email_verification_link_email, send_registration_email,
 )
-from .tasks import send_email_verification_link_email, send_registration_email
 
 User = get_user_model()
 
@@ -30,15 +63,15 @@ class UserCreateAPIView(CreateAPIView):
     """API view to create a new user"""
     serializer_class = UserSerializer
 
+    @transaction.atomic
     def perform_create(self, serializer):
         password = serializer.validated_data.pop("password")
         serializer.save()
         user = serializer.instance
         user.set_password(password)
         user.save()
-        # send_registration_email.delay(user.id)
+        # The emails are queued in the outbox within the same transaction
         send_registration_email(user.id)
-        # send_email_verification_link_email.delay(user.id, is_new=True)
         send_email_verification_link_email(user.id, is_new=True)
         return user
 
@@ -47,7 +80,8 @@ class UserCreateAPIView(CreateAPIView):
 @permission_classes([IsAuthenticated, IsCurrentUserPermission])
 def get_email_token(request, username):
     """API view to get email token"""
-    user = User.objects.filter(username=username).select_related("email_status").first()
+    user_id = get_user_id_for_request(request, username)
+    user = User.objects.filter(id=user_id).select_related("email_status").first()
     if not user:
         return Response({"detail": "User not found."}, status=HTTP_404_NOT_FOUND)
     if user.email_status.is_verified:
@@ -65,7 +99,9 @@ def get_email_token(request, username):
 @api_view(["GET"])
 def verify_email(request, token):
     """API view to verify email"""
-    email_status = UserEmailStatus.objects.filter(verification_token=token).first()
+    token_hash = UserEmailStatus.hash_token(token)
+    email_status = UserEmailStatus.objects \
+        .filter(verification_token_hash=token_hash).first()
     if not email_status:
         detail = "Invalid link"
     elif email_status.is_verified:
@@ -102,8 +138,215 @@ class UserChangeEmailAPIView(UpdateAPIView):
         return user
 
 
-class UserProfileAPIView(RetrieveUpdateAPIView):
+class UserFullProfileAPIView(RetrieveAPIView):
+    """API view to retrieve every profile section of a user at once.
+
+    Each section is prefetched already filtered for the requester, so the
+    response costs a fixed number of queries whatever the number of rows.
+    """
+    authentication_classes = [ClaimsJWTAuthentication]
+    query_budget = QueryBudget(queries=9)
+    serializer_class = UserFullProfileSerializer
+
+    def get_queryset(self):
+        viewer = self.request.user
+        return User.objects.select_related("profile").prefetch_related(
+            Prefetch(
+                "address",
+                queryset=UserAddress.objects.visible_to(viewer)
+                .select_related("city", "country"),
+            ),
+            Prefetch("user_birth_date", queryset=UserBirthDate.objects.visible_to(viewer)),
+            Prefetch("user_avatar", queryset=UserAvatar.objects.visible_to(viewer)),
+            Prefetch(
+                "user_links",
+                queryset=UserLink.objects.visible_to(viewer).order_by("created", "id"),
+            ),
+            Prefetch(
+                "user_phones",
+                queryset=UserPhone.objects.visible_to(viewer)
+                .order_by("-is_primary", "created", "id"),
+            ),
+            Prefetch(
+                "educations",
+                queryset=UserEducation.objects.visible_to(viewer)
+                .order_by("-start_date", "id"),
+            ),
+            Prefetch(
+                "work_experiences",
+                queryset=UserWorkExperience.objects.visible_to(viewer)
+                .order_by("-start_date", "id"),
+            ),
+        )
+
+    def get_object(self):
+        user_id = get_user_id_for_request(self.request, self.kwargs.get("username"))
+        user = self.get_queryset().filter(id=user_id).first()
+        if not user:
+            raise NotFound
+        return user
+
+
+class UserExportAPIView(APIView):
+    """API view to export all the account data of the current user as
+    NDJSON, e.g. for data access requests.
+    """
+    authentication_classes = [ClaimsJWTAuthentication]
+    permission_classes = [IsAuthenticated, IsCurrentUserPermission]
+
+    def get(self, request, username):
+        queryset = User.objects.filter(id=request.user.id)
+        return get_export_response(queryset, f"{username}.ndjson")
+
+
+class UserBulkExportAPIView(APIView):
+    """API view to export the account data of many users as NDJSON,
+    streamed in chunks so memory stays constant.
+
+    Query parameters:
+    - `username`: Usernames to export, repeated, all users by default.
+    """
+    # The staff status is checked against the stored user, not the claims
+    authentication_classes = [VersionedJWTAuthentication]
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        queryset = User.objects.all()
+        usernames = request.query_params.getlist("username")
+        if usernames:
+            queryset = queryset.filter(username__in=usernames)
+        return get_export_response(queryset, "users.ndjson")
+
+
+class UserSearchAPIView(APIView):
+    """API view to search people by their names, username, and the schools
+    and companies they share publicly, through the `q` query parameter.
+    """
+    authentication_classes = [ClaimsJWTAuthentication]
+    query_budget = QueryBudget(queries=2)
+    search_param = "q"
+
+    def get(self, request):
+        limit = KeysetPagination().get_limit(request)
+        ranks = dict(search_users(request.query_params.get(self.search_param, ""), limit))
+        users = User.objects.in_bulk(ranks)
+        results = [
+            {**UserPublicSerializer(users[user_id]).data, "rank": rank}
+            for user_id, rank in ranks.items() if user_id in users
+        ]
+        return Response(
+            {"count": len(results), "next": None, "previous": None, "results": results}
+        )
+
+
+class UserDirectoryAPIView(ListAPIView):
+    """API view to list the users of the directory, filtered by the `city`
+    ID, `school` or `company` query parameters.
+
+    The response includes the `facets`, the most common cities, schools
+    and companies with their user counts over the whole directory, read
+    from the precomputed `FacetCount` rows.
+    """
+    authentication_classes = [ClaimsJWTAuthentication]
+    query_budget = QueryBudget(queries=3)
+    serializer_class = UserPublicSerializer
+    pagination_class = KeysetPagination
+    keyset_ordering = ("username", "id")
+    facet_limit = 10
+
+    def get_selected_facets(self):
+        selected = {}
+        for facet in Facet.values:
+            value = self.request.query_params.get(facet, "").strip()
+            if value:
+                selected[facet] = get_facet_value(facet, value)
+        return selected
+
+    def get_queryset(self):
+        queryset = User.objects.filter(is_active=True)
+        for facet, value in self.get_selected_facets().items():
+            user_ids = UserFacet.objects.filter(facet=facet, value=value).values("user_id")
+            queryset = queryset.filter(id__in=user_ids)
+        return queryset
+
+    def list(self, request, *args, **kwargs):
+        response = super().list(request, *args, **kwargs)
+        response.data["facets"] = get_facet_counts(
+            self.get_selected_facets(), self.facet_limit
+        )
+        return response
+
+
+class NearbyUserListAPIView(APIView):
+    """API view to list the users living nearest to the current user's
+    city, within the `radius` query parameter in km.
+    """
+    authentication_classes = [ClaimsJWTAuthentication]
+    permission_classes = [IsAuthenticated]
+    query_budget = QueryBudget(queries=3)
+    default_radius = 50
+    max_radius = 500
+
+    def get_radius(self):
+        """Get the requested radius.
+
+        Raises:
+        - `ValidationError`: If it is not a number between 0 and
+        `max_radius`.
+        """
+        try:
+            radius = float(self.request.query_params.get("radius", self.default_radius))
+        except ValueError:
+            raise ValidationError({"radius": "Expected a number of km."})
+        if not 0 < radius <= self.max_radius:
+            raise ValidationError(
+                {"radius": f"Expected a radius up to {self.max_radius} km."}
+            )
+        return radius
+
+    def get(self, request):
+        radius = self.get_radius()
+        origin = UserAddress.objects.filter(user_id=request.user.id) \
+            .values_list("city__latitude", "city__longitude").first()
+        if origin is None or None in origin:
+            raise ValidationError({"city": "Set the city of your address first."})
+        addresses = find_nearby_addresses(
+            request.user, *origin, radius, KeysetPagination().get_limit(request)
+        )
+        results = [
+            {
+                **UserPublicSerializer(address.user).data,
+                "city": address.city.name,
+                "distance": round(address.distance, 1),
+            }
+            for address in addresses
+        ]
+        return Response(
+            {"count": len(results), "next": None, "previous": None, "results": results}
+        )
+
+
+@api_view(["GET"])
+@permission_classes([IsAdminUser])
+def get_profile_cache_metrics(request):
+    """API view to get the hit rate and staleness of the profile section
+    cache
+    """
+    return Response(get_metrics(), status=HTTP_200_OK)
+
+
+def get_export_response(queryset, filename):
+    response = StreamingHttpResponse(
+        export_users(queryset), content_type="application/x-ndjson"
+    )
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
+
+
+class UserProfileAPIView(ProfileSectionCacheMixin, RetrieveUpdateAPIView):
     """API view to manage user profile"""
+    authentication_classes = [ClaimsJWTAuthentication]
+    query_budget = QueryBudget(queries=4)
     serializer_class = UserProfileSerializer
     queryset = UserProfile.objects.all()
     permission_classes = [
@@ -117,8 +360,10 @@ class UserProfileAPIView(RetrieveUpdateAPIView):
         return MustExistForUsernameAPIMixin.get_object(self, create=True)
 
 
-class UserAddressAPIView(RetrieveUpdateAPIView):
+class UserAddressAPIView(ProfileSectionCacheMixin, RetrieveUpdateAPIView):
     """API view to manage user address"""
+    authentication_classes = [ClaimsJWTAuthentication]
+    query_budget = QueryBudget(queries=6)
     serializer_class = UserAddressSerializer
     queryset = UserAddress.objects.all()
     permission_classes = [
@@ -128,12 +373,20 @@ class UserAddressAPIView(RetrieveUpdateAPIView):
     http_method_names = ["get", "patch"]
     model = UserAddress
 
+    def get_queryset(self):
+        return self.model.objects.visible_to(self.request.user) \
+            .select_related("city", "country")
+
     def get_object(self):
         return MustExistForUsernameAPIMixin.get_object(self, create=True)
 
 
-class UserEducationViewSet(ModelViewSet):
+class UserEducationViewSet(
+    ProfileSectionCacheMixin, BulkModelViewSetMixin, ModelViewSet
+):
     """API view to manage user education"""
+    authentication_classes = [ClaimsJWTAuthentication]
+    query_budget = QueryBudget(queries=6)
     serializer_class = UserEducationSerializer
     permission_classes = [
         IsAuthenticatedOrReadOnly,
@@ -141,18 +394,23 @@ class UserEducationViewSet(ModelViewSet):
     ]
     http_method_names = ["get", "post", "patch", "delete"]
     model = UserEducation
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
-        username = self.kwargs.get("username")
-        return self.model.objects.filter(user__username=username)
+        user_id = get_user_id_for_request(self.request, self.kwargs.get("username"))
+        return self.model.objects.filter(user_id=user_id).visible_to(self.request.user)
 
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
+        serializer.save(user_id=self.request.user.id)
 
 
-class UserWorkExperienceViewSet(ModelViewSet):
+class UserWorkExperienceViewSet(
+    ProfileSectionCacheMixin, BulkModelViewSetMixin, ModelViewSet
+):
     """API view to manage user work experience"""
 
+    authentication_classes = [ClaimsJWTAuthentication]
+    query_budget = QueryBudget(queries=6)
     serializer_class = UserWorkExperienceSerializer
     permission_classes = [
         IsAuthenticatedOrReadOnly,
@@ -160,10 +418,124 @@ class UserWorkExperienceViewSet(ModelViewSet):
     ]
     http_method_names = ["get", "post", "patch", "delete"]
     model = UserWorkExperience
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
-        username = self.kwargs.get("username")
-        return self.model.objects.filter(user__username=username)
+        user_id = get_user_id_for_request(self.request, self.kwargs.get("username"))
+        return self.model.objects.filter(user_id=user_id).visible_to(self.request.user)
 
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
+        serializer.save(user_id=self.request.user.id)
+
+
+class FriendListAPIView(ListAPIView):
+    """API view to list the friends of a user"""
+    authentication_classes = [ClaimsJWTAuthentication]
+    query_budget = QueryBudget(queries=3)
+    serializer_class = UserPublicSerializer
+    pagination_class = KeysetPagination
+    keyset_ordering = ("username", "id")
+
+    def get_queryset(self):
+        user_id = get_user_id_for_request(self.request, self.kwargs.get("username"))
+        friend_ids = UserConnection.objects \
+            .filter(user_id=user_id, is_friend=True).values("other_id")
+        return User.objects.filter(id__in=friend_ids)
+
+
+class FriendRequestListAPIView(ListAPIView):
+    """API view to list the pending friend requests received by the
+    current user
+    """
+    authentication_classes = [ClaimsJWTAuthentication]
+    query_budget = QueryBudget(queries=3)
+    serializer_class = FriendshipSerializer
+    permission_classes = [IsAuthenticated, IsCurrentUserPermission]
+    pagination_class = KeysetPagination
+    keyset_ordering = ("-created", "-id")
+
+    def get_queryset(self):
+        return Friendship.objects \
+            .filter(to_user_id=self.request.user.id, status=FriendshipStatus.PENDING) \
+            .select_related("from_user", "to_user")
+
+
+class FriendshipAPIView(APIView):
+    """API view to manage the friendship between the current user and
+    the user in the URL.
+
+    Operations:
+    - `GET`: Retrieve the friendship or the pending request.
+    - `POST`: Send a friend request.
+    - `DELETE`: Withdraw or reject a request, or unfriend.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get_other_user_id(self):
+        other_user_id = get_user_id_for_request(
+            self.request, self.kwargs.get("username")
+        )
+        if other_user_id is None:
+            raise NotFound("User not found.")
+        if other_user_id == self.request.user.id:
+            raise ValidationError("You cannot be friends with yourself.")
+        return other_user_id
+
+    def get_friendship(self, other_user_id):
+        return Friendship.objects.between(self.request.user.id, other_user_id) \
+            .select_related("from_user", "to_user").first()
+
+    def get(self, request, username):
+        friendship = self.get_friendship(self.get_other_user_id())
+        if not friendship:
+            return Response({"detail": "Not friends."}, status=HTTP_404_NOT_FOUND)
+        return Response(FriendshipSerializer(friendship).data, status=HTTP_200_OK)
+
+    def post(self, request, username):
+        other_user_id = self.get_other_user_id()
+        # The unordered unique constraint rejects the pairs that have a
+        # row in either direction, including concurrent requests
+        try:
+            with transaction.atomic():
+                friendship = Friendship.objects.create(
+                    from_user_id=request.user.id, to_user_id=other_user_id
+                )
+        except IntegrityError:
+            return Response(
+                {"detail": "A friend request already exists."},
+                status=HTTP_400_BAD_REQUEST,
+            )
+        return Response(FriendshipSerializer(friendship).data, status=HTTP_201_CREATED)
+
+    def delete(self, request, username):
+        other_user_id = self.get_other_user_id()
+        friendship = self.get_friendship(other_user_id)
+        if not friendship:
+            return Response({"detail": "Not friends."}, status=HTTP_404_NOT_FOUND)
+        friendship.delete()
+        if friendship.status == FriendshipStatus.ACCEPTED:
+            transaction.on_commit(
+                lambda: remove_friend_connection.delay(request.user.id, other_user_id)
+            )
+        return Response(status=HTTP_204_NO_CONTENT)
+
+
+@api_view(["POST"])
+@permission_classes([IsAuthenticated])
+def accept_friend_request(request, username):
+    """API view to accept a friend request sent by the user in the URL"""
+    friendship = Friendship.objects.filter(
+        from_user_id=get_user_id_for_request(request, username),
+        to_user_id=request.user.id,
+        status=FriendshipStatus.PENDING,
+    ).select_related("from_user", "to_user").first()
+    if not friendship:
+        return Response(
+            {"detail": "Friend request not found."}, status=HTTP_404_NOT_FOUND
+        )
+    friendship.status = FriendshipStatus.ACCEPTED
+    friendship.save()
+    transaction.on_commit(
+        lambda: add_friend_connection.delay(friendship.from_user_id, friendship.to_user_id)
+    )
+    return Response(FriendshipSerializer(friendship).data, status=HTTP_200_OK)
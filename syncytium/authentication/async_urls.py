@@ -0,0 +1,10 @@
+from core.async_views import with_async_views
+
+from . import urls
+from .async_views import AsyncCurrentUserRetrieveAPIView
+
+app_name = urls.app_name
+
+urlpatterns = with_async_views(urls.urlpatterns, {
+    "me/": AsyncCurrentUserRetrieveAPIView,
+})
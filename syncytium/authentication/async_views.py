@@ -0,0 +1,20 @@
+from django.contrib.auth import get_user_model
+from rest_framework.exceptions import AuthenticationFailed
+
+from account.serializers import UserSerializer
+from core.async_views import AsyncAPIView
+
+User = get_user_model()
+
+
+class AsyncCurrentUserRetrieveAPIView(AsyncAPIView):
+    """Async version of `CurrentUserRetrieveAPIView`"""
+    authentication_required = True
+
+    async def get(self, request):
+        user = request.user
+        if not isinstance(user, User):
+            user = await User.objects.filter(id=user.id, is_active=True).afirst()
+            if user is None:
+                raise AuthenticationFailed("User not found", code="user_not_found")
+        return self.render(UserSerializer(user).data)
@@ -0,0 +1,75 @@
+from asgiref.sync import sync_to_async
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings
+
+from core.utils import aget_token_version, get_token_version
+
+
+class VersionedJWTAuthentication(JWTAuthentication):
+    """JWT authentication rejecting the tokens whose version is older than
+    the user's token version, i.e. revoked with `revoke_user_tokens`.
+    """
+
+    def get_user(self, validated_token):
+        user = super().get_user(validated_token)
+        if validated_token.get("ver", user.token_version) != user.token_version:
+            raise AuthenticationFailed(_("Token has been revoked"), code="token_revoked")
+        return user
+
+
+class ClaimsJWTAuthentication(VersionedJWTAuthentication):
+    """Opt-in JWT authentication building the user from the signed claims
+    of the access token instead of loading it from the database.
+
+    Operations:
+    - The user is a `TokenUser` with the `id`, `username` and `is_staff`
+    claims, enough for the permissions and privacy checks.
+    - The token version is checked against the cached one, so requests are
+    authenticated without any query when the cache is Redis, see
+    `REDIS_URL`. With the database cache, the check is a cache table query.
+    - Tokens issued before the claims were added load the user as usual.
+    - `aauthenticate` does the same with the async cache and ORM, for the
+    async views.
+
+    Views using it must only rely on the claims, e.g. `request.user.id`
+    instead of `request.user`.
+    """
+
+    def get_user(self, validated_token):
+        if "ver" not in validated_token or "username" not in validated_token:
+            return super().get_user(validated_token)
+        token_version = get_token_version(self.get_user_id(validated_token))
+        return self.get_token_user(validated_token, token_version)
+
+    async def aauthenticate(self, request):
+        """Async version of `authenticate`, for the async views."""
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+        validated_token = self.get_validated_token(raw_token)
+        return await self.aget_user(validated_token), validated_token
+
+    async def aget_user(self, validated_token):
+        if "ver" not in validated_token or "username" not in validated_token:
+            return await sync_to_async(super().get_user)(validated_token)
+        token_version = await aget_token_version(self.get_user_id(validated_token))
+        return self.get_token_user(validated_token, token_version)
+
+    def get_user_id(self, validated_token):
+        try:
+            return validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+    def get_token_user(self, validated_token, token_version):
+        if token_version is None:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+        if validated_token["ver"] != token_version:
+            raise AuthenticationFailed(_("Token has been revoked"), code="token_revoked")
+        return TokenUser(validated_token)
@@ -0,0 +1,22 @@
+# Generated by Django 5.0.4 on 2026-10-18 12:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UsernameCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('prefix', models.CharField(max_length=150, unique=True)),
+                ('next_suffix', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+    ]
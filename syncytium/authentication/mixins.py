@@ -2,15 +2,15 @@ from django.contrib.auth import get_user_model
 from django.core.exceptions import ValidationError
 from rest_framework import exceptions as rest_exceptions
 from rest_framework.permissions import IsAuthenticated
-from rest_framework_simplejwt.authentication import JWTAuthentication
 
+from .authentication import VersionedJWTAuthentication
 from .utils import get_error_message
 
 User = get_user_model()
 
 
 class ApiAuthMixin:
-    authentication_classes = (JWTAuthentication,)
+    authentication_classes = (VersionedJWTAuthentication,)
     permission_classes = (IsAuthenticated,)
 
 
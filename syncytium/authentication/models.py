@@ -1,3 +1,13 @@
 from django.db import models
 
-# Create your models here.
+
+class UsernameCounter(models.Model):
+    """This model stores, for each username prefix, the next suffix to
+    try when generating a username, so that allocating one does not probe
+    every taken suffix.
+    """
+    prefix = models.CharField(max_length=150, unique=True)
+    next_suffix = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.prefix} ({self.next_suffix})"
@@ -1,4 +1,12 @@
 from rest_framework import serializers
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.serializers import (
+    TokenObtainPairSerializer,
+    TokenRefreshSerializer,
+)
+from rest_framework_simplejwt.settings import api_settings
+
+from core.utils import get_token_version
 
 
 class GoogleLoginInputSerializer(serializers.Serializer):
@@ -6,3 +14,29 @@ class GoogleLoginInputSerializer(serializers.Serializer):
 
     code = serializers.CharField(required=False)
     error = serializers.CharField(required=False)
+
+
+class ClaimsTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """Token obtain serializer signing the claims used by
+    `ClaimsJWTAuthentication` into the tokens.
+    """
+
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        token["username"] = user.username
+        token["is_staff"] = user.is_staff
+        token["ver"] = user.token_version
+        return token
+
+
+class ClaimsTokenRefreshSerializer(TokenRefreshSerializer):
+    """Token refresh serializer rejecting the revoked refresh tokens"""
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs["refresh"])
+        if "ver" in refresh:
+            user_id = refresh.get(api_settings.USER_ID_CLAIM)
+            if refresh["ver"] != get_token_version(user_id):
+                raise InvalidToken("Token has been revoked")
+        return super().validate(attrs)
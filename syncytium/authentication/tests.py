@@ -1,3 +1,266 @@
-from django.test import TestCase
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
 
-# Create your tests here.
+import jwt
+from asgiref.sync import sync_to_async
+from cryptography.hazmat.primitives.asymmetric import rsa
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.models import TokenUser
+
+from core.testing import DATABASE_CACHES, get_process_caches
+from core.utils import revoke_user_tokens
+
+from .authentication import ClaimsJWTAuthentication
+from .models import UsernameCounter
+from .utils import (
+    GoogleOAuthUtils, create_user_with_generated_username,
+    generate_tokens_for_user, generate_username_from_email,
+)
+
+User = get_user_model()
+
+
+class GenerateUsernameTestCase(TestCase):
+    """Tests for `generate_username_from_email`"""
+
+    def test_allocates_increasing_suffixes(self):
+        usernames = [generate_username_from_email("ali@example.com") for _ in range(3)]
+        self.assertEqual(usernames, ["ali", "ali0", "ali1"])
+
+    def test_reserved_prefix_gets_suffix(self):
+        usernames = [generate_username_from_email("search@example.com") for _ in range(2)]
+        self.assertEqual(usernames, ["search0", "search1"])
+
+    def test_seeds_counter_from_existing_usernames(self):
+        for username in ["sara", "sara0", "sara4", "saral", "sarah1"]:
+            User.objects.create(username=username, email=f"{username}@example.com")
+        self.assertEqual(generate_username_from_email("sara@gmail.com"), "sara5")
+        self.assertEqual(UsernameCounter.objects.get(prefix="sara").next_suffix, 7)
+
+    def test_constant_queries(self):
+        for index in range(20):
+            User.objects.create(username=f"zara{index}", email=f"zara{index}@example.com")
+        generate_username_from_email("zara@example.com")
+        # Lock and increment, whatever the number of taken suffixes
+        with self.assertNumQueries(4):
+            generate_username_from_email("zara@example.com")
+
+
+class CreateUserWithGeneratedUsernameTestCase(TestCase):
+    """Tests for `create_user_with_generated_username`"""
+
+    def test_retries_taken_username(self):
+        generate_username_from_email("ali@example.com")
+        # Taken after the counter was seeded, e.g. by a regular sign-up
+        User.objects.create(username="ali0", email="other@example.com")
+        user, created = create_user_with_generated_username("ali@example.com")
+        self.assertTrue(created)
+        self.assertEqual(user.username, "ali1")
+
+    def test_returns_concurrently_created_user(self):
+        existing = User.objects.create(username="bilal", email="bilal@example.com")
+        user, created = create_user_with_generated_username("bilal@example.com")
+        self.assertFalse(created)
+        self.assertEqual(user, existing)
+
+
+class GoogleStubHandler(BaseHTTPRequestHandler):
+    """Local stand-in for Google's token and certs endpoints"""
+    requests = []
+    id_token = None
+    jwks = {"keys": []}
+
+    def send_json(self, data, headers=None):
+        body = json.dumps(data).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        GoogleStubHandler.requests.append(self.path)
+        self.send_json({"access_token": "access", "id_token": self.id_token})
+
+    def do_GET(self):
+        GoogleStubHandler.requests.append(self.path)
+        self.send_json(self.jwks, {"Cache-Control": "public, max-age=600"})
+
+    def log_message(self, *args):
+        pass
+
+
+class GoogleLoginAPIViewTestCase(TestCase):
+    """Tests for `GoogleLoginAPIView` against a local Google stub"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), GoogleStubHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        base_url = f"http://127.0.0.1:{cls.server.server_port}"
+        cls.settings = override_settings(
+            GOOGLE_OAUTH2_CLIENT_ID="client",
+            GOOGLE_OAUTH2_TOKEN_URL=f"{base_url}/token",
+            GOOGLE_OAUTH2_CERTS_URL=f"{base_url}/certs",
+            GOOGLE_OAUTH2_USER_INFO_URL=f"{base_url}/userinfo",
+        )
+        cls.settings.enable()
+        cls.private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        jwk = json.loads(jwt.algorithms.RSAAlgorithm.to_jwk(cls.private_key.public_key()))
+        GoogleStubHandler.jwks = {"keys": [dict(jwk, kid="key1", alg="RS256")]}
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.settings.disable()
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        GoogleOAuthUtils.clear_signing_keys()
+        GoogleStubHandler.requests = []
+        self.set_id_token()
+
+    def set_id_token(self, kid="key1", **claims):
+        claims = {
+            "iss": "https://accounts.google.com",
+            "aud": "client",
+            "exp": int(time.time()) + 300,
+            "email": "sara@gmail.com",
+            "email_verified": True,
+            "given_name": "Sara",
+            "family_name": "Khan",
+            **claims,
+        }
+        GoogleStubHandler.id_token = jwt.encode(
+            claims, self.private_key, algorithm="RS256", headers={"kid": kid}
+        )
+
+    def login(self):
+        return self.client.get(reverse("authentication:google"), {"code": "code"})
+
+    def test_verifies_id_token_locally(self):
+        response = self.login()
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("access_token", response.json())
+        user = User.objects.get(email="sara@gmail.com")
+        self.assertEqual((user.username, user.first_name), ("sara", "Sara"))
+        self.assertEqual(GoogleStubHandler.requests, ["/token", "/certs"])
+
+    def test_caches_signing_keys(self):
+        self.login()
+        self.login()
+        self.assertEqual(GoogleStubHandler.requests, ["/token", "/certs", "/token"])
+
+    def test_refreshes_keys_for_unknown_key_id(self):
+        self.login()
+        self.set_id_token(kid="key2")
+        self.assertEqual(self.login().status_code, 400)
+        self.assertEqual(GoogleStubHandler.requests[-2:], ["/token", "/certs"])
+
+    def test_rejects_invalid_tokens(self):
+        self.set_id_token(aud="other")
+        self.assertEqual(self.login().status_code, 400)
+        self.set_id_token(exp=int(time.time()) - 600)
+        self.assertEqual(self.login().status_code, 400)
+        self.set_id_token(iss="https://evil.example.com")
+        self.assertEqual(self.login().status_code, 400)
+        self.set_id_token(email_verified=False)
+        self.assertEqual(self.login().status_code, 400)
+        self.assertFalse(User.objects.exists())
+
+
+class ClaimsJWTAuthenticationTestCase(TestCase):
+    """Tests for `ClaimsJWTAuthentication`"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username="sara", email="sara@example.com")
+        cls.user.set_password("s3cure-Passw0rd")
+        cls.user.save()
+
+    def setUp(self):
+        cache.clear()
+        self.access_token, self.refresh_token = generate_tokens_for_user(self.user)
+
+    def authenticate(self, access_token):
+        request = RequestFactory().get("/", HTTP_AUTHORIZATION=f"Bearer {access_token}")
+        return ClaimsJWTAuthentication().authenticate(request)
+
+    def test_authenticates_without_queries(self):
+        self.authenticate(self.access_token)
+        with self.assertNumQueries(0):
+            user, _ = self.authenticate(self.access_token)
+        self.assertIsInstance(user, TokenUser)
+        self.assertEqual((user.id, user.username, user.is_staff), (self.user.id, "sara", False))
+
+    def test_login_signs_claims(self):
+        response = self.client.post(
+            reverse("authentication:login"),
+            {"username": "sara", "password": "s3cure-Passw0rd"},
+        )
+        user, _ = self.authenticate(response.json()["access"])
+        self.assertEqual(user.username, "sara")
+
+    def test_revoked_tokens_are_rejected(self):
+        self.authenticate(self.access_token)
+        revoke_user_tokens(self.user.id)
+        url = reverse("account:user_profile", args=["sara"])
+        response = self.client.get(url, HTTP_AUTHORIZATION=f"Bearer {self.access_token}")
+        self.assertEqual(response.status_code, 401)
+        response = self.client.post(
+            reverse("authentication:refresh"), {"refresh": self.refresh_token}
+        )
+        self.assertEqual(response.status_code, 401)
+        response = self.client.get(
+            reverse("authentication:me"), HTTP_AUTHORIZATION=f"Bearer {self.access_token}"
+        )
+        self.assertEqual(response.status_code, 401)
+
+    def test_claim_changes_revoke_tokens(self):
+        self.authenticate(self.access_token)
+        user = User.objects.get(id=self.user.id)
+        user.is_staff = True
+        user.save()
+        with self.assertRaisesMessage(AuthenticationFailed, "revoked"):
+            self.authenticate(self.access_token)
+        # Saving the instance again keeps the incremented version
+        access_token, _ = generate_tokens_for_user(user)
+        user.first_name = "Sara"
+        user.save()
+        self.assertTrue(self.authenticate(access_token)[0].is_staff)
+
+    @override_settings(CACHES=DATABASE_CACHES)
+    def test_revocations_reach_other_processes(self):
+        worker_cache, command_cache = get_process_caches()
+        with patch("core.utils.cache", worker_cache):
+            self.authenticate(self.access_token)
+        with patch("core.utils.cache", command_cache):
+            revoke_user_tokens(self.user.id)
+        with patch("core.utils.cache", worker_cache):
+            with self.assertRaisesMessage(AuthenticationFailed, "revoked"):
+                self.authenticate(self.access_token)
+
+    async def test_async_current_user(self):
+        url = reverse("authentication:me")
+        headers = {"Authorization": f"Bearer {self.access_token}"}
+        response = await self.async_client.get(url, headers=headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["email"], "sara@example.com")
+
+        response = await self.async_client.get(url)
+        self.assertEqual(response.status_code, 401)
+        await sync_to_async(revoke_user_tokens)(self.user.id)
+        response = await self.async_client.get(url, headers=headers)
+        self.assertEqual(response.status_code, 401)
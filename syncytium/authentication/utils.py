@@ -1,30 +1,82 @@
+import re
+import threading
+import time
+
+import jwt
 import requests
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ValidationError
-from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from django.db import IntegrityError, transaction
+
+from core.utils import is_reserved_username
+
+from .models import UsernameCounter
+from .serializers import ClaimsTokenObtainPairSerializer
 
 User = get_user_model()
 
+USERNAME_ALLOCATION_ATTEMPTS = 5
+
 
 class GoogleOAuthUtils:
-    """Utilities for Google OAuth2"""
+    """Utilities for Google OAuth2
 
-    class Constants:
-        GOOGLE_ID_TOKEN_INFO_URL = "https://www.googleapis.com/oauth2/v3/tokeninfo"
-        GOOGLE_ACCESS_TOKEN_OBTAIN_URL = "https://oauth2.googleapis.com/token"
-        GOOGLE_USER_INFO_URL = "https://www.googleapis.com/oauth2/v3/userinfo"
+    Operations:
+    - Requests go through one keep-alive session, with timeouts.
+    - The `id_token` returned with the access token is verified locally
+    against Google's signing keys, cached until they expire, so the user
+    info endpoint is only called when Google returns no `id_token`.
+    - The endpoints are read from the settings, so they can point to a
+    local stub.
+    """
+
+    _session = None
+    _signing_keys = {}
+    _signing_keys_expire_at = 0
+    _lock = threading.Lock()
 
     @classmethod
-    def get_access_token(cls, code, redirect_uri):
-        """Get access token from Google using the given code
-        
+    def get_session(cls):
+        """Get the pooled HTTP session, creating it on first use
+
+        Returns:
+            `requests.Session`: The session
+        """
+        if cls._session is None:
+            with cls._lock:
+                if cls._session is None:
+                    session = requests.Session()
+                    adapter = requests.adapters.HTTPAdapter(pool_maxsize=10, max_retries=1)
+                    session.mount("https://", adapter)
+                    session.mount("http://", adapter)
+                    cls._session = session
+        return cls._session
+
+    @classmethod
+    def request(cls, method, url, **kwargs):
+        """Send a request through the pooled session
+
+        Raises:
+        - `ValidationError`: If Google could not be reached.
+        """
+        try:
+            return cls.get_session().request(
+                method, url, timeout=settings.GOOGLE_OAUTH2_TIMEOUT, **kwargs
+            )
+        except requests.RequestException:
+            raise ValidationError("Failed to reach Google.")
+
+    @classmethod
+    def get_tokens(cls, code, redirect_uri):
+        """Exchange the given code for tokens
+
         Args:
             `code` (`str`): The code obtained from Google
             `redirect_uri` (`str`): The redirect URI used to obtain the code
 
         Returns:
-            `str`: The access token
+            `dict`: The token response, with `access_token` and `id_token`
         """
         data = {
             "code": code,
@@ -33,13 +85,23 @@ class GoogleOAuthUtils:
             "redirect_uri": redirect_uri,
             "grant_type": "authorization_code",
         }
-        response = requests.post(
-            cls.Constants.GOOGLE_ACCESS_TOKEN_OBTAIN_URL, data=data
-        )
+        response = cls.request("POST", settings.GOOGLE_OAUTH2_TOKEN_URL, data=data)
         if not response.ok:
             raise ValidationError("Failed to obtain access token from Google.")
-        access_token = response.json()["access_token"]
-        return access_token
+        return response.json()
+
+    @classmethod
+    def get_access_token(cls, code, redirect_uri):
+        """Get access token from Google using the given code
+        
+        Args:
+            `code` (`str`): The code obtained from Google
+            `redirect_uri` (`str`): The redirect URI used to obtain the code
+
+        Returns:
+            `str`: The access token
+        """
+        return cls.get_tokens(code, redirect_uri)["access_token"]
 
     @classmethod
     def get_user_info(cls, access_token):
@@ -51,13 +113,133 @@ class GoogleOAuthUtils:
         Returns:
             `dict`: The user info
         """
-        response = requests.get(
-            cls.Constants.GOOGLE_USER_INFO_URL, params={"access_token": access_token}
+        response = cls.request(
+            "GET",
+            settings.GOOGLE_OAUTH2_USER_INFO_URL,
+            params={"access_token": access_token},
         )
         if not response.ok:
             raise ValidationError("Failed to obtain user info from Google.")
         return response.json()
 
+    @classmethod
+    def get_signing_keys(cls, refresh=False):
+        """Get Google's signing keys by key ID.
+
+        Operations:
+        - The keys are cached for the `max-age` of the response, or
+        `GOOGLE_OAUTH2_CERTS_TTL` seconds.
+
+        Args:
+            `refresh` (`bool`): Whether to fetch the keys even if cached
+
+        Returns:
+            `dict`: The public keys by key ID
+        """
+        if not refresh and time.monotonic() < cls._signing_keys_expire_at:
+            return cls._signing_keys
+        with cls._lock:
+            if not refresh and time.monotonic() < cls._signing_keys_expire_at:
+                return cls._signing_keys
+            response = cls.request("GET", settings.GOOGLE_OAUTH2_CERTS_URL)
+            if not response.ok:
+                raise ValidationError("Failed to obtain signing keys from Google.")
+            cls._signing_keys = {
+                key["kid"]: jwt.PyJWK(key).key for key in response.json()["keys"]
+            }
+            max_age = re.search(r"max-age=(\d+)", response.headers.get("Cache-Control", ""))
+            ttl = int(max_age.group(1)) if max_age else settings.GOOGLE_OAUTH2_CERTS_TTL
+            cls._signing_keys_expire_at = time.monotonic() + ttl
+            return cls._signing_keys
+
+    @classmethod
+    def clear_signing_keys(cls):
+        """Forget the cached signing keys"""
+        with cls._lock:
+            cls._signing_keys = {}
+            cls._signing_keys_expire_at = 0
+
+    @classmethod
+    def verify_id_token(cls, id_token):
+        """Verify the given ID token and get its claims.
+
+        Operations:
+        - If the key ID is unknown, the keys are refreshed once, as Google
+        rotates them.
+        - The signature, audience, issuer and expiry are checked, and the
+        email must be verified.
+
+        Args:
+            `id_token` (`str`): The ID token obtained from Google
+
+        Returns:
+            `dict`: The claims, with the user info
+
+        Raises:
+        - `ValidationError`: If the token is invalid.
+        """
+        try:
+            kid = jwt.get_unverified_header(id_token).get("kid")
+            key = cls.get_signing_keys().get(kid)
+            if key is None:
+                key = cls.get_signing_keys(refresh=True).get(kid)
+            if key is None:
+                raise ValidationError("Unknown Google signing key.")
+            claims = jwt.decode(
+                id_token,
+                key,
+                algorithms=["RS256"],
+                audience=settings.GOOGLE_OAUTH2_CLIENT_ID,
+                options={"require": ["exp", "iss", "aud"]},
+                leeway=30,
+            )
+        except jwt.InvalidTokenError:
+            raise ValidationError("Invalid ID token from Google.")
+        if claims["iss"] not in settings.GOOGLE_OAUTH2_ISSUERS:
+            raise ValidationError("Invalid ID token from Google.")
+        if not claims.get("email_verified", False):
+            raise ValidationError("Google email is not verified.")
+        return claims
+
+    @classmethod
+    def get_user_data(cls, code, redirect_uri):
+        """Get the user info from Google using the given code
+
+        Args:
+            `code` (`str`): The code obtained from Google
+            `redirect_uri` (`str`): The redirect URI used to obtain the code
+
+        Returns:
+            `dict`: The user info, with `email`, `given_name` and `family_name`
+        """
+        tokens = cls.get_tokens(code, redirect_uri)
+        if "id_token" in tokens:
+            return cls.verify_id_token(tokens["id_token"])
+        return cls.get_user_info(tokens["access_token"])
+
+
+def get_next_username_suffix(prefix):
+    """Get the next free suffix for a prefix from the existing usernames.
+    Used once per prefix to seed its `UsernameCounter`.
+
+    Operations:
+    - The bare prefix is suffix 0, `{prefix}{n}` is suffix `n + 1`.
+
+    Args:
+        `prefix` (`str`): The username prefix
+
+    Returns:
+        `int`: The next suffix
+    """
+    usernames = User.objects.filter(
+        username__startswith=prefix, username__regex=rf"^{re.escape(prefix)}\d*$"
+    ).values_list("username", flat=True)
+    suffixes = [
+        int(username[len(prefix):]) + 1 if username != prefix else 0
+        for username in usernames
+    ]
+    return max(suffixes, default=-1) + 1
+
 
 def generate_username_from_email(email):
     """Generate a username from the given email
@@ -66,7 +248,9 @@ def generate_username_from_email(email):
     - The username is the prefix of the email address.
     - If the username already exists, append a suffix to the username.
     - The suffix is an integer starting from 0.
-    - The suffix is incremented until a unique username is found.
+    - Prefixes reserved by fixed routes always get a suffix.
+    - The next suffix of each prefix is kept in a `UsernameCounter`, locked
+    and incremented, so the cost does not grow with the taken suffixes.
     
     Args:
         `email` (`str`): The email address
@@ -75,12 +259,54 @@ def generate_username_from_email(email):
         `str`: The generated username
     """
     prefix = email.split("@")[0]
-    username = prefix
-    suffix = 0
-    while User.objects.filter(username=username).exists():
-        username = f"{prefix}{suffix}"
-        suffix += 1
-    return username
+    with transaction.atomic():
+        counter = UsernameCounter.objects.select_for_update() \
+            .filter(prefix=prefix).first()
+        if counter is None:
+            try:
+                with transaction.atomic():
+                    counter = UsernameCounter.objects.create(
+                        prefix=prefix, next_suffix=get_next_username_suffix(prefix)
+                    )
+            except IntegrityError:
+                # Seeded concurrently by another sign-up
+                counter = UsernameCounter.objects.select_for_update().get(prefix=prefix)
+        suffix = counter.next_suffix
+        if suffix == 0 and is_reserved_username(prefix):
+            suffix = 1
+        counter.next_suffix = suffix + 1
+        counter.save(update_fields=["next_suffix"])
+    return prefix if suffix == 0 else f"{prefix}{suffix - 1}"
+
+
+def create_user_with_generated_username(email, **fields):
+    """Create a user with a username generated from the given email.
+
+    Operations:
+    - Retry with the next username if it was taken in the meantime, e.g.
+    by a user registering with a chosen username.
+    - If a user with the same email was created concurrently, return it.
+
+    Args:
+        `email` (`str`): The email address
+        `**fields`: The other fields of the user
+
+    Returns:
+        `User`, `bool`: The user, and whether it was created
+
+    Raises:
+    - `ValidationError`: If no free username was found.
+    """
+    for _ in range(USERNAME_ALLOCATION_ATTEMPTS):
+        username = generate_username_from_email(email)
+        try:
+            with transaction.atomic():
+                return User.objects.create(username=username, email=email, **fields), True
+        except IntegrityError:
+            user = User.objects.filter(email=email).first()
+            if user:
+                return user, False
+    raise ValidationError("Failed to generate a username.")
 
 
 def get_error_message(exc):
@@ -99,7 +325,7 @@ def generate_tokens_for_user(user):
     """Generate access and refresh tokens for the given user.
 
     Operations:
-    - Use the `TokenObtainPairSerializer` to generate the tokens.
+    - Use the `ClaimsTokenObtainPairSerializer` to generate the tokens.
 
     Args:
         `user` (`User`): The user object
@@ -107,8 +333,7 @@ def generate_tokens_for_user(user):
     Returns:
         `str`, `str`: The access token and refresh token
     """
-    serializer = TokenObtainPairSerializer()
-    token_data = serializer.get_token(user)
+    token_data = ClaimsTokenObtainPairSerializer.get_token(user)
     access_token = token_data.access_token
     refresh_token = token_data
     return str(access_token), str(refresh_token)
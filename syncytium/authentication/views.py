@@ -20,8 +20,8 @@ from .mixins import ApiErrorsMixin, PublicApiMixin
 from .serializers import GoogleLoginInputSerializer
 from .utils import (
     GoogleOAuthUtils,
+    create_user_with_generated_username,
     generate_tokens_for_user,
-    generate_username_from_email,
 )
 
 User = get_user_model()
@@ -63,8 +63,7 @@ class GoogleLoginAPIView(APIView, ApiErrorsMixin, PublicApiMixin):
         redirect_uri = f"{settings.BASE_FRONTEND_URL}/google"
 
         try:
-            access_token = GoogleOAuthUtils.get_access_token(code, redirect_uri)
-            user_data = GoogleOAuthUtils.get_user_info(access_token)
+            user_data = GoogleOAuthUtils.get_user_data(code, redirect_uri)
         except ValidationError as e:
             return Response({"detail": str(e)}, HTTP_400_BAD_REQUEST)
 
@@ -72,20 +71,19 @@ class GoogleLoginAPIView(APIView, ApiErrorsMixin, PublicApiMixin):
         user = User.objects.filter(email=email).first()
 
         if not user:
-            username = generate_username_from_email(email)
             first_name = user_data.get("given_name", "")
             last_name = user_data.get("family_name", "")
 
-            user = User.objects.create(
-                username=username,
-                email=email,
+            user, created = create_user_with_generated_username(
+                email,
                 first_name=first_name,
                 last_name=last_name,
                 registration_method=RegistrationMethod.GOOGLE,
             )
-            send_registration_email.delay(user.id)
+            if created:
+                send_registration_email(user.id)
 
-        elif user.registration_method != RegistrationMethod.GOOGLE:
+        if user.registration_method != RegistrationMethod.GOOGLE:
             return Response({"detail": "Please login with password."}, HTTP_400_BAD_REQUEST)
 
         access_token, refresh_token = generate_tokens_for_user(user)
@@ -0,0 +1,9 @@
+from . import urls
+from .async_views import (
+    AsyncCityListAPIView, AsyncCountryListAPIView, with_async_views,
+)
+
+urlpatterns = with_async_views(urls.urlpatterns, {
+    "country/": AsyncCountryListAPIView,
+    r"^country/(?P<code>[A-Z]{3})/cities/$": AsyncCityListAPIView,
+})
@@ -0,0 +1,184 @@
+from asgiref.sync import sync_to_async
+from cities_light.models import City, Country
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.http import Http404, HttpResponse
+from django.urls import URLPattern
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.exceptions import (
+    APIException, AuthenticationFailed, NotAuthenticated, NotFound,
+)
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+
+from authentication.authentication import ClaimsJWTAuthentication
+
+from .autocomplete import get_city_index, get_country_index
+from .mixins import GeographyResponseCacheMixin
+from .paginators import KeysetPagination
+from .serializers import CitySerializer, CountrySerializer
+from .utils import aget_geography_version
+from .views import CityListAPIView, CountryListAPIView
+
+
+class AsyncAPIView(View):
+    """Base of the async views serving the read paths under ASGI, so a
+    worker holds no thread while waiting on slow clients or the database.
+
+    Operations:
+    - `GET` and `HEAD` requests are authenticated with `aauthenticate` and
+    handled by the async `get`, which reads with the async ORM.
+    - Other methods are delegated to `sync_view`, the DRF view of the same
+    route, in a thread.
+    - `APIException`s are rendered as DRF does.
+
+    Views must only rely on the token claims of `request.user`, see
+    `ClaimsJWTAuthentication`.
+    """
+    authentication_classes = [ClaimsJWTAuthentication]
+    authentication_required = False
+    sync_view = None
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        # Like DRF views, CSRF is left to the authentication classes
+        return csrf_exempt(super().as_view(**initkwargs))
+
+    async def dispatch(self, request, *args, **kwargs):
+        if request.method not in ("GET", "HEAD"):
+            if self.sync_view is None:
+                return await self.http_method_not_allowed(request, *args, **kwargs)
+            return await sync_to_async(self.sync_view)(request, *args, **kwargs)
+        request = Request(request)
+        try:
+            request.user = await self.authenticate(request)
+            return await self.get(request, *args, **kwargs)
+        except Http404:
+            return self.handle_exception(request, NotFound())
+        except APIException as exc:
+            return self.handle_exception(request, exc)
+
+    async def authenticate(self, request):
+        """Authenticate the request with the first matching authentication
+        class.
+
+        Raises:
+        - `NotAuthenticated`: If no class matches while
+        `authentication_required` is set.
+        """
+        for authentication_class in self.authentication_classes:
+            result = await authentication_class().aauthenticate(request)
+            if result is not None:
+                return result[0]
+        if self.authentication_required:
+            raise NotAuthenticated
+        return AnonymousUser()
+
+    def handle_exception(self, request, exc):
+        headers = {}
+        if isinstance(exc, (NotAuthenticated, AuthenticationFailed)):
+            if self.authentication_classes:
+                authenticator = self.authentication_classes[0]()
+                headers["WWW-Authenticate"] = authenticator.authenticate_header(request)
+            else:
+                exc.status_code = 403
+        if isinstance(exc.detail, (list, dict)):
+            data = exc.detail
+        else:
+            data = {"detail": exc.detail}
+        return self.render(data, status=exc.status_code, headers=headers)
+
+    def render(self, data, status=200, headers=None):
+        return HttpResponse(
+            JSONRenderer().render(data), status=status,
+            content_type="application/json", headers=headers,
+        )
+
+
+def with_async_views(urlpatterns, views):
+    """Copy URL patterns, serving some routes with async views in the same
+    order and under the same names.
+
+    Args:
+        `urlpatterns` (`list`): The URL patterns.
+        `views` (`dict`): The `AsyncAPIView` classes by route, given their
+        original view as `sync_view`.
+
+    Returns:
+        `list`: The URL patterns
+    """
+    patterns = []
+    for pattern in urlpatterns:
+        view_class = views.get(str(pattern.pattern))
+        if view_class is not None:
+            pattern = URLPattern(
+                pattern.pattern, view_class.as_view(sync_view=pattern.callback),
+                pattern.default_args, pattern.name,
+            )
+        patterns.append(pattern)
+    return patterns
+
+
+class AsyncGeographyListAPIView(GeographyResponseCacheMixin, AsyncAPIView):
+    """Async version of the `cities_light` list views, sharing their
+    response cache.
+
+    Preconditions:
+    - The view must implement `get_queryset` and `get_prefix_index`.
+    """
+    serializer_class = None
+    pagination_class = KeysetPagination
+    keyset_ordering = ("name", "id")
+    search_param = "search"
+
+    def get_queryset(self):
+        raise NotImplementedError
+
+    def get_prefix_index(self):
+        raise NotImplementedError
+
+    async def get(self, request, *args, **kwargs):
+        version = await aget_geography_version()
+        key = self.get_response_cache_key(request, version)
+        entry = await cache.aget(key)
+        if entry is None:
+            entry = self.get_cache_entry(await self.get_data(request))
+            await cache.aset(key, entry, self.cache_timeout)
+        return self.get_cached_response(request, entry, version)
+
+    async def get_data(self, request):
+        paginator = self.pagination_class()
+        query = request.query_params.get(self.search_param, "")
+        if query.strip():
+            # The prefix index lives in memory once built
+            index = await sync_to_async(self.get_prefix_index)()
+            results = index.search(query, paginator.get_limit(request))
+            return {"count": len(results), "next": None, "previous": None, "results": results}
+        rows = await paginator.apaginate_queryset(self.get_queryset(), request, self)
+        data = self.serializer_class(rows, many=True).data
+        return paginator.get_paginated_response(data).data
+
+
+class AsyncCountryListAPIView(AsyncGeographyListAPIView):
+    """Async version of `CountryListAPIView`"""
+    query_budget = CountryListAPIView.query_budget
+    serializer_class = CountrySerializer
+
+    def get_queryset(self):
+        return Country.objects.all()
+
+    def get_prefix_index(self):
+        return get_country_index()
+
+
+class AsyncCityListAPIView(AsyncGeographyListAPIView):
+    """Async version of `CityListAPIView`"""
+    query_budget = CityListAPIView.query_budget
+    serializer_class = CitySerializer
+
+    def get_queryset(self):
+        return City.objects.filter(country__code3=self.kwargs.get("code"))
+
+    def get_prefix_index(self):
+        return get_city_index(self.kwargs.get("code"))
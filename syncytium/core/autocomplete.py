@@ -0,0 +1,146 @@
+"""In-memory prefix indexes for the country and city autocomplete.
+
+The indexes are built lazily, once per process, from the `cities_light`
+tables, and rebuilt when the geography version changes, i.e. after the
+data is reimported by any process, as the version is kept in the shared
+cache.
+"""
+import heapq
+from bisect import bisect_left
+
+from cities_light.models import City, Country
+from django.conf import settings
+
+from .utils import LRUCache, get_geography_version, normalize_text
+
+# Prefixes up to this length match too many names to rank at query time,
+# so their best results are computed when the index is built.
+SHORT_PREFIX_LENGTH = 2
+MAX_RESULTS = 100
+
+
+class PrefixIndex:
+    """Sorted array of normalized names supporting ranked prefix search.
+
+    Every name is indexed by its full normalized form, and by each of its
+    later words with a lower rank, so `"york"` finds `"New York"`.
+    """
+
+    def __init__(self, items):
+        """Build the index.
+
+        Args:
+            `items` (`iterable`): `(id, name, population)` tuples.
+        """
+        entries = []
+        for id, name, population in items:
+            key = normalize_text(name)
+            if not key:
+                continue
+            words = key.split(" ")
+            for position in range(len(words)):
+                rank = (position > 0, -(population or 0), key, id)
+                entries.append((" ".join(words[position:]), rank, id, name))
+        entries.sort()
+        self.keys = [entry[0] for entry in entries]
+        self.ranks = [entry[1] for entry in entries]
+        self.results = [{"id": entry[2], "name": entry[3]} for entry in entries]
+        self.short_prefixes = {}
+        for prefix_length in range(1, SHORT_PREFIX_LENGTH + 1):
+            candidates = {}
+            for position, key in enumerate(self.keys):
+                candidates.setdefault(key[:prefix_length], []).append(position)
+            for prefix, positions in candidates.items():
+                self.short_prefixes[prefix] = self._rank(positions, MAX_RESULTS)
+
+    def search(self, query, limit=10):
+        """Find the best ranked names starting with the query.
+
+        Operations:
+        - Exact matches come first, then full name matches, then word
+        matches, each ordered by descending population.
+
+        Args:
+            `query` (`str`): The typed text, normalized before matching.
+            `limit` (`int`): The maximum number of results.
+
+        Returns:
+            `list`: `{"id", "name"}` dictionaries.
+        """
+        prefix = normalize_text(query)
+        if not prefix:
+            return []
+        limit = min(limit, MAX_RESULTS)
+        if prefix in self.short_prefixes:
+            positions = self.short_prefixes[prefix]
+        else:
+            start = bisect_left(self.keys, prefix)
+            end = bisect_left(self.keys, prefix + "\uffff", lo=start)
+            positions = range(start, end)
+        exact = [position for position in positions if self.keys[position] == prefix]
+        ranked = self._rank(exact, limit) + self._rank(positions, limit + len(exact))
+        results, seen = [], set()
+        for position in ranked:
+            result = self.results[position]
+            if result["id"] not in seen:
+                seen.add(result["id"])
+                results.append(result)
+                if len(results) == limit:
+                    break
+        return results
+
+    def _rank(self, positions, limit):
+        return heapq.nsmallest(limit, positions, key=self.ranks.__getitem__)
+
+
+# Bounded, as the city indexes are named after the requested codes
+_indexes = LRUCache(
+    maxsize=settings.PREFIX_INDEX_CACHE_SIZE, ttl=settings.PREFIX_INDEX_CACHE_TTL
+)
+
+
+def get_prefix_index(name, build):
+    """Get a named prefix index, building it if missing or outdated.
+
+    Args:
+        `name` (`str`): The name of the index.
+        `build` (`callable`): Returns the items of the index, or `None`
+        when there is no such index, e.g. for an unknown country.
+
+    Returns:
+        `PrefixIndex`: The index, empty and not kept when there is no
+        such index.
+    """
+    version = get_geography_version()
+    cached = _indexes.get(name)
+    if cached and cached[0] == version:
+        return cached[1]
+    items = build()
+    if items is None:
+        return PrefixIndex([])
+    index = PrefixIndex(items)
+    _indexes.set(name, (version, index))
+    return index
+
+
+def get_country_index():
+    """Get the prefix index of every country."""
+    return get_prefix_index(
+        "countries",
+        lambda: [(id, name, None) for id, name in Country.objects.values_list("id", "name")],
+    )
+
+
+def get_city_index(country_code):
+    """Get the prefix index of the cities of a country.
+
+    Args:
+        `country_code` (`str`): The ISO 3166-1 alpha-3 code of the country.
+    """
+    def build():
+        if not Country.objects.filter(code3=country_code).exists():
+            return None
+        return City.objects.filter(country__code3=country_code) \
+            .values_list("id", "name", "population")
+
+    return get_prefix_index(f"cities:{country_code}", build)
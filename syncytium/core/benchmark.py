@@ -0,0 +1,246 @@
+import random
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from decimal import Decimal
+
+import requests
+from cities_light.models import City, Country
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+
+from account.models import (
+    UserAddress, UserEducation, UserProfile, get_city_geo_cell,
+)
+from authentication.utils import generate_tokens_for_user
+
+User = get_user_model()
+
+PASSWORD = "b3nchmark-Passw0rd"
+COUNTRY_CODE = "BNC"
+SYLLABLES = ["la", "ka", "ra", "chi", "pur", "ab", "ad", "mul", "tan", "sar", "go", "dha"]
+
+
+class BenchmarkContext:
+    """The seeded data the scenarios pick their requests from"""
+
+    def __init__(self, users, tokens, city_ids, search_terms, run_id):
+        self.users = users
+        self.tokens = tokens
+        self.city_ids = city_ids
+        self.search_terms = search_terms
+        self.run_id = run_id
+
+    def get_user(self, index):
+        return self.users[index % len(self.users)]
+
+    def get_headers(self, username):
+        return {"Authorization": f"Bearer {self.tokens[username]}"}
+
+
+def seed(users=100, cities=500, seed=0):
+    """Seed the users, profiles, addresses and educations, and a country
+    with generated cities, the scenarios run against.
+
+    Returns:
+        `BenchmarkContext`: The seeded data
+    """
+    rng = random.Random(seed)
+    country = Country.objects.create(name="Benchland", code2="BN", code3=COUNTRY_CODE)
+    city_names = set()
+    while len(city_names) < cities:
+        name = "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+        city_names.add(name.capitalize())
+    City.objects.bulk_create(
+        City(
+            name=name, name_ascii=name, slug=name.lower(), display_name=name,
+            search_names=name.lower(), country=country,
+            population=rng.randint(1000, 10_000_000),
+            latitude=Decimal(rng.uniform(24, 36)).quantize(Decimal("0.00001")),
+            longitude=Decimal(rng.uniform(61, 77)).quantize(Decimal("0.00001")),
+        )
+        for name in sorted(city_names)
+    )
+    cities = list(
+        City.objects.filter(country=country).only("id", "latitude", "longitude")
+    )
+    city_ids = [city.id for city in cities]
+
+    # Hashing once keeps the seeding fast, logins still check the password
+    password = make_password(PASSWORD)
+    created = User.objects.bulk_create(
+        User(
+            username=f"bench{index}", email=f"bench{index}@example.com",
+            first_name="Bench", last_name=str(index), password=password,
+        )
+        for index in range(users)
+    )
+    UserProfile.objects.bulk_create(
+        UserProfile(user=user, bio=f"Benchmark user {user.last_name}") for user in created
+    )
+    addresses = []
+    for user in created:
+        city = rng.choice(cities)
+        # Bulk inserts skip `UserAddress.save`, which sets the cell
+        addresses.append(UserAddress(
+            user=user, country=country, city_id=city.id, geo_cell=get_city_geo_cell(city),
+        ))
+    UserAddress.objects.bulk_create(addresses)
+    UserEducation.objects.bulk_create(
+        UserEducation(
+            user=user, school=f"School {index}", degree="BSc", field_of_study="CS",
+            start_date=date(2000 + index, 9, 1),
+        )
+        for user in created
+        for index in range(3)
+    )
+    tokens = {user.username: generate_tokens_for_user(user)[0] for user in created}
+    search_terms = sorted({name[:rng.randint(1, 3)].lower() for name in city_names})
+    return BenchmarkContext(
+        users=[user.username for user in created],
+        tokens=tokens,
+        city_ids=city_ids,
+        search_terms=search_terms,
+        run_id=rng.randrange(10 ** 6),
+    )
+
+
+# Each scenario maps a request index to the `(method, path, kwargs)` to send
+
+def register(context, index):
+    username = f"new{context.run_id}x{index}"
+    return "POST", "/account/register/", {"json": {
+        "first_name": "New", "last_name": "User", "username": username,
+        "email": f"{username}@example.com", "password": PASSWORD,
+    }}
+
+
+def login(context, index):
+    return "POST", "/auth/login/", {"json": {
+        "username": context.get_user(index), "password": PASSWORD,
+    }}
+
+
+def profile_read(context, index):
+    viewer, owner = context.get_user(index), context.get_user(index + 1)
+    return "GET", f"/account/{owner}/profile/", {"headers": context.get_headers(viewer)}
+
+
+def profile_write(context, index):
+    username = context.get_user(index)
+    return "PATCH", f"/account/{username}/profile/", {
+        "json": {"bio": f"Updated {index}"}, "headers": context.get_headers(username),
+    }
+
+
+def address_read(context, index):
+    viewer, owner = context.get_user(index), context.get_user(index + 1)
+    return "GET", f"/account/{owner}/address/", {"headers": context.get_headers(viewer)}
+
+
+def address_write(context, index):
+    username = context.get_user(index)
+    city_id = context.city_ids[index % len(context.city_ids)]
+    return "PATCH", f"/account/{username}/address/", {
+        "json": {"city": city_id}, "headers": context.get_headers(username),
+    }
+
+
+def education_read(context, index):
+    viewer, owner = context.get_user(index), context.get_user(index + 1)
+    return "GET", f"/account/{owner}/education/", {"headers": context.get_headers(viewer)}
+
+
+def education_write(context, index):
+    username = context.get_user(index)
+    return "POST", f"/account/{username}/education/", {
+        "json": {
+            "school": f"School {index}", "degree": "MSc", "field_of_study": "CS",
+            "start_date": "2020-09-01",
+        },
+        "headers": context.get_headers(username),
+    }
+
+
+def city_search(context, index):
+    term = context.search_terms[index % len(context.search_terms)]
+    return "GET", f"/core/country/{COUNTRY_CODE}/cities/", {"params": {"search": term}}
+
+
+SCENARIOS = {
+    "register": register,
+    "login": login,
+    "profile_read": profile_read,
+    "profile_write": profile_write,
+    "address_read": address_read,
+    "address_write": address_write,
+    "education_read": education_read,
+    "education_write": education_write,
+    "city_search": city_search,
+}
+
+
+def get_query_counts(response):
+    """Get the query count and the database cache lookups among them, sent
+    by `QueryBudgetMiddleware` in the `Server-Timing` header.
+    """
+    header = response.headers.get("Server-Timing", "")
+    counts = (
+        re.search(rf'(?:^|, ){metric};[^,]*desc="(\d+) queries"', header)
+        for metric in ["db", "db-cache"]
+    )
+    return tuple(int(match.group(1)) if match else None for match in counts)
+
+
+def percentile(values, percent):
+    """Get the nearest-rank percentile of sorted values."""
+    if not values:
+        return None
+    rank = max(1, -(-len(values) * percent // 100))
+    return values[int(rank) - 1]
+
+
+def run_scenario(base_url, context, scenario, count, concurrency):
+    """Send `count` requests of a scenario from `concurrency` threads, each
+    with its own keep-alive session.
+
+    Returns:
+        `dict`: The latency percentiles in milliseconds, the throughput,
+        the errors and the mean queries per request, database cache
+        lookups included and also reported apart
+    """
+    local = threading.local()
+
+    def send(index):
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        method, path, kwargs = scenario(context, index)
+        started = time.perf_counter()
+        response = local.session.request(method, base_url + path, timeout=60, **kwargs)
+        latency = (time.perf_counter() - started) * 1000
+        return latency, response.status_code, *get_query_counts(response)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        results = list(pool.map(send, range(count)))
+    duration = time.perf_counter() - started
+
+    latencies = sorted(latency for latency, *_ in results)
+
+    def get_mean(values):
+        values = [value for value in values if value is not None]
+        return round(sum(values) / len(values), 2) if values else None
+
+    return {
+        "requests": count,
+        "errors": sum(1 for _, status, *_ in results if status >= 400),
+        "rps": round(count / duration, 1),
+        "p50": round(percentile(latencies, 50), 2),
+        "p95": round(percentile(latencies, 95), 2),
+        "p99": round(percentile(latencies, 99), 2),
+        "mean": round(sum(latencies) / len(latencies), 2),
+        "queries_per_request": get_mean(queries for *_, queries, _ in results),
+        "cache_queries_per_request": get_mean(queries for *_, queries in results),
+    }
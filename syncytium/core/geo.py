@@ -0,0 +1,125 @@
+"""Geohash cells and distances of coordinates.
+
+A geohash interleaves the bits of the longitude and latitude into base 32
+characters, so the points of a cell share the prefix of its hash. Rows
+storing the hash of their coordinates can then be looked up by cell with
+a range scan of an index on the hash.
+"""
+import math
+
+from django.db.models import F, FloatField, Value
+from django.db.models.functions import ASin, Cos, Least, Power, Radians, Sin, Sqrt
+
+BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+EARTH_RADIUS = 6371.0088  # kilometers, mean radius
+KM_PER_DEGREE = math.pi * EARTH_RADIUS / 180
+
+
+def encode_geohash(latitude, longitude, precision=9):
+    """Get the geohash of coordinates, e.g. `"ttsg7"` for Lahore at
+    precision 5, i.e. about 5 km.
+    """
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    latitude, longitude = float(latitude), float(longitude)
+    chars, bits, char, even = [], 0, 0, True
+    while len(chars) < precision:
+        value, interval = (longitude, lon_range) if even else (latitude, lat_range)
+        middle = (interval[0] + interval[1]) / 2
+        char <<= 1
+        if value >= middle:
+            char |= 1
+            interval[0] = middle
+        else:
+            interval[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(BASE32[char])
+            bits, char = 0, 0
+    return "".join(chars)
+
+
+def get_cell_size(precision):
+    """Get the `(latitude, longitude)` size in degrees of the cells of a
+    precision.
+    """
+    lat_bits = 5 * precision // 2
+    lon_bits = 5 * precision - lat_bits
+    return 180 / 2 ** lat_bits, 360 / 2 ** lon_bits
+
+
+def get_search_precision(latitude, radius, max_precision=9):
+    """Get the highest precision whose cells are at least `radius` km wide
+    and high around a latitude, so the cell of a point and its neighbours
+    cover the circle around it.
+
+    Returns:
+        `int`: The precision, `0` if even the largest cells are too small
+    """
+    # Cells narrow towards the poles, down to the farthest latitude
+    farthest = min(abs(float(latitude)) + radius / KM_PER_DEGREE, 90)
+    width_factor = max(math.cos(math.radians(farthest)), 1e-6)
+    for precision in range(max_precision, 0, -1):
+        lat_size, lon_size = get_cell_size(precision)
+        height = lat_size * KM_PER_DEGREE
+        width = lon_size * KM_PER_DEGREE * width_factor
+        if min(height, width) >= radius:
+            return precision
+    return 0
+
+
+def get_neighbour_cells(latitude, longitude, precision):
+    """Get the cell of coordinates and its up to 8 neighbours.
+
+    Returns:
+        `set`: The geohashes of the cells
+    """
+    lat_size, lon_size = get_cell_size(precision)
+    cells = set()
+    for lat_offset in (-1, 0, 1):
+        lat = float(latitude) + lat_offset * lat_size
+        if not -90 <= lat <= 90:
+            continue
+        for lon_offset in (-1, 0, 1):
+            # Longitudes wrap around the antimeridian
+            lon = (float(longitude) + lon_offset * lon_size + 180) % 360 - 180
+            cells.add(encode_geohash(lat, lon, precision))
+    return cells
+
+
+def get_prefix_range(prefix):
+    """Get the `[start, end)` range of the geohashes starting with a
+    prefix, `end` being `None` when unbounded. Only alphanumerics are
+    compared, so the range holds under any collation.
+    """
+    chars = list(prefix)
+    while chars:
+        index = BASE32.index(chars[-1])
+        if index + 1 < len(BASE32):
+            chars[-1] = BASE32[index + 1]
+            return prefix, "".join(chars)
+        chars.pop()
+    return prefix, None
+
+
+def get_distance_expression(latitude_field, longitude_field, latitude, longitude):
+    """Get the haversine distance in km between the coordinates of rows
+    and a point, computed by the database.
+
+    Args:
+        `latitude_field` (`str`): The field holding the latitude of the rows.
+        `longitude_field` (`str`): The field holding the longitude of the rows.
+        `latitude` (`float`): The latitude of the point.
+        `longitude` (`float`): The longitude of the point.
+
+    Returns:
+        `Func`: The expression
+    """
+    lat1 = Radians(F(latitude_field), output_field=FloatField())
+    lon1 = Radians(F(longitude_field), output_field=FloatField())
+    lat2 = Value(math.radians(float(latitude)), output_field=FloatField())
+    lon2 = Value(math.radians(float(longitude)), output_field=FloatField())
+    half_chord = Power(Sin((lat2 - lat1) / 2), 2) \
+        + Cos(lat1) * Cos(lat2) * Power(Sin((lon2 - lon1) / 2), 2)
+    # Rounding errors may push the chord slightly above 1
+    return 2 * EARTH_RADIUS * ASin(Sqrt(Least(half_chord, Value(1.0))))
@@ -0,0 +1,143 @@
+import json
+import subprocess
+from datetime import datetime, timezone
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.testcases import LiveServerThread
+from django.test.utils import override_settings
+
+from core.benchmark import SCENARIOS, run_scenario, seed
+from core.testing import background_tasks
+
+
+def get_commit():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+        dirty = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"],
+            cwd=settings.BASE_DIR, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    return f"{commit}-dirty" if dirty else commit
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the API against a freshly seeded test database. Each "
+        "scenario sends its requests through a local server at the given "
+        "concurrency, and the latency percentiles, throughput and queries "
+        "per request are written as JSON to compare runs across commits."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--scenarios", default=",".join(SCENARIOS),
+            help=f"Comma separated scenarios among {', '.join(SCENARIOS)}.",
+        )
+        parser.add_argument(
+            "--requests", type=int, default=200,
+            help="Number of requests per scenario.",
+        )
+        parser.add_argument(
+            "--concurrency", type=int, default=8,
+            help="Number of concurrent clients.",
+        )
+        parser.add_argument("--users", type=int, default=100, help="Users to seed.")
+        parser.add_argument("--cities", type=int, default=500, help="Cities to seed.")
+        parser.add_argument("--seed", type=int, default=0, help="Seed of the data.")
+        parser.add_argument(
+            "--output", default=None,
+            help="JSON file to write, benchmarks/<date>-<commit>.json by default.",
+        )
+        parser.add_argument(
+            "--compare", default=None,
+            help="JSON file of a previous run to compare with.",
+        )
+
+    def handle(self, *args, **options):
+        scenarios = options["scenarios"].split(",")
+        unknown = set(scenarios) - set(SCENARIOS)
+        if unknown:
+            raise CommandError(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+        test_settings = connection.settings_dict.setdefault("TEST", {})
+        if connection.vendor == "sqlite" and not test_settings.get("NAME"):
+            # The server threads need a database file rather than memory
+            test_settings["NAME"] = str(Path(settings.BASE_DIR) / "benchmark.sqlite3")
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        server = None
+        try:
+            # Without a broker, the tasks queued by the writes run in a
+            # background thread, out of the measured requests
+            with override_settings(
+                ALLOWED_HOSTS=["localhost", "127.0.0.1"],
+                QUERY_BUDGET_SAMPLE_RATE=1.0,
+                QUERY_BUDGET_SERVER_TIMING=True,
+            ), background_tasks() as tasks:
+                context = seed(options["users"], options["cities"], options["seed"])
+                server = LiveServerThread("localhost", static_handler=lambda handler: handler)
+                server.daemon = True
+                server.start()
+                server.is_ready.wait()
+                if server.error:
+                    raise server.error
+                base_url = f"http://localhost:{server.port}"
+                results = {}
+                for name in scenarios:
+                    results[name] = run_scenario(
+                        base_url, context, SCENARIOS[name],
+                        options["requests"], options["concurrency"],
+                    )
+                    self.stdout.write(self.format_result(name, results[name]))
+                    # The next scenario starts once the queued tasks ran
+                    tasks.join()
+        finally:
+            if server:
+                server.terminate()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        report = {
+            "commit": get_commit(),
+            "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "database": connection.vendor,
+            "requests": options["requests"],
+            "concurrency": options["concurrency"],
+            "users": options["users"],
+            "results": results,
+        }
+        output = Path(options["output"] or Path(settings.BASE_DIR) / "benchmarks" / (
+            f"{report['date'][:19].replace(':', '')}-{report['commit']}.json"
+        ))
+        output.parent.mkdir(parents=True, exist_ok=True)
+        output.write_text(json.dumps(report, indent=2))
+        self.stdout.write(self.style.SUCCESS(f"Results written to {output}"))
+        if options["compare"]:
+            self.compare(json.loads(Path(options["compare"]).read_text()), report)
+
+    def format_result(self, name, result):
+        return (
+            f"{name:<16} {result['rps']:>8.1f} req/s  p50 {result['p50']:>8.1f}ms  "
+            f"p95 {result['p95']:>8.1f}ms  p99 {result['p99']:>8.1f}ms  "
+            f"{result['queries_per_request'] or 0:>5.1f} queries "
+            f"({result['cache_queries_per_request'] or 0:.1f} cache)  "
+            f"{result['errors']} errors"
+        )
+
+    def compare(self, previous, report):
+        self.stdout.write(f"Compared with {previous['commit']}:")
+        for name, result in report["results"].items():
+            before = previous["results"].get(name)
+            if not before:
+                continue
+            self.stdout.write(
+                f"{name:<16} req/s {result['rps'] / before['rps'] - 1:+.0%}  "
+                f"p95 {result['p95'] / before['p95'] - 1:+.0%}  queries "
+                f"{before['queries_per_request']} -> {result['queries_per_request']}"
+            )
@@ -0,0 +1,40 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.utils import send_outbox_emails
+
+
+class Command(BaseCommand):
+    help = (
+        "Send the pending outbox emails in batches, reporting the throughput "
+        "of each batch. Point EMAIL_BACKEND, EMAIL_HOST, EMAIL_PORT and "
+        "EMAIL_USE_TLS at a local SMTP server to test the delivery."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size", type=int, default=None,
+            help="Maximum number of emails per batch.",
+        )
+        parser.add_argument(
+            "--loop", action="store_true",
+            help="Keep polling the outbox instead of exiting once it is drained.",
+        )
+        parser.add_argument(
+            "--interval", type=float, default=5.0,
+            help="Seconds to wait between polls when the outbox is empty.",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            stats = send_outbox_emails(options["batch_size"])
+            if stats["sent"] or stats["failed"]:
+                self.stdout.write(
+                    f"Batch: {stats['sent']} sent, {stats['failed']} failed in "
+                    f"{stats['duration']:.2f}s ({stats['per_second']:.1f} emails/s)"
+                )
+                continue
+            if not options["loop"]:
+                break
+            time.sleep(options["interval"])
@@ -0,0 +1,319 @@
+import logging
+import math
+import random
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+import jwt
+from asgiref.sync import (
+    iscoroutinefunction, markcoroutinefunction, sync_to_async,
+)
+from django.conf import settings
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIRequest
+from django.db import connections
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+from .routers import read_replica
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Raised when a request exceeds the query budget of its view while
+    `QUERY_BUDGET_ENFORCE` is set, e.g. in tests.
+    """
+
+
+class QueryBudget:
+    """The SQL budget of a view, declared as its `query_budget` attribute.
+
+    Args:
+        `queries` (`int`): The maximum number of queries per request.
+        `duplicates` (`int`): The maximum number of repeated queries, i.e.
+        executions of an already seen query fingerprint.
+        `db_time` (`float`): The maximum database time in milliseconds.
+    """
+
+    def __init__(self, queries=None, duplicates=0, db_time=None):
+        self.queries = queries
+        self.duplicates = duplicates
+        self.db_time = db_time
+
+    def get_violations(self, stats):
+        """Get the limits exceeded by the given `QueryStats`.
+
+        Returns:
+            `list`: The violation messages, empty within the budget.
+        """
+        violations = []
+        if self.queries is not None and stats.count > self.queries:
+            violations.append(f"{stats.count} queries > {self.queries}")
+        if self.duplicates is not None and stats.duplicate_count > self.duplicates:
+            violations.append(
+                f"{stats.duplicate_count} duplicated queries > {self.duplicates}"
+            )
+        if self.db_time is not None and stats.db_time > self.db_time:
+            violations.append(f"{stats.db_time:.1f}ms DB time > {self.db_time}ms")
+        return violations
+
+
+def get_cache_tables():
+    """Get the tables of the database caches in `CACHES`, whose queries are
+    cache lookups rather than queries of the views.
+    """
+    return [
+        options["LOCATION"] for options in settings.CACHES.values()
+        if options["BACKEND"].endswith(".DatabaseCache")
+    ]
+
+
+class QueryStats:
+    """The queries executed while handling a request.
+
+    The lookups of database caches are queries too, so they are counted,
+    and also reported as `cache_count`. They are left out of the
+    fingerprints, as repeated cache lookups are not duplicated queries of
+    the view.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.cache_count = 0
+        self.db_time = 0.0  # milliseconds
+        self.fingerprints = Counter()
+        self.cache_tables = get_cache_tables()
+
+    @staticmethod
+    def get_fingerprint(sql):
+        """Get the shape of a query, ignoring its parameters and the length
+        of its `IN` lists.
+        """
+        sql = re.sub(r"\s+", " ", sql)
+        return re.sub(r"\((?:%s, )+%s\)", "(%s, ...)", sql)
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += (time.perf_counter() - started) * 1000
+            self.count += 1
+            if any(table in sql for table in self.cache_tables):
+                self.cache_count += 1
+            else:
+                self.fingerprints[self.get_fingerprint(sql)] += 1
+
+    @property
+    def duplicates(self):
+        """The fingerprints executed more than once, with their counts"""
+        return {sql: count for sql, count in self.fingerprints.items() if count > 1}
+
+    @property
+    def duplicate_count(self):
+        return sum(count - 1 for count in self.duplicates.values())
+
+
+def get_query_budget(resolver_match):
+    """Get the `query_budget` declared by the view of a resolved URL."""
+    if resolver_match is None:
+        return None
+    func = resolver_match.func
+    view_class = getattr(func, "cls", None) or getattr(func, "view_class", None)
+    return getattr(view_class, "query_budget", None) \
+        or getattr(func, "query_budget", None)
+
+
+class QueryBudgetMiddleware:
+    """Middleware recording the SQL queries of each request and checking
+    them against the `query_budget` of the view.
+
+    Operations:
+    - A `QUERY_BUDGET_SAMPLE_RATE` share of the requests is recorded, all of
+    them while `QUERY_BUDGET_ENFORCE` is set.
+    - The query count, DB time and duplicated query fingerprints are kept
+    on the response as `query_stats`, and sent in the `Server-Timing`
+    header in debug mode or with `QUERY_BUDGET_SERVER_TIMING`, with the
+    share of database cache lookups as a separate `db-cache` metric.
+    - Violations are logged with the resolved URL name, or raised as
+    `QueryBudgetExceeded` while `QUERY_BUDGET_ENFORCE` is set.
+
+    Under ASGI, the async ORM runs queries in the thread of the request,
+    where the connections of recorded requests are wrapped.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.is_sampled():
+            return self.get_response(request)
+
+        stats = QueryStats()
+        with ExitStack() as stack:
+            self.wrap_connections(stack, stats)
+            response = self.get_response(request)
+        return self.check_budget(request, response, stats)
+
+    async def __acall__(self, request):
+        if not self.is_sampled():
+            return await self.get_response(request)
+
+        stats = QueryStats()
+        stack = ExitStack()
+        await sync_to_async(self.wrap_connections)(stack, stats)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+        return self.check_budget(request, response, stats)
+
+    def is_sampled(self):
+        return settings.QUERY_BUDGET_ENFORCE \
+            or random.random() < settings.QUERY_BUDGET_SAMPLE_RATE
+
+    def wrap_connections(self, stack, stats):
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(stats))
+
+    def check_budget(self, request, response, stats):
+        enforce = settings.QUERY_BUDGET_ENFORCE
+        response.query_stats = stats
+        if settings.DEBUG or settings.QUERY_BUDGET_SERVER_TIMING:
+            response["Server-Timing"] = (
+                f'db;dur={stats.db_time:.1f};desc="{stats.count} queries", '
+                f'db-cache;desc="{stats.cache_count} queries"'
+            )
+
+        budget = get_query_budget(getattr(request, "resolver_match", None))
+        violations = budget.get_violations(stats) if budget else []
+        if violations:
+            url_name = request.resolver_match.view_name
+            message = f"Query budget exceeded by {url_name}: {', '.join(violations)}"
+            if enforce:
+                duplicates = "\n".join(
+                    f"{count}x {sql}" for sql, count in stats.duplicates.items()
+                )
+                raise QueryBudgetExceeded(f"{message}\n{duplicates}".strip())
+            logger.warning(
+                message,
+                extra={
+                    "url_name": url_name,
+                    "queries": stats.count,
+                    "cache_queries": stats.cache_count,
+                    "db_time": stats.db_time,
+                    "duplicates": stats.duplicates,
+                },
+            )
+        return response
+
+
+class AsyncURLConfMiddleware:
+    """Middleware routing the ASGI requests through `ASGI_URLCONF`, whose
+    read paths are served by async views, see `core.async_views`.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if isinstance(request, ASGIRequest) and settings.ASGI_URLCONF:
+            request.urlconf = settings.ASGI_URLCONF
+        return self.get_response(request)
+
+
+class ReplicaRoutingMiddleware:
+    """Middleware sending the reads of safe requests to a read replica,
+    see `core.routers.ReplicaRouter`.
+
+    Operations:
+    - Each safe request reads from one replica picked at random, so its
+    reads are consistent with each other.
+    - Clients that wrote within the last `DATABASE_REPLICA_LAG` seconds
+    read from the primary, so they see their own writes. They are
+    recognized by a cookie set on their writes, and by the user of their
+    access token.
+    """
+    sync_capable = True
+    async_capable = True
+    cookie_name = "primary_until"
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not settings.DATABASE_REPLICAS:
+            return self.get_response(request)
+        token = read_replica.set(self.get_replica(request))
+        try:
+            response = self.get_response(request)
+        finally:
+            read_replica.reset(token)
+        return self.pin_writer(request, response)
+
+    async def __acall__(self, request):
+        if not settings.DATABASE_REPLICAS:
+            return await self.get_response(request)
+        # Context variables follow the request into the ORM threads
+        token = read_replica.set(await sync_to_async(self.get_replica)(request))
+        try:
+            response = await self.get_response(request)
+        finally:
+            read_replica.reset(token)
+        return await sync_to_async(self.pin_writer)(request, response)
+
+    def get_replica(self, request):
+        """Get the replica the request reads from, `None` for the primary."""
+        if request.method not in SAFE_METHODS or self.cookie_name in request.COOKIES:
+            return None
+        user_id = self.get_token_user_id(request)
+        if user_id is not None and cache.get(get_primary_cache_key(user_id)):
+            return None
+        return random.choice(settings.DATABASE_REPLICAS)
+
+    def pin_writer(self, request, response):
+        """Keep the client of a write on the primary for the replica lag."""
+        if request.method in SAFE_METHODS:
+            return response
+        lag = settings.DATABASE_REPLICA_LAG
+        response.set_cookie(
+            self.cookie_name, "1", max_age=math.ceil(lag), httponly=True, samesite="Lax"
+        )
+        user_id = self.get_token_user_id(request)
+        if user_id is not None:
+            cache.set(get_primary_cache_key(user_id), True, lag)
+        return response
+
+    def get_token_user_id(self, request):
+        """Get the user of the access token, unverified as it only decides
+        where the request reads from.
+        """
+        parts = request.headers.get("Authorization", "").split()
+        if len(parts) != 2 or parts[0] != "Bearer":
+            return None
+        try:
+            claims = jwt.decode(parts[1], options={"verify_signature": False})
+        except jwt.PyJWTError:
+            return None
+        return claims.get(jwt_settings.USER_ID_CLAIM)
+
+
+def get_primary_cache_key(user_id):
+    return f"replica:primary:{user_id}"
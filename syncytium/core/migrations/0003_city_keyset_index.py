@@ -0,0 +1,19 @@
+# Generated by Django 5.0.4 on 2026-10-18 12:10
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cities_light', '0011_alter_city_country_alter_city_region_and_more'),
+        ('core', '0002_friendship_userconnection'),
+    ]
+
+    operations = [
+        # Backs the keyset pagination of the cities of a country
+        migrations.RunSQL(
+            sql='CREATE INDEX core_city_country_name_id ON cities_light_city (country_id, name, id)',
+            reverse_sql='DROP INDEX core_city_country_name_id',
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.0.4 on 2026-10-18 13:39
+
+import django.db.models.functions.comparison
+from django.db import migrations, models
+from django.db.models import F
+
+
+def delete_reversed_friendships(apps, schema_editor):
+    """Delete the rows whose pair also has a row in the other direction,
+    keeping the accepted one, or the oldest one when both have the same
+    status.
+    """
+    Friendship = apps.get_model("core", "Friendship")
+    reversed_pairs = Friendship.objects \
+        .filter(from_user_id__gt=F("to_user_id")) \
+        .values_list("id", "from_user_id", "to_user_id", "status")
+    for friendship_id, from_user_id, to_user_id, status in reversed_pairs.iterator():
+        other = Friendship.objects \
+            .filter(from_user_id=to_user_id, to_user_id=from_user_id) \
+            .values_list("id", "status").first()
+        if not other:
+            continue
+        other_id, other_status = other
+        keep_other = (other_status == "AC", -other_id) >= (status == "AC", -friendship_id)
+        Friendship.objects.filter(id=friendship_id if keep_other else other_id).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_outboxemail_claimed_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_reversed_friendships, migrations.RunPython.noop),
+        migrations.RemoveConstraint(
+            model_name='friendship',
+            name='unique_friendship',
+        ),
+        migrations.AddConstraint(
+            model_name='friendship',
+            constraint=models.UniqueConstraint(django.db.models.functions.comparison.Least('from_user', 'to_user'), django.db.models.functions.comparison.Greatest('from_user', 'to_user'), name='unique_friendship'),
+        ),
+    ]
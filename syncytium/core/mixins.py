@@ -0,0 +1,84 @@
+import hashlib
+from urllib.parse import urlencode
+
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from .utils import get_geography_version
+
+
+class PrefixSearchListMixin:
+    """Mixin for list views that serves the `search` query parameter from
+    an in-memory prefix index instead of scanning the table.
+
+    Preconditions:
+    - The view must implement `get_prefix_index`.
+    - The view's paginator must implement `get_limit`.
+    """
+    search_param = "search"
+
+    def get_prefix_index(self):
+        raise NotImplementedError
+
+    def list(self, request, *args, **kwargs):
+        query = request.query_params.get(self.search_param, "")
+        if not query.strip():
+            return super().list(request, *args, **kwargs)
+        limit = self.paginator.get_limit(request)
+        results = self.get_prefix_index().search(query, limit)
+        return Response(
+            {"count": len(results), "next": None, "previous": None, "results": results}
+        )
+
+
+class GeographyResponseCacheMixin:
+    """Mixin for list views over `cities_light` data that caches the
+    rendered JSON body per query string, and answers conditional requests.
+
+    Operations:
+    - Cache entries are keyed by the geography version, so they are only
+    invalidated when `cities_light` rows change.
+    - Responses carry a strong `ETag` and a `Last-Modified` date, and a
+    `304 Not Modified` is returned when the client copy is still fresh.
+    """
+    cache_max_age = 60 * 60  # seconds
+    cache_timeout = 60 * 60 * 24  # seconds
+
+    def get_response_cache_key(self, request, version):
+        query = urlencode(sorted(request.query_params.lists()), doseq=True)
+        url = f"{request.build_absolute_uri(request.path)}?{query}"
+        digest = hashlib.sha256(url.encode()).hexdigest()
+        return f"geography:response:{version}:{digest}"
+
+    def list(self, request, *args, **kwargs):
+        version = get_geography_version()
+        key = self.get_response_cache_key(request, version)
+        entry = cache.get(key)
+        if entry is None:
+            response = super().list(request, *args, **kwargs)
+            entry = self.get_cache_entry(response.data)
+            cache.set(key, entry, self.cache_timeout)
+        return self.get_cached_response(request, entry, version)
+
+    def get_cache_entry(self, data):
+        """Render the data of a response.
+
+        Returns:
+            `tuple`: The JSON body and its `ETag`
+        """
+        body = JSONRenderer().render(data)
+        return body, f'"{hashlib.sha256(body).hexdigest()}"'
+
+    def get_cached_response(self, request, entry, version):
+        body, etag = entry
+        response = HttpResponse(body, content_type="application/json")
+        response["ETag"] = etag
+        response["Last-Modified"] = http_date(version)
+        patch_cache_control(response, public=True, max_age=self.cache_max_age)
+        return get_conditional_response(
+            request, etag=etag, last_modified=int(version), response=response
+        )
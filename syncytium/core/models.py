@@ -1,10 +1,90 @@
+import copy
+import hashlib
+import secrets
+from datetime import timedelta
+
 from django.conf import settings
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.db import models, transaction
+from django.db.models.functions import Greatest, Least
 from django.utils import timezone
 
 
-class TimeStampedModel(models.Model):
+class ChangeTrackingModel(models.Model):
+    """Abstract model that tracks the fields changed since the instance was
+    loaded, so that saves only `UPDATE` the changed columns.
+
+    Details:
+    * Saving an unchanged instance writes nothing.
+    * Fields with `auto_now` are updated along with the changed fields.
+    * Explicit `update_fields` are respected.
+    """
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._snapshot_fields()
+        return instance
+
+    def _snapshot_fields(self, fields=None):
+        """Remember the current values of the given, or all loaded, fields"""
+        if fields is None:
+            self._loaded_values = {}
+        for field in self._meta.concrete_fields:
+            if fields is not None and field.name not in fields:
+                continue
+            if field.attname in self.__dict__:
+                self._loaded_values[field.attname] = \
+                    copy.deepcopy(self.__dict__[field.attname])
+
+    def get_dirty_fields(self):
+        """Get the names of the fields changed since the instance was loaded
+        or saved.
+
+        Returns:
+            `set`: The changed field names, all of them for a new instance.
+        """
+        loaded_values = getattr(self, "_loaded_values", None)
+        if self._state.adding or loaded_values is None:
+            return {field.name for field in self._meta.concrete_fields}
+        return {
+            field.name
+            for field in self._meta.concrete_fields
+            if field.attname in self.__dict__
+            and (
+                field.attname not in loaded_values
+                or loaded_values[field.attname] != self.__dict__[field.attname]
+            )
+        }
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get("update_fields")
+        if (
+            update_fields is None
+            and not self._state.adding
+            and not kwargs.get("force_insert")
+            and getattr(self, "_loaded_values", None) is not None
+        ):
+            update_fields = self.get_dirty_fields()
+            if not update_fields:
+                return
+            update_fields |= {
+                field.name for field in self._meta.concrete_fields
+                if getattr(field, "auto_now", False)
+            }
+            kwargs["update_fields"] = update_fields
+        super().save(*args, **kwargs)
+        self._snapshot_fields(None if update_fields is None else set(update_fields))
+
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        super().refresh_from_db(using, fields, **kwargs)
+        self._snapshot_fields(None if fields is None else set(fields))
+
+
+class TimeStampedModel(ChangeTrackingModel):
     """Abstract model that provides self-updating `created` and 
     `modified` fields.
     """
@@ -27,16 +107,34 @@ class User(AbstractUser):
     Details:
     * Overrides the email field and sets it as unique.
     * Adds a registration method field.
+    * Adds a token version, signed into the access tokens, incremented to
+    revoke them.
+    * Remembers the stored values of the `CLAIM_FIELDS`, whose changes
+    revoke the tokens, see `core.signals`.
     """
+    # The fields the tokens are checked against without loading the user,
+    # signed into them or checked with their version
+    CLAIM_FIELDS = ("username", "is_staff", "is_active")
+
     email = models.EmailField(unique=True, blank=False, null=False)
     registration_method = models.CharField(
         choices=RegistrationMethod.choices,
         default=RegistrationMethod.EMAIL,
         max_length=2,
     )
+    token_version = models.PositiveIntegerField(default=0)
 
     def __str__(self):
         return self.username
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored claims so that their changes can be detected
+        instance._loaded_claims = {
+            field: instance.__dict__.get(field) for field in cls.CLAIM_FIELDS
+        }
+        return instance
     
 
 class Privacy(models.TextChoices):
@@ -48,35 +146,402 @@ class Privacy(models.TextChoices):
     PRIVATE = "PR", "Private"
 
 
-class PrivatizedModel(models.Model):
-    """Abstract model that adds privacy setting to a model through 
+class PrivatizedQuerySet(models.QuerySet):
+    """QuerySet for models extending `PrivatizedModel`.
+
+    Assumes the concrete model has a `user` field pointing at the owner.
+    """
+
+    def visible_to(self, viewer):
+        """Filter the rows the given viewer is allowed to see.
+
+        Operations:
+        - Anonymous viewers only see public rows.
+        - Owners see all of their own rows.
+        - Custom rows are visible if the viewer is one of the `custom_people`.
+        - Friends and friends of friends rows are visible if the viewer has
+        a matching `UserConnection` to the owner.
+
+        The whole check compiles into a single `WHERE` clause, the custom
+        audience and the connections being `EXISTS` subqueries.
+
+        Args:
+            `viewer` (`User`): The user viewing the rows, may be anonymous.
+
+        Returns:
+            `PrivatizedQuerySet`: The filtered queryset.
+        """
+        if viewer is None or not viewer.is_authenticated:
+            return self.filter(privacy=Privacy.PUBLIC)
+
+        through = self.model.custom_people.through
+        source_field = self.model.custom_people.field.m2m_field_name()
+        is_custom_person = models.Exists(
+            through.objects.filter(
+                **{f"{source_field}_id": models.OuterRef("pk"), "user_id": viewer.id}
+            )
+        )
+        connection = UserConnection.objects.filter(
+            user_id=viewer.id, other_id=models.OuterRef("user_id")
+        )
+        is_friend = models.Exists(connection.filter(is_friend=True))
+        is_friend_of_friend = models.Exists(
+            connection.filter(models.Q(is_friend=True) | models.Q(mutual_friends__gt=0))
+        )
+        return self.filter(
+            models.Q(user_id=viewer.id)
+            | models.Q(privacy=Privacy.PUBLIC)
+            | (models.Q(privacy=Privacy.FRIENDS) & is_friend)
+            | (models.Q(privacy=Privacy.FRIENDS_OF_FRIENDS) & is_friend_of_friend)
+            | (models.Q(privacy=Privacy.CUSTOM) & is_custom_person)
+        )
+
+
+class PrivatizedModel(ChangeTrackingModel):
+    """Abstract model that adds privacy setting to a model through
     `privacy` field.
     """
     privacy = models.CharField(choices=Privacy.choices, default=Privacy.PUBLIC, max_length=2)
     custom_people = models.ManyToManyField(to=User, blank=True)
 
+    objects = PrivatizedQuerySet.as_manager()
+
     class Meta:
         abstract = True
 
     def save(self, *args, **kwargs):
+        # The custom audience is dropped once the privacy moves away from
+        # custom, other saves leave it untouched
+        loaded_values = getattr(self, "_loaded_values", None) or {}
+        was_custom = not self._state.adding \
+            and loaded_values.get("privacy") == Privacy.CUSTOM
         super().save(*args, **kwargs)
-        if self.privacy != Privacy.CUSTOM:
+        if was_custom and self.privacy != Privacy.CUSTOM:
             self.custom_people.clear()
 
 
+class FriendshipStatus(models.TextChoices):
+    """Choices for the friendship status"""
+    PENDING = "PE", "Pending"
+    ACCEPTED = "AC", "Accepted"
+
+
+class FriendshipQuerySet(models.QuerySet):
+    """QuerySet for the `Friendship` model"""
+
+    def between(self, user_id, other_id):
+        """Filter the friendship between two users, in either direction."""
+        return self.filter(
+            models.Q(from_user_id=user_id, to_user_id=other_id)
+            | models.Q(from_user_id=other_id, to_user_id=user_id)
+        )
+
+    def are_friends(self, user_id, other_id):
+        """Check if two users have an accepted friendship."""
+        return self.between(user_id, other_id) \
+            .filter(status=FriendshipStatus.ACCEPTED).exists()
+
+
+class Friendship(TimeStampedModel):
+    """This model stores friend requests between users. The request
+    becomes a friendship once accepted. Only one row exists per pair
+    of users, pointing from the user who sent the request, which the
+    unordered `unique_friendship` constraint enforces.
+    """
+    from_user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="sent_friendships"
+    )
+    to_user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="received_friendships"
+    )
+    status = models.CharField(
+        choices=FriendshipStatus.choices,
+        default=FriendshipStatus.PENDING,
+        max_length=2,
+    )
+
+    objects = FriendshipQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                Least("from_user", "to_user"), Greatest("from_user", "to_user"),
+                name="unique_friendship",
+            ),
+            models.CheckConstraint(
+                check=~models.Q(from_user=models.F("to_user")),
+                name="no_self_friendship",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.from_user_id} -> {self.to_user_id} ({self.get_status_display()})"
+
+
+class UserConnectionQuerySet(models.QuerySet):
+    """QuerySet for the `UserConnection` model"""
+
+    def get_tier(self, viewer, owner_id):
+        """Get the strictest privacy level the viewer passes for the owner.
+
+        Operations:
+        - The owner passes every level, `PRIVATE` included.
+        - Friends pass `FRIENDS`, friends of friends pass `FRIENDS_OF_FRIENDS`.
+        - Everyone else only passes `PUBLIC`.
+
+        Args:
+            `viewer` (`User`): The user viewing, may be anonymous.
+            `owner_id` (`int`): The ID of the owner.
+
+        Returns:
+            `Privacy`: The privacy tier of the viewer.
+        """
+        if viewer is None or not viewer.is_authenticated:
+            return Privacy.PUBLIC
+        if viewer.id == owner_id:
+            return Privacy.PRIVATE
+        connection = self.filter(user_id=viewer.id, other_id=owner_id) \
+            .values_list("is_friend", "mutual_friends").first()
+        if not connection:
+            return Privacy.PUBLIC
+        is_friend, mutual_friends = connection
+        if is_friend:
+            return Privacy.FRIENDS
+        if mutual_friends:
+            return Privacy.FRIENDS_OF_FRIENDS
+        return Privacy.PUBLIC
+
+    def friend_ids(self, user_id):
+        """Get the IDs of the friends of a user."""
+        return list(
+            self.filter(user_id=user_id, is_friend=True)
+            .values_list("other_id", flat=True)
+        )
+
+    def link(self, user_id, friend_id):
+        """Add a friendship edge to the graph.
+
+        Operations:
+        - Lock both users, see `_lock_users`.
+        - Mark both directions of the pair as friends.
+        - Every friend of one user gains a mutual friend with the other.
+
+        Args:
+            `user_id` (`int`): The ID of the first user.
+            `friend_id` (`int`): The ID of the second user.
+
+        Returns:
+            `bool`: `False` if the users were already linked.
+        """
+        with transaction.atomic():
+            self._lock_users(user_id, friend_id)
+            pair = self.get_or_create(user_id=user_id, other_id=friend_id)[0]
+            if pair.is_friend:
+                return False
+            self.get_or_create(user_id=friend_id, other_id=user_id)
+            user_friends = self.friend_ids(user_id)
+            friend_friends = self.friend_ids(friend_id)
+            self._between(user_id, friend_id).update(is_friend=True)
+            self._shift_mutual_friends(user_id, friend_friends, 1)
+            self._shift_mutual_friends(friend_id, user_friends, 1)
+        return True
+
+    def unlink(self, user_id, friend_id):
+        """Remove a friendship edge from the graph.
+
+        Operations:
+        - Lock both users, see `_lock_users`.
+        - Unmark both directions of the pair as friends.
+        - Every friend of one user loses a mutual friend with the other.
+        - Drop the pairs left with neither a friendship nor mutual friends.
+
+        Args:
+            `user_id` (`int`): The ID of the first user.
+            `friend_id` (`int`): The ID of the second user.
+
+        Returns:
+            `bool`: `False` if the users were not linked.
+        """
+        with transaction.atomic():
+            self._lock_users(user_id, friend_id)
+            pair = self.filter(user_id=user_id, other_id=friend_id, is_friend=True).first()
+            if not pair:
+                return False
+            self._between(user_id, friend_id).update(is_friend=False)
+            user_friends = self.friend_ids(user_id)
+            friend_friends = self.friend_ids(friend_id)
+            self._shift_mutual_friends(user_id, friend_friends, -1)
+            self._shift_mutual_friends(friend_id, user_friends, -1)
+            user_ids = [user_id, friend_id]
+            self.filter(
+                models.Q(user_id__in=user_ids) | models.Q(other_id__in=user_ids),
+                is_friend=False,
+                mutual_friends=0,
+            ).delete()
+        return True
+
+    def _lock_users(self, user_id, friend_id):
+        """Lock the rows of both users, in ID order so that concurrent
+        calls cannot deadlock. Every change of a user's friends takes the
+        lock of the user, so the friends read afterwards stay current until
+        the transaction ends.
+        """
+        list(
+            User.objects.select_for_update()
+            .filter(id__in=[user_id, friend_id]).order_by("id")
+            .values_list("id", flat=True)
+        )
+
+    def _between(self, user_id, other_id):
+        return self.filter(
+            models.Q(user_id=user_id, other_id=other_id)
+            | models.Q(user_id=other_id, other_id=user_id)
+        )
+
+    def _shift_mutual_friends(self, user_id, other_ids, delta):
+        """Add `delta` to the mutual friends count of the pairs between
+        the user and each of the others, in both directions.
+        """
+        if not other_ids:
+            return
+        pairs = self.filter(
+            models.Q(user_id=user_id, other_id__in=other_ids)
+            | models.Q(user_id__in=other_ids, other_id=user_id)
+        )
+        existing = set(pairs.values_list("user_id", "other_id"))
+        pairs.update(mutual_friends=models.F("mutual_friends") + delta)
+        if delta < 0:
+            return
+        missing = []
+        for other_id in other_ids:
+            for pair in ((user_id, other_id), (other_id, user_id)):
+                if pair not in existing:
+                    missing.append(
+                        self.model(user_id=pair[0], other_id=pair[1], mutual_friends=delta)
+                    )
+        self.bulk_create(missing)
+
+
+class UserConnection(models.Model):
+    """This model materializes the friendship graph up to two hops, so
+    that the privacy tier between two users is a single indexed lookup.
+
+    Details:
+    * One row per direction, for every pair of friends or friends of friends.
+    * `mutual_friends` counts the friends the pair has in common.
+    * Maintained incrementally by background tasks when friendships change.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="+")
+    other = models.ForeignKey(User, on_delete=models.CASCADE, related_name="+")
+    is_friend = models.BooleanField(default=False)
+    mutual_friends = models.PositiveIntegerField(default=0)
+
+    objects = UserConnectionQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "other"], name="unique_user_connection"
+            ),
+        ]
+
+
 class TokenMixin(models.Model):
-    """Abstract model to handle token validity and verification status."""
+    """Abstract model to handle token validity and verification status.
+
+    Only the SHA-256 hash of the token is stored, indexed, so a token is
+    looked up with a single index probe and cannot be read back from the
+    database. Expired tokens are cleared by `clear_expired_tokens`.
+    """
     is_verified = models.BooleanField(default=False)
-    verification_token = models.CharField(max_length=32, blank=True)
+    verification_token_hash = models.CharField(
+        max_length=64, unique=True, null=True, blank=True
+    )
+    expires_at = models.DateTimeField(null=True, blank=True, db_index=True)
+
+    @staticmethod
+    def hash_token(token):
+        """Hash the given token as it is stored."""
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def set_verification_token(self):
+        """Generate a new verification token, valid for `TOKEN_VALIDITY`
+        days, replacing the previous one. The instance is not saved.
+
+        Returns:
+            `str`: The generated token, to be sent to the user.
+        """
+        token = secrets.token_hex(16)
+        self.verification_token_hash = self.hash_token(token)
+        self.expires_at = timezone.now() + timedelta(days=settings.TOKEN_VALIDITY)
+        self.is_verified = False
+        return token
 
     @property
     def is_token_valid(self):
         """Check if the verification token is valid."""
-        if not self.is_verified and self.created:
-            now = timezone.now()
-            if (now - self.created).days < settings.TOKEN_VALIDITY:
-                return True
+        if not self.is_verified and self.expires_at:
+            return timezone.now() < self.expires_at
         return False
 
     class Meta:
         abstract = True
+
+
+class OutboxEmailStatus(models.TextChoices):
+    """Choices for the outbox email status"""
+    PENDING = "PE", "Pending"
+    SENT = "SE", "Sent"
+    FAILED = "FA", "Failed"
+
+
+class OutboxEmail(TimeStampedModel):
+    """This model stores the emails waiting to be sent. Rows are written
+    in the same transaction as the change triggering the email, and sent
+    in batches by a worker.
+
+    Details:
+    * A worker claims the rows it sends by setting `claimed_at`, so other
+    workers skip them without a lock held while sending. The claims of a
+    crashed worker expire after `EMAIL_OUTBOX_CLAIM_TIMEOUT` seconds.
+    """
+    subject = models.CharField(max_length=255)
+    message = models.TextField()
+    from_email = models.CharField(max_length=254)
+    recipients = models.JSONField(default=list)
+    status = models.CharField(
+        choices=OutboxEmailStatus.choices,
+        default=OutboxEmailStatus.PENDING,
+        max_length=2,
+    )
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["status", "next_attempt_at"])]
+
+    def __str__(self):
+        return f"{self.subject} to {', '.join(self.recipients)}"
+
+    def mark_sent(self):
+        self.status = OutboxEmailStatus.SENT
+        self.claimed_at = None
+        self.attempts += 1
+        self.sent_at = timezone.now()
+        self.last_error = ""
+
+    def mark_failed(self, error):
+        """Schedule a retry with exponential backoff, or give up after
+        `EMAIL_OUTBOX_MAX_ATTEMPTS` attempts.
+        """
+        self.attempts += 1
+        self.last_error = str(error)
+        self.claimed_at = None
+        if self.attempts >= settings.EMAIL_OUTBOX_MAX_ATTEMPTS:
+            self.status = OutboxEmailStatus.FAILED
+            return
+        delay = settings.EMAIL_OUTBOX_RETRY_DELAY * 2 ** (self.attempts - 1)
+        self.next_attempt_at = timezone.now() + timedelta(seconds=delay)
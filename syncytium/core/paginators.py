@@ -1,4 +1,18 @@
-from rest_framework.pagination import LimitOffsetPagination, PageNumberPagination
+import base64
+import json
+import operator
+from functools import reduce
+
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ValidationError
+from django.db import connections
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import (
+    BasePagination, LimitOffsetPagination, PageNumberPagination,
+)
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 
 
 class CustomLimitOffsetPagination(LimitOffsetPagination):
@@ -15,3 +29,211 @@ class CustomPageNumberPagination(PageNumberPagination):
     page_size_query_param = "page_size"
     max_page_size = 100
     page_query_param = "page"
+
+
+class KeysetPagination(BasePagination):
+    """Keyset pagination, seeking past the last row of the previous page
+    instead of counting an `OFFSET`, so deep pages cost as much as the
+    first one.
+
+    Details:
+    * Rows are ordered by the view's `keyset_ordering`, which must be
+    unique and should be backed by an index, e.g. `("created", "id")`.
+    * Cursors are opaque and point before or after a row.
+    * The total is only computed when `with_total` is passed, and is
+    estimated from the query plan on PostgreSQL.
+    """
+    ordering = ("created", "id")
+    default_limit = 10
+    max_limit = 100
+    limit_query_param = "limit"
+    cursor_query_param = "cursor"
+    total_query_param = "with_total"
+    invalid_cursor_message = "Invalid cursor"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.setup(request, view)
+        if self.with_total:
+            self.total = self.estimate_count(queryset)
+        page, position, reverse = self.get_page_queryset(queryset, request)
+        return self.get_page(list(page), position, reverse)
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """Async version of `paginate_queryset`, for the async views."""
+        self.setup(request, view)
+        if self.with_total:
+            self.total = await sync_to_async(self.estimate_count)(queryset)
+        page, position, reverse = self.get_page_queryset(queryset, request)
+        return self.get_page([row async for row in page], position, reverse)
+
+    def setup(self, request, view):
+        self.request = request
+        self.ordering = tuple(getattr(view, "keyset_ordering", self.ordering))
+        self.limit = self.get_limit(request)
+        self.with_total = request.query_params.get(self.total_query_param) in ("1", "true")
+        self.total = None
+
+    def get_page_queryset(self, queryset, request):
+        """Get the queryset of the requested page, with one extra row
+        telling whether there is a next page.
+
+        Returns:
+            `QuerySet`, `list`, `bool`: The page, the cursor position and
+            whether to page backwards.
+        """
+        position, reverse = self.decode_cursor(request, queryset.model)
+        ordering = self.ordering
+        if reverse:
+            ordering = tuple(self._invert(field) for field in ordering)
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(self.get_keyset_filter(ordering, position))
+        return queryset[:self.limit + 1], position, reverse
+
+    def get_page(self, rows, position, reverse):
+        has_more = len(rows) > self.limit
+        rows = rows[:self.limit]
+        if reverse:
+            rows.reverse()
+        has_next = position is not None if reverse else has_more
+        has_previous = has_more if reverse else position is not None
+        self.next_position = self.get_position(rows[-1]) if rows and has_next else None
+        self.previous_position = self.get_position(rows[0]) if rows and has_previous else None
+        return rows
+
+    def get_limit(self, request):
+        try:
+            limit = int(request.query_params[self.limit_query_param])
+        except (KeyError, ValueError):
+            return self.default_limit
+        return max(1, min(limit, self.max_limit))
+
+    def get_paginated_response(self, data):
+        response = {
+            "next": self.get_link(self.next_position, reverse=False),
+            "previous": self.get_link(self.previous_position, reverse=True),
+            "results": data,
+        }
+        if self.total is not None:
+            response = {"count": self.total, **response}
+        return Response(response)
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "count": {"type": "integer", "example": 123},
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "previous": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                "name": self.cursor_query_param,
+                "required": False,
+                "in": "query",
+                "description": "The pagination cursor value.",
+                "schema": {"type": "string"},
+            },
+            {
+                "name": self.limit_query_param,
+                "required": False,
+                "in": "query",
+                "description": "Number of results to return per page.",
+                "schema": {"type": "integer"},
+            },
+            {
+                "name": self.total_query_param,
+                "required": False,
+                "in": "query",
+                "description": "Include an estimated total count.",
+                "schema": {"type": "boolean"},
+            },
+        ]
+
+    def get_position(self, row):
+        return [getattr(row, field.lstrip("-")) for field in self.ordering]
+
+    def get_keyset_filter(self, ordering, position):
+        """Build the filter selecting the rows after the position, e.g.
+        `a > x OR (a = x AND b > y)` for an `(a, b)` ordering.
+        """
+        filters = []
+        for index, field in enumerate(ordering):
+            name = field.lstrip("-")
+            lookup = "lt" if field.startswith("-") else "gt"
+            equal = {
+                previous.lstrip("-"): position[previous_index]
+                for previous_index, previous in enumerate(ordering[:index])
+            }
+            filters.append(Q(**equal, **{f"{name}__{lookup}": position[index]}))
+        return reduce(operator.or_, filters)
+
+    def get_link(self, position, reverse):
+        if position is None:
+            return None
+        url = self.request.build_absolute_uri()
+        cursor = self.encode_cursor(position, reverse)
+        return replace_query_param(
+            remove_query_param(url, self.total_query_param),
+            self.cursor_query_param,
+            cursor,
+        )
+
+    def encode_cursor(self, position, reverse):
+        values = [
+            value.isoformat() if hasattr(value, "isoformat") else value
+            for value in position
+        ]
+        data = json.dumps({"p": values, "r": reverse}, separators=(",", ":"))
+        return base64.urlsafe_b64encode(data.encode()).decode().rstrip("=")
+
+    def decode_cursor(self, request, model):
+        """Decode the cursor of the request.
+
+        Returns:
+            `list`, `bool`: The position and whether to page backwards,
+            or `None`, `False` without a cursor.
+
+        Raises:
+        - `NotFound`: If the cursor is malformed.
+        """
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            padding = "=" * (-len(encoded) % 4)
+            data = json.loads(base64.urlsafe_b64decode(encoded + padding))
+            values = data["p"]
+            if len(values) != len(self.ordering):
+                raise ValueError
+            position = [
+                model._meta.get_field(field.lstrip("-")).to_python(value)
+                for field, value in zip(self.ordering, values)
+            ]
+            return position, bool(data["r"])
+        except (KeyError, TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def estimate_count(self, queryset):
+        """Count the rows of the queryset, estimated from the query plan
+        on PostgreSQL to avoid a full `COUNT(*)`.
+        """
+        connection = connections[queryset.db]
+        if connection.vendor != "postgresql":
+            return queryset.count()
+        sql, params = queryset.order_by().query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]["Plan"]["Plan Rows"])
+
+    @staticmethod
+    def _invert(field):
+        return field[1:] if field.startswith("-") else f"-{field}"
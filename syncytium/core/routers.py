@@ -0,0 +1,53 @@
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# The replica the reads of the current request go to, `None` for the
+# primary, set by `core.middleware.ReplicaRoutingMiddleware`
+read_replica = ContextVar("read_replica", default=None)
+
+# The apps of the models always read from the primary, i.e. the entries of
+# the database caches, which must not lag behind their writes
+PRIMARY_APP_LABELS = {"django_cache"}
+
+
+class ReplicaRouter:
+    """Database router sending reads to the replica chosen for the current
+    request, and everything else to the primary.
+
+    Operations:
+    - Reads go to the primary outside of requests, e.g. in tasks and
+    commands, and inside transactions.
+    - Database cache entries are always read from the primary, e.g. the
+    primary pins of the writers.
+    - Writes always go to the primary.
+    - Replicas are never migrated, they copy the primary.
+
+    Replicas are listed in `DATABASE_REPLICAS`. Locally, a replica can be
+    a copy of the SQLite database, e.g. `DATABASE_REPLICAS=replica.sqlite3`.
+    """
+
+    def db_for_read(self, model, **hints):
+        alias = read_replica.get()
+        if (
+            alias is None
+            or model._meta.app_label in PRIMARY_APP_LABELS
+            or connections[DEFAULT_DB_ALIAS].in_atomic_block
+        ):
+            return DEFAULT_DB_ALIAS
+        return alias
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        aliases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
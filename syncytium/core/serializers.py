@@ -1,5 +1,5 @@
 from cities_light.models import City, Country
-from rest_framework.serializers import ModelSerializer
+from rest_framework.serializers import ListSerializer, ModelSerializer
 
 
 class CountrySerializer(ModelSerializer):
@@ -16,3 +16,14 @@ class CitySerializer(ModelSerializer):
     class Meta:
         model = City
         fields = ["id", "name"]
+
+
+class BulkCreateListSerializer(ListSerializer):
+    """List serializer creating all the items with a single `bulk_create`.
+
+    The child's `create` is bypassed, so it must not have custom logic.
+    """
+
+    def create(self, validated_data):
+        model = self.child.Meta.model
+        return model.objects.bulk_create(model(**attrs) for attrs in validated_data)
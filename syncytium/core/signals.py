@@ -0,0 +1,66 @@
+from cities_light.models import City, Country
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django_rest_passwordreset.signals import post_password_reset
+
+from .utils import bump_geography_version, forget_username, revoke_user_tokens
+
+User = get_user_model()
+
+
+def get_changed_claims(instance, update_fields=None):
+    """Get the `User.CLAIM_FIELDS` saved with another value than the loaded
+    one, with their loaded values.
+    """
+    loaded_claims = getattr(instance, "_loaded_claims", None) or {}
+    return {
+        field: loaded_claims[field]
+        for field in User.CLAIM_FIELDS
+        if loaded_claims.get(field) is not None
+        and (update_fields is None or field in update_fields)
+        and loaded_claims[field] != getattr(instance, field)
+    }
+
+
+@receiver(post_save, sender=User)
+def revoke_tokens_on_claim_change(sender, instance, created, update_fields, **kwargs):
+    """Revoke the tokens of a user whose claims changed, e.g. a renamed,
+    demoted or deactivated user, and invalidate the cached ID of a
+    username that no longer exists.
+    """
+    changed = get_changed_claims(instance, update_fields)
+    if "username" in changed:
+        forget_username(changed["username"])
+    if changed and not created:
+        revoke_user_tokens(instance.id)
+        # A later save of the instance must not restore the old version
+        instance.refresh_from_db(fields=["token_version"])
+    loaded_claims = getattr(instance, "_loaded_claims", None) or {}
+    for field in User.CLAIM_FIELDS:
+        if update_fields is None or field in update_fields:
+            loaded_claims[field] = getattr(instance, field)
+    instance._loaded_claims = loaded_claims
+
+
+@receiver(post_delete, sender=User)
+def forget_deleted_username(sender, instance, **kwargs):
+    """Invalidate the cached ID of a deleted user."""
+    forget_username(instance.username)
+
+
+@receiver(post_password_reset)
+def revoke_tokens_on_password_reset(sender, user, **kwargs):
+    """Log the user out everywhere once the password is reset."""
+    revoke_user_tokens(user.id)
+
+
+@receiver(post_save, sender=City)
+@receiver(post_save, sender=Country)
+@receiver(post_delete, sender=City)
+@receiver(post_delete, sender=Country)
+def invalidate_geography(sender, **kwargs):
+    """Invalidate the data derived from `cities_light` rows, e.g. while
+    they are reimported.
+    """
+    bump_geography_version()
@@ -0,0 +1,15 @@
+from celery import shared_task
+
+from . import utils
+
+
+@shared_task
+def send_outbox_emails(batch_size=None):
+    """Send a batch of due outbox emails."""
+    stats = utils.send_outbox_emails(batch_size)
+    if stats["sent"] or stats["failed"]:
+        print(
+            f"Outbox: {stats['sent']} sent, {stats['failed']} failed in "
+            f"{stats['duration']:.2f}s ({stats['per_second']:.1f} emails/s)"
+        )
+    return stats
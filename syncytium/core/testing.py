@@ -0,0 +1,159 @@
+import queue
+import threading
+from contextlib import contextmanager
+from unittest.mock import patch
+
+from celery import Task
+from celery.utils import uuid
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import connections
+from django.test import override_settings
+from django.test.runner import DiscoverRunner
+
+from syncytium.celery import app
+
+# Cache settings of a cache shared by several processes, for the tests of
+# the invalidations across processes
+DATABASE_CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.db.DatabaseCache",
+        "LOCATION": "cache_table",
+    },
+}
+
+
+class TestRunner(DiscoverRunner):
+    """Test runner using a local memory cache. The tests run in a single
+    process, where it behaves as the shared cache, and their query counts
+    then only count the queries of the tested code.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.local_cache = override_settings(CACHES={
+            "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+        })
+        self.local_cache.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.local_cache.disable()
+        super().teardown_test_environment(**kwargs)
+
+
+class QueryBudgetTestMixin:
+    """Mixin for test cases, failing the requests that exceed the
+    `query_budget` of their view with `QueryBudgetExceeded`.
+
+    The recorded `QueryStats` are available as `response.query_stats`.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        enforce = override_settings(QUERY_BUDGET_ENFORCE=True)
+        enforce.enable()
+        cls.addClassCleanup(enforce.disable)
+        super().setUpClass()
+
+
+@contextmanager
+def eager_tasks():
+    """Run the Celery tasks in the calling thread when they are queued,
+    e.g. when no broker is running.
+    """
+    always_eager = app.conf.task_always_eager
+    app.conf.task_always_eager = True
+    try:
+        yield
+    finally:
+        app.conf.task_always_eager = always_eager
+
+
+def queue_tasks(put):
+    """Patch `Task.apply_async` to pass the queued Celery tasks to `put` as
+    `(task, args, kwargs, task_id)` tuples instead of sending them.
+    """
+
+    def apply_async(task, args=None, kwargs=None, **options):
+        task_id = uuid()
+        put((task, args or (), {**(kwargs or {})}, task_id))
+        return task.AsyncResult(task_id)
+
+    return patch.object(Task, "apply_async", apply_async)
+
+
+@contextmanager
+def background_tasks():
+    """Run the Celery tasks in a background thread when they are queued, as
+    a worker would, e.g. to keep them out of the timing and query counts
+    of the requests queuing them when no broker is running. The thread
+    opens its own database connections.
+
+    Yields:
+        `queue.Queue`: The queued tasks, whose `join` waits until they ran.
+        They all run before leaving the context.
+    """
+    tasks = queue.Queue()
+
+    def work():
+        try:
+            while (item := tasks.get()) is not None:
+                task, args, kwargs, task_id = item
+                try:
+                    task.apply(args, kwargs, task_id=task_id)
+                finally:
+                    tasks.task_done()
+        finally:
+            connections.close_all()
+
+    worker = threading.Thread(target=work, daemon=True)
+    worker.start()
+    try:
+        with queue_tasks(tasks.put):
+            yield tasks
+    finally:
+        tasks.put(None)
+        worker.join()
+
+
+class DeferredTasks(list):
+    """The Celery tasks queued within `deferred_tasks`"""
+
+    def join(self):
+        """Run the queued tasks in the calling thread, in order, including
+        the tasks they queue.
+        """
+        while self:
+            task, args, kwargs, task_id = self.pop(0)
+            task.apply(args, kwargs, task_id=task_id)
+
+
+@contextmanager
+def deferred_tasks():
+    """Queue the Celery tasks until `join` runs them in the calling thread,
+    e.g. between the requests of a live server sharing the connection of
+    the test, so the tasks neither run alongside the requests nor count in
+    their queries.
+
+    Yields:
+        `DeferredTasks`: The queued tasks. They all run before leaving the
+        context.
+    """
+    tasks = DeferredTasks()
+    with queue_tasks(tasks.append):
+        yield tasks
+        tasks.join()
+
+
+def get_process_caches(count=2):
+    """Get connections to the `DATABASE_CACHES` table, creating it if
+    missing, standing for the cache connections of separate processes.
+
+    Preconditions:
+    - `CACHES` must be overridden with `DATABASE_CACHES`.
+
+    Returns:
+        `list`: `count` cache connections
+    """
+    call_command("createcachetable", verbosity=0)
+    return [caches.create_connection("default") for _ in range(count)]
@@ -1,3 +1,619 @@
-from django.test import TestCase
+from datetime import timedelta
+from unittest.mock import patch
 
-# Create your tests here.
+import jwt
+from asgiref.sync import sync_to_async
+from cities_light.models import City, Country
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core import mail
+from django.core.cache import cache, caches
+from django.core.mail.backends.locmem import EmailBackend as LocMemEmailBackend
+from django.http import HttpResponse
+from django.test import (
+    LiveServerTestCase, RequestFactory, SimpleTestCase, TestCase, override_settings,
+)
+from django.urls import reverse
+from django.utils import timezone
+
+from account.models import UserAddress
+
+from . import autocomplete
+from .async_views import AsyncCityListAPIView
+from .autocomplete import PrefixIndex, get_city_index
+from .benchmark import SCENARIOS, percentile, run_scenario, seed
+from .geo import (
+    encode_geohash, get_neighbour_cells, get_prefix_range, get_search_precision,
+)
+from .middleware import (
+    QueryBudget, QueryBudgetExceeded, QueryStats, ReplicaRoutingMiddleware,
+)
+from .models import OutboxEmail, OutboxEmailStatus, Privacy, UserConnection
+from .routers import ReplicaRouter, read_replica
+from .testing import (
+    DATABASE_CACHES, QueryBudgetTestMixin, deferred_tasks, get_process_caches,
+)
+from .utils import (
+    LRUCache, bump_geography_version, claim_outbox_emails, get_user_id_for_username,
+    send_email, send_outbox_emails, username_cache,
+)
+from .views import CountryListAPIView
+
+User = get_user_model()
+
+
+class UserConnectionTestCase(TestCase):
+    """Tests for the incrementally maintained `UserConnection` graph"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = {
+            name: User.objects.create(username=name, email=f"{name}@example.com")
+            for name in ["ali", "bilal", "sara", "zara"]
+        }
+
+    def connect(self, *names):
+        ids = [self.users[name].id for name in names]
+        return UserConnection.objects.link(*ids)
+
+    def disconnect(self, *names):
+        ids = [self.users[name].id for name in names]
+        return UserConnection.objects.unlink(*ids)
+
+    def get_tier(self, viewer, owner):
+        return UserConnection.objects.get_tier(self.users[viewer], self.users[owner].id)
+
+    def test_tiers(self):
+        self.connect("ali", "bilal")
+        self.connect("bilal", "sara")
+        self.assertEqual(self.get_tier("ali", "ali"), Privacy.PRIVATE)
+        self.assertEqual(self.get_tier("ali", "bilal"), Privacy.FRIENDS)
+        self.assertEqual(self.get_tier("sara", "ali"), Privacy.FRIENDS_OF_FRIENDS)
+        self.assertEqual(self.get_tier("zara", "ali"), Privacy.PUBLIC)
+        self.assertEqual(
+            UserConnection.objects.get_tier(AnonymousUser(), self.users["ali"].id),
+            Privacy.PUBLIC,
+        )
+
+    def test_get_tier_single_query(self):
+        self.connect("ali", "bilal")
+        with self.assertNumQueries(1):
+            self.get_tier("ali", "bilal")
+
+    def test_mutual_friends_counted_per_path(self):
+        self.connect("ali", "bilal")
+        self.connect("ali", "sara")
+        self.connect("zara", "bilal")
+        self.connect("zara", "sara")
+        connection = UserConnection.objects.get(
+            user=self.users["ali"], other=self.users["zara"]
+        )
+        self.assertEqual(connection.mutual_friends, 2)
+        self.disconnect("sara", "zara")
+        connection.refresh_from_db()
+        self.assertEqual(connection.mutual_friends, 1)
+
+    def test_unlink_removes_empty_connections(self):
+        self.connect("ali", "bilal")
+        self.connect("bilal", "sara")
+        self.disconnect("ali", "bilal")
+        self.assertEqual(self.get_tier("sara", "ali"), Privacy.PUBLIC)
+        self.assertFalse(
+            UserConnection.objects.filter(user=self.users["ali"]).exists()
+        )
+
+    def test_link_is_idempotent(self):
+        self.assertTrue(self.connect("ali", "bilal"))
+        self.assertFalse(self.connect("bilal", "ali"))
+        self.assertTrue(self.disconnect("ali", "bilal"))
+        self.assertFalse(self.disconnect("ali", "bilal"))
+
+
+class LRUCacheTestCase(TestCase):
+    """Tests for `LRUCache`"""
+
+    def test_evicts_least_recently_used(self):
+        lru = LRUCache(maxsize=2, ttl=60)
+        lru.set("a", 1)
+        lru.set("b", 2)
+        lru.get("a")
+        lru.set("c", 3)
+        self.assertEqual(lru.get("a"), 1)
+        self.assertIsNone(lru.get("b"))
+        self.assertEqual(lru.get("c"), 3)
+
+    def test_expires_entries(self):
+        lru = LRUCache(maxsize=2, ttl=-1)
+        lru.set("a", 1)
+        self.assertIsNone(lru.get("a"))
+
+
+class UsernameResolutionTestCase(TestCase):
+    """Tests for `get_user_id_for_username`"""
+
+    def setUp(self):
+        username_cache.clear()
+        cache.clear()
+        self.user = User.objects.create(username="ali", email="ali@example.com")
+
+    def test_resolves_once(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(get_user_id_for_username("ali"), self.user.id)
+            self.assertEqual(get_user_id_for_username("ali"), self.user.id)
+        username_cache.clear()
+        with self.assertNumQueries(0):
+            self.assertEqual(get_user_id_for_username("ali"), self.user.id)
+
+    def test_unknown_username(self):
+        self.assertIsNone(get_user_id_for_username("nobody"))
+
+    def test_rename_invalidates(self):
+        get_user_id_for_username("ali")
+        user = User.objects.get(id=self.user.id)
+        user.username = "ali2"
+        user.save()
+        self.assertIsNone(get_user_id_for_username("ali"))
+        self.assertEqual(get_user_id_for_username("ali2"), self.user.id)
+
+
+class GeohashTestCase(SimpleTestCase):
+    """Tests for the geohash cells of `core.geo`"""
+
+    def test_encode(self):
+        self.assertEqual(encode_geohash(57.64911, 10.40744, 11), "u4pruydqqvj")
+        self.assertEqual(encode_geohash(-90, -180, 3), "000")
+
+    def test_neighbour_cells(self):
+        cells = get_neighbour_cells(31.5497, 74.3436, 4)
+        self.assertEqual(len(cells), 9)
+        self.assertIn("ttsg", cells)
+        # Across the antimeridian
+        self.assertIn(encode_geohash(0, 179.9, 3), get_neighbour_cells(0, -179.9, 3))
+
+    def test_search_precision(self):
+        self.assertEqual(get_search_precision(31.5, 10), 4)
+        self.assertEqual(get_search_precision(31.5, 100), 3)
+        self.assertEqual(get_search_precision(31.5, 10000), 0)
+
+    def test_prefix_range(self):
+        self.assertEqual(get_prefix_range("tt9"), ("tt9", "ttb"))
+        self.assertEqual(get_prefix_range("tz"), ("tz", "u"))
+        self.assertEqual(get_prefix_range("zz"), ("zz", None))
+
+
+class PrefixIndexTestCase(TestCase):
+    """Tests for `PrefixIndex`"""
+
+    def setUp(self):
+        self.index = PrefixIndex([
+            (1, "Lahore", 11000000),
+            (2, "Lahr", 40000),
+            (3, "Lakeland", 100000),
+            (4, "New York", 8000000),
+            (5, "Zürich", 400000),
+            (6, "La", 10),
+        ])
+
+    def get_ids(self, query, limit=10):
+        return [result["id"] for result in self.index.search(query, limit)]
+
+    def test_ranks_by_population(self):
+        self.assertEqual(self.get_ids("lah"), [1, 2])
+        self.assertEqual(self.get_ids("la", limit=3), [6, 1, 3])
+
+    def test_matches_later_words(self):
+        self.assertEqual(self.get_ids("york"), [4])
+        self.assertEqual(self.get_ids("new y"), [4])
+
+    def test_normalizes_query(self):
+        self.assertEqual(self.get_ids("ZÜR"), [5])
+        self.assertEqual(self.get_ids("  "), [])
+
+
+class CityListAPIViewTestCase(QueryBudgetTestMixin, TestCase):
+    """Tests for `CityListAPIView`"""
+
+    @classmethod
+    def setUpTestData(cls):
+        country = Country.objects.create(name="Pakistan", code2="PK", code3="PAK")
+        City.objects.create(name="Lahore", country=country, population=11000000)
+        City.objects.create(name="Larkana", country=country, population=500000)
+        City.objects.create(name="Karachi", country=country, population=15000000)
+
+    def setUp(self):
+        bump_geography_version()
+
+    def test_search_uses_prefix_index(self):
+        url = reverse("cities", args=["PAK"])
+        self.client.get(url, {"search": "la"})
+        with self.assertNumQueries(0):
+            response = self.client.get(url, {"search": "la"})
+        names = [city["name"] for city in response.json()["results"]]
+        self.assertEqual(names, ["Lahore", "Larkana"])
+
+    def test_index_rebuilt_on_import(self):
+        url = reverse("cities", args=["PAK"])
+        self.client.get(url, {"search": "la"})
+        City.objects.create(
+            name="Lalamusa", country=Country.objects.get(code3="PAK"), population=1
+        )
+        response = self.client.get(url, {"search": "lal"})
+        self.assertEqual(response.json()["results"][0]["name"], "Lalamusa")
+
+    def test_unknown_country_not_indexed(self):
+        url = reverse("cities", args=["XYZ"])
+        response = self.client.get(url, {"search": "la"})
+        self.assertEqual(response.json()["results"], [])
+        self.assertIsNone(autocomplete._indexes.get("cities:XYZ"))
+
+    @override_settings(CACHES=DATABASE_CACHES)
+    def test_index_rebuilt_on_import_by_other_process(self):
+        worker_cache, command_cache = get_process_caches()
+        with patch("core.utils.cache", worker_cache):
+            self.assertEqual(get_city_index("PAK").search("lal"), [])
+        with patch("core.utils.cache", command_cache):
+            City.objects.create(
+                name="Lalamusa", country=Country.objects.get(code3="PAK"), population=1
+            )
+        with patch("core.utils.cache", worker_cache):
+            results = get_city_index("PAK").search("lal")
+        self.assertEqual([city["name"] for city in results], ["Lalamusa"])
+
+
+class CountryListAPIViewTestCase(QueryBudgetTestMixin, TestCase):
+    """Tests for the cached responses of `CountryListAPIView`"""
+
+    @classmethod
+    def setUpTestData(cls):
+        Country.objects.create(name="Pakistan", code2="PK", code3="PAK")
+        cls.url = reverse("countries")
+
+    def setUp(self):
+        bump_geography_version()
+
+    def test_not_modified(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("Last-Modified", response)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 304)
+
+    def test_cached_per_query(self):
+        first = self.client.get(self.url)
+        with self.assertNumQueries(0):
+            second = self.client.get(self.url)
+        self.assertEqual(first.content, second.content)
+        with self.assertNumQueries(1):
+            self.client.get(self.url, {"limit": 1})
+
+    def test_invalidated_on_change(self):
+        etag = self.client.get(self.url)["ETag"]
+        Country.objects.create(name="Pakistan 2", code2="P2", code3="PK2")
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()["results"]), 2)
+
+
+class AsyncGeographyListAPIViewTestCase(QueryBudgetTestMixin, TestCase):
+    """Tests for the async country and city list views"""
+
+    @classmethod
+    def setUpTestData(cls):
+        country = Country.objects.create(name="Pakistan", code2="PK", code3="PAK")
+        City.objects.create(name="Lahore", country=country, population=11000000)
+        City.objects.create(name="Larkana", country=country, population=500000)
+        City.objects.create(name="Karachi", country=country, population=15000000)
+
+    def setUp(self):
+        bump_geography_version()
+
+    async def test_lists_and_searches(self):
+        url = reverse("cities", args=["PAK"])
+        response = await self.async_client.get(url, {"limit": 2})
+        self.assertEqual(response.resolver_match.func.view_class, AsyncCityListAPIView)
+        data = response.json()
+        self.assertEqual([city["name"] for city in data["results"]], ["Karachi", "Lahore"])
+        response = await self.async_client.get(data["next"])
+        self.assertEqual([city["name"] for city in response.json()["results"]], ["Larkana"])
+
+        response = await self.async_client.get(url, {"search": "la"})
+        names = [city["name"] for city in response.json()["results"]]
+        self.assertEqual(names, ["Lahore", "Larkana"])
+
+    async def test_shares_response_cache(self):
+        url = reverse("countries")
+        response = await sync_to_async(self.client.get)(url)
+        async_response = await self.async_client.get(url)
+        self.assertEqual(async_response.query_stats.count, 0)
+        self.assertEqual(async_response.content, response.content)
+        async_response = await self.async_client.get(
+            url, headers={"If-None-Match": response["ETag"]}
+        )
+        self.assertEqual(async_response.status_code, 304)
+
+
+class KeysetPaginationTestCase(QueryBudgetTestMixin, TestCase):
+    """Tests for `KeysetPagination` through `CityListAPIView`"""
+
+    @classmethod
+    def setUpTestData(cls):
+        country = Country.objects.create(name="Pakistan", code2="PK", code3="PAK")
+        # Duplicated names make sure ties are broken by the ID
+        for name in ["Multan", "Lahore", "Karachi", "Lahore", "Quetta", "Sialkot", "Lahore"]:
+            City.objects.create(name=name, country=country, geoname_id=None)
+        cls.expected = list(
+            City.objects.order_by("name", "id").values_list("id", flat=True)
+        )
+        cls.url = reverse("cities", args=["PAK"])
+
+    def setUp(self):
+        bump_geography_version()
+
+    def get_ids(self, data):
+        return [city["id"] for city in data["results"]]
+
+    def test_pages_forward_and_backward(self):
+        data = self.client.get(self.url, {"limit": 2}).json()
+        self.assertIsNone(data["previous"])
+        pages = [self.get_ids(data)]
+        while data["next"]:
+            data = self.client.get(data["next"]).json()
+            pages.append(self.get_ids(data))
+        self.assertEqual(sum(pages, []), self.expected)
+        while data["previous"]:
+            data = self.client.get(data["previous"]).json()
+            self.assertEqual(self.get_ids(data), pages[-2])
+            pages.pop()
+        self.assertEqual(len(pages), 1)
+
+    def test_deep_pages_do_not_count(self):
+        data = self.client.get(self.url, {"limit": 2}).json()
+        bump_geography_version()
+        with self.assertNumQueries(1):
+            self.client.get(data["next"])
+
+    def test_total(self):
+        data = self.client.get(self.url, {"with_total": "true"}).json()
+        self.assertEqual(data["count"], len(self.expected))
+        self.assertNotIn("with_total", data["next"] or "")
+
+    def test_invalid_cursor(self):
+        response = self.client.get(self.url, {"cursor": "garbage"})
+        self.assertEqual(response.status_code, 404)
+
+
+class CountingEmailBackend(LocMemEmailBackend):
+    """Local email backend counting the opened connections, and failing
+    for the recipients starting with `fail`.
+    """
+    opened = 0
+
+    def open(self):
+        CountingEmailBackend.opened += 1
+        return True
+
+    def send_messages(self, messages):
+        for message in messages:
+            if message.to[0].startswith("fail"):
+                raise ConnectionError("Recipient refused")
+        return super().send_messages(messages)
+
+
+@override_settings(EMAIL_BACKEND="core.tests.CountingEmailBackend")
+class OutboxTestCase(TestCase):
+    """Tests for the email outbox"""
+
+    def setUp(self):
+        CountingEmailBackend.opened = 0
+
+    def test_sends_batch_over_one_connection(self):
+        for index in range(5):
+            send_email("Hello", "Message", [f"user{index}@example.com"])
+        self.assertEqual(len(mail.outbox), 0)
+        stats = send_outbox_emails(batch_size=3)
+        self.assertEqual(stats["sent"], 3)
+        self.assertEqual(CountingEmailBackend.opened, 1)
+        send_outbox_emails(batch_size=3)
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertEqual(
+            OutboxEmail.objects.filter(status=OutboxEmailStatus.SENT).count(), 5
+        )
+
+    @override_settings(EMAIL_OUTBOX_MAX_ATTEMPTS=2)
+    def test_retries_with_backoff(self):
+        send_email("Hello", "Message", ["fail@example.com"])
+        stats = send_outbox_emails()
+        self.assertEqual(stats["failed"], 1)
+        email = OutboxEmail.objects.get()
+        self.assertEqual(email.status, OutboxEmailStatus.PENDING)
+        self.assertEqual(email.attempts, 1)
+        self.assertEqual(send_outbox_emails()["failed"], 0)
+        OutboxEmail.objects.update(next_attempt_at=email.created)
+        send_outbox_emails()
+        email.refresh_from_db()
+        self.assertEqual(email.status, OutboxEmailStatus.FAILED)
+        self.assertIn("Recipient refused", email.last_error)
+
+    def test_claims_emails_while_sending(self):
+        for index in range(2):
+            send_email("Hello", "Message", [f"user{index}@example.com"])
+        claimed = []
+
+        def send_messages(backend, messages):
+            # Another worker skips the emails being sent
+            claimed.append(claim_outbox_emails(10))
+            return LocMemEmailBackend.send_messages(backend, messages)
+
+        with patch.object(CountingEmailBackend, "send_messages", send_messages):
+            self.assertEqual(send_outbox_emails()["sent"], 2)
+        self.assertEqual(claimed, [[], []])
+        self.assertFalse(OutboxEmail.objects.filter(claimed_at__isnull=False).exists())
+
+    @override_settings(EMAIL_OUTBOX_CLAIM_TIMEOUT=60)
+    def test_expired_claims_are_sent(self):
+        send_email("Hello", "Message", ["user@example.com"])
+        OutboxEmail.objects.update(claimed_at=timezone.now())
+        self.assertEqual(send_outbox_emails()["sent"], 0)
+        OutboxEmail.objects.update(claimed_at=timezone.now() - timedelta(seconds=61))
+        self.assertEqual(send_outbox_emails()["sent"], 1)
+
+
+class QueryBudgetMiddlewareTestCase(QueryBudgetTestMixin, TestCase):
+    """Tests for `QueryBudgetMiddleware`"""
+
+    @classmethod
+    def setUpTestData(cls):
+        Country.objects.create(name="Pakistan", code2="PK", code3="PAK")
+        cls.url = reverse("countries")
+
+    def setUp(self):
+        bump_geography_version()
+
+    def test_records_stats(self):
+        response = self.client.get(self.url, {"search": "pak"})
+        self.assertEqual(response.query_stats.count, 1)
+        self.assertEqual(response.query_stats.duplicates, {})
+
+    def test_fails_over_budget(self):
+        with patch.object(CountryListAPIView, "query_budget", QueryBudget(queries=0)):
+            with self.assertRaisesMessage(QueryBudgetExceeded, "1 queries > 0"):
+                self.client.get(self.url)
+
+    @override_settings(QUERY_BUDGET_ENFORCE=False, QUERY_BUDGET_SAMPLE_RATE=1.0)
+    def test_logs_over_budget(self):
+        with patch.object(CountryListAPIView, "query_budget", QueryBudget(queries=0)):
+            with self.assertLogs("core.middleware", "WARNING") as logs:
+                response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("countries", logs.output[0])
+
+    @override_settings(QUERY_BUDGET_ENFORCE=False, QUERY_BUDGET_SAMPLE_RATE=0.0)
+    def test_skips_unsampled_requests(self):
+        response = self.client.get(self.url)
+        self.assertFalse(hasattr(response, "query_stats"))
+
+    def test_fingerprints_ignore_parameters(self):
+        stats = QueryStats()
+        for sql in ["SELECT 1 WHERE id IN (%s, %s)", "SELECT 1 WHERE id IN (%s, %s, %s)"]:
+            stats(lambda *args: None, sql, [], False, {})
+        self.assertEqual(stats.duplicates, {"SELECT 1 WHERE id IN (%s, ...)": 2})
+        self.assertEqual(QueryBudget(duplicates=0).get_violations(stats), [
+            "1 duplicated queries > 0"
+        ])
+
+    @override_settings(CACHES=DATABASE_CACHES)
+    def test_counts_cache_queries_apart(self):
+        stats = QueryStats()
+        for _ in range(2):
+            stats(lambda *args: None, 'SELECT "cache_key" FROM "cache_table"', [], False, {})
+        stats(lambda *args: None, "SELECT 1", [], False, {})
+        self.assertEqual((stats.count, stats.cache_count), (3, 2))
+        self.assertEqual(stats.duplicates, {})
+        self.assertEqual(QueryBudget(queries=1).get_violations(stats), ["3 queries > 1"])
+
+
+@override_settings(DATABASE_REPLICAS=["replica1", "replica2"], DATABASE_REPLICA_LAG=5)
+class ReplicaRoutingTestCase(SimpleTestCase):
+    """Tests for `ReplicaRouter` and `ReplicaRoutingMiddleware`"""
+    # The tests sharing a database cache create its table
+    databases = {"default"}
+
+    def setUp(self):
+        cache.clear()
+        self.router = ReplicaRouter()
+        self.middleware = ReplicaRoutingMiddleware(self.get_response)
+
+    def get_response(self, request):
+        response = HttpResponse()
+        response.read_db = self.router.db_for_read(User)
+        response.write_db = self.router.db_for_write(User)
+        return response
+
+    def get_headers(self, user_id):
+        token = jwt.encode({"user_id": user_id}, "secret", algorithm="HS256")
+        return {"Authorization": f"Bearer {token}"}
+
+    def test_reads_from_replica_on_safe_requests(self):
+        response = self.middleware(RequestFactory().get("/"))
+        self.assertIn(response.read_db, ["replica1", "replica2"])
+        self.assertEqual(response.write_db, "default")
+        self.assertEqual(self.router.db_for_read(User), "default")
+
+        response = self.middleware(RequestFactory().patch("/"))
+        self.assertEqual(response.read_db, "default")
+
+    def test_writers_stick_to_primary(self):
+        response = self.middleware(RequestFactory().post("/", headers=self.get_headers(1)))
+        cookie = response.cookies[ReplicaRoutingMiddleware.cookie_name]
+        self.assertEqual(cookie["max-age"], 5)
+
+        request = RequestFactory().get("/")
+        request.COOKIES[cookie.key] = cookie.value
+        self.assertEqual(self.middleware(request).read_db, "default")
+        # Other devices of the same user
+        response = self.middleware(RequestFactory().get("/", headers=self.get_headers(1)))
+        self.assertEqual(response.read_db, "default")
+        response = self.middleware(RequestFactory().get("/", headers=self.get_headers(2)))
+        self.assertIn(response.read_db, ["replica1", "replica2"])
+
+    @override_settings(CACHES=DATABASE_CACHES)
+    def test_writers_stick_to_primary_in_all_processes(self):
+        writer_cache, reader_cache = get_process_caches()
+        with patch("core.middleware.cache", writer_cache):
+            self.middleware(RequestFactory().post("/", headers=self.get_headers(1)))
+        with patch("core.middleware.cache", reader_cache):
+            response = self.middleware(RequestFactory().get("/", headers=self.get_headers(1)))
+        self.assertEqual(response.read_db, "default")
+
+    @override_settings(CACHES=DATABASE_CACHES)
+    def test_cache_reads_from_primary(self):
+        token = read_replica.set("replica1")
+        try:
+            self.assertEqual(
+                self.router.db_for_read(caches["default"].cache_model_class), "default"
+            )
+            self.assertEqual(self.router.db_for_read(User), "replica1")
+        finally:
+            read_replica.reset(token)
+
+    def test_replicas_are_not_migrated(self):
+        self.assertFalse(self.router.allow_migrate("replica1", "account"))
+        self.assertIsNone(self.router.allow_migrate("default", "account"))
+
+
+@override_settings(QUERY_BUDGET_SAMPLE_RATE=1.0, QUERY_BUDGET_SERVER_TIMING=True)
+class BenchmarkTestCase(LiveServerTestCase):
+    """Tests for the benchmark scenarios"""
+
+    def setUp(self):
+        bump_geography_version()
+        self.context = seed(users=3, cities=20)
+        # The education writes queue search reindexing without a broker. The
+        # live server shares the connection of the test, whose queries are
+        # counted by any request in flight, so the tasks run between the
+        # scenarios and the requests are sent one at a time.
+        self.tasks = self.enterContext(deferred_tasks())
+
+    def test_seeds_geo_cells(self):
+        self.assertFalse(UserAddress.objects.filter(geo_cell="").exists())
+
+    def test_percentile(self):
+        self.assertEqual(percentile([1, 2, 3, 4], 50), 2)
+        self.assertEqual(percentile([1, 2, 3, 4], 99), 4)
+        self.assertIsNone(percentile([], 50))
+
+    def test_runs_scenarios(self):
+        for name in ["profile_read", "education_write", "city_search"]:
+            with self.assertNoLogs("core.middleware", "WARNING"):
+                result = run_scenario(
+                    self.live_server_url, self.context, SCENARIOS[name], count=4,
+                    concurrency=1,
+                )
+            self.tasks.join()
+            self.assertEqual(result["requests"], 4)
+            self.assertEqual(result["errors"], 0, name)
+            self.assertLessEqual(result["p50"], result["p99"])
+            self.assertIsNotNone(result["queries_per_request"])
+            # The tests cache in memory
+            self.assertEqual(result["cache_queries_per_request"], 0)
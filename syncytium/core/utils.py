@@ -1,6 +1,49 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
 from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
-from django.core.mail import send_mail
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from unidecode import unidecode
+
+from .models import OutboxEmail, OutboxEmailStatus
+
+NON_ALPHANUMERIC_RE = re.compile(r"[^a-z0-9]+")
+GEOGRAPHY_VERSION_CACHE_KEY = "geography:version"
+# The fields written once an outbox email is sent or failed
+OUTBOX_RESULT_FIELDS = [
+    "status", "attempts", "next_attempt_at", "last_error", "sent_at", "claimed_at",
+    "modified",
+]
+# The first path segments of the fixed routes of `account.urls`, which
+# would shadow the routes of the users named after them
+RESERVED_USERNAMES = {
+    "directory", "export", "nearby", "profile-cache", "register", "search",
+    "verify-email",
+}
+
+
+def is_reserved_username(username):
+    return username.lower() in RESERVED_USERNAMES
+
+
+def validate_username(username):
+    """Validate that a username is not reserved by a fixed route.
+
+    Raises:
+    - `ValidationError`: If the username is reserved.
+    """
+    if is_reserved_username(username):
+        raise ValidationError("This username is reserved.")
+    return username
 
 
 def validate_country_and_city(country, city):
@@ -29,11 +72,13 @@ def validate_country_and_city(country, city):
 
 
 def send_email(subject="", message="", recipient_list=[]):
-    """Utility function to send an email.
+    """Utility function to send an email through the outbox.
 
     Operations:
     - Use the default email host user as the sender.
-    - Send an email with the provided subject, message, and recipient list.
+    - Queue an email with the provided subject, message, and recipient list.
+    It is written in the caller's transaction and sent later by
+    `send_outbox_emails`.
 
     Args:
         `subject` (`str`): Email subject.
@@ -41,8 +86,392 @@ def send_email(subject="", message="", recipient_list=[]):
         `recipient_list` (`list`): List of email recipients.
 
     Returns:
-        `int`: Number of emails sent.
+        `int`: Number of emails queued.
+    """
+    from_email = settings.EMAIL_HOST_USER
+    OutboxEmail.objects.create(
+        subject=subject,
+        message=message,
+        from_email=from_email,
+        recipients=list(recipient_list),
+    )
+    return 1
+
+
+def send_mass_email(datatuple, batch_size=None):
+    """Utility function to send many emails through the outbox at once.
+
+    Operations:
+    - Queue all emails with chunked `bulk_create`, like `send_email`.
+
+    Args:
+        `datatuple` (`iterable`): `(subject, message, recipient_list)` tuples.
+        `batch_size` (`int`): Number of emails written per `INSERT`.
+
+    Returns:
+        `int`: Number of emails queued.
     """
     from_email = settings.EMAIL_HOST_USER
-    sent = send_mail(subject, message, from_email, recipient_list, fail_silently=False)
-    return sent
+    emails = [
+        OutboxEmail(
+            subject=subject,
+            message=message,
+            from_email=from_email,
+            recipients=list(recipient_list),
+        )
+        for subject, message, recipient_list in datatuple
+    ]
+    OutboxEmail.objects.bulk_create(
+        emails, batch_size=batch_size or settings.EMAIL_OUTBOX_BATCH_SIZE
+    )
+    return len(emails)
+
+
+def claim_outbox_emails(batch_size):
+    """Claim up to `batch_size` due pending emails in a short transaction,
+    skipping the rows locked by concurrent workers and the rows they
+    claimed less than `EMAIL_OUTBOX_CLAIM_TIMEOUT` seconds ago.
+
+    Returns:
+        `list`: The claimed emails
+    """
+    now = timezone.now()
+    expired = now - timedelta(seconds=settings.EMAIL_OUTBOX_CLAIM_TIMEOUT)
+    with transaction.atomic():
+        emails = list(
+            OutboxEmail.objects.select_for_update(skip_locked=True)
+            .filter(status=OutboxEmailStatus.PENDING, next_attempt_at__lte=now)
+            .filter(Q(claimed_at__isnull=True) | Q(claimed_at__lt=expired))
+            .order_by("next_attempt_at", "id")[:batch_size]
+        )
+        OutboxEmail.objects.filter(id__in=[email.id for email in emails]) \
+            .update(claimed_at=now)
+    return emails
+
+
+def send_outbox_emails(batch_size=None):
+    """Send a batch of due outbox emails over a single connection.
+
+    Operations:
+    - Claim up to `batch_size` due pending emails, see
+    `claim_outbox_emails`.
+    - Open one connection to the email backend and send them one by one,
+    outside of any transaction.
+    - Record the result of each email once it is sent, marking it sent or
+    scheduling a retry with backoff, and releasing its claim.
+
+    Args:
+        `batch_size` (`int`): Maximum number of emails to send, defaults
+        to `EMAIL_OUTBOX_BATCH_SIZE`.
+
+    Returns:
+        `dict`: Number of emails `sent` and `failed`, the `duration` in
+        seconds and the throughput in emails `per_second`.
+    """
+    batch_size = batch_size or settings.EMAIL_OUTBOX_BATCH_SIZE
+    started = time.perf_counter()
+    sent = failed = 0
+    emails = claim_outbox_emails(batch_size)
+    if emails:
+        connection = get_connection()
+        try:
+            connection.open()
+        except Exception as error:
+            for email in emails:
+                email.mark_failed(error)
+                email.save(update_fields=OUTBOX_RESULT_FIELDS)
+            failed = len(emails)
+        else:
+            try:
+                for email in emails:
+                    message = EmailMessage(
+                        email.subject,
+                        email.message,
+                        email.from_email,
+                        email.recipients,
+                        connection=connection,
+                    )
+                    try:
+                        message.send()
+                    except Exception as error:
+                        email.mark_failed(error)
+                        failed += 1
+                    else:
+                        email.mark_sent()
+                        sent += 1
+                    email.save(update_fields=OUTBOX_RESULT_FIELDS)
+            finally:
+                connection.close()
+    duration = time.perf_counter() - started
+    return {
+        "sent": sent,
+        "failed": failed,
+        "duration": duration,
+        "per_second": (sent + failed) / duration if emails else 0,
+    }
+
+
+def clear_expired_tokens(model, batch_size=None):
+    """Clear the expired verification tokens of a model using `TokenMixin`.
+
+    Operations:
+    - Rows are updated in batches of `batch_size`, each in its own short
+    statement, so the sweep does not hold long locks.
+
+    Args:
+        `model` (`type`): The model using `TokenMixin`.
+        `batch_size` (`int`): The rows to update per batch.
+
+    Returns:
+        `int`: The number of cleared tokens.
+    """
+    batch_size = batch_size or settings.TOKEN_SWEEP_BATCH_SIZE
+    now = timezone.now()
+    cleared = 0
+    while True:
+        ids = list(
+            model.objects.filter(expires_at__lt=now)
+            .values_list("pk", flat=True)[:batch_size]
+        )
+        if not ids:
+            return cleared
+        cleared += model.objects.filter(pk__in=ids) \
+            .update(verification_token_hash=None, expires_at=None)
+        if len(ids) < batch_size:
+            return cleared
+
+
+class LRUCache:
+    """Thread-safe in-process cache bounded to `maxsize` entries, evicting
+    the least recently used one first. Entries expire after `ttl` seconds.
+    """
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+username_cache = LRUCache(
+    maxsize=settings.USERNAME_CACHE_SIZE, ttl=settings.USERNAME_CACHE_LOCAL_TTL
+)
+
+
+def get_username_cache_key(username):
+    return f"username:{username}:id"
+
+
+def get_user_id_for_username(username):
+    """Resolve a username to the user ID.
+
+    Operations:
+    - Look up the in-process LRU cache first, then the Django cache.
+    - Fall back to the database and fill both caches.
+    - Unknown usernames are not cached.
+
+    Renames invalidate both caches in the current process, other processes
+    may keep the old entry for up to `USERNAME_CACHE_LOCAL_TTL` seconds.
+
+    Args:
+        `username` (`str`): The username.
+
+    Returns:
+        `int`: The user ID, or `None` if no user has this username.
+    """
+    user_id = username_cache.get(username)
+    if user_id is not None:
+        return user_id
+    key = get_username_cache_key(username)
+    user_id = cache.get(key)
+    if user_id is None:
+        User = get_user_model()
+        user_id = User.objects.filter(username=username) \
+            .values_list("id", flat=True).first()
+        if user_id is None:
+            return None
+        cache.set(key, user_id, settings.USERNAME_CACHE_TIMEOUT)
+    username_cache.set(username, user_id)
+    return user_id
+
+
+async def aget_user_id_for_username(username):
+    """Async version of `get_user_id_for_username`."""
+    user_id = username_cache.get(username)
+    if user_id is not None:
+        return user_id
+    key = get_username_cache_key(username)
+    user_id = await cache.aget(key)
+    if user_id is None:
+        User = get_user_model()
+        user_id = await User.objects.filter(username=username) \
+            .values_list("id", flat=True).afirst()
+        if user_id is None:
+            return None
+        await cache.aset(key, user_id, settings.USERNAME_CACHE_TIMEOUT)
+    username_cache.set(username, user_id)
+    return user_id
+
+
+def forget_username(username):
+    """Drop a username from both caches, e.g. after it changed."""
+    username_cache.delete(username)
+    cache.delete(get_username_cache_key(username))
+
+
+def get_token_version_cache_key(user_id):
+    return f"token_version:{user_id}"
+
+
+def get_token_version(user_id):
+    """Get the current token version of a user, cached.
+
+    Args:
+        `user_id` (`int`): The user ID.
+
+    Returns:
+        `int`: The token version, or `None` if the user does not exist.
+    """
+    key = get_token_version_cache_key(user_id)
+    token_version = cache.get(key)
+    if token_version is None:
+        User = get_user_model()
+        token_version = User.objects.filter(id=user_id, is_active=True) \
+            .values_list("token_version", flat=True).first()
+        if token_version is None:
+            return None
+        cache.set(key, token_version, settings.TOKEN_VERSION_CACHE_TIMEOUT)
+    return token_version
+
+
+async def aget_token_version(user_id):
+    """Async version of `get_token_version`."""
+    key = get_token_version_cache_key(user_id)
+    token_version = await cache.aget(key)
+    if token_version is None:
+        User = get_user_model()
+        token_version = await User.objects.filter(id=user_id, is_active=True) \
+            .values_list("token_version", flat=True).afirst()
+        if token_version is None:
+            return None
+        await cache.aset(key, token_version, settings.TOKEN_VERSION_CACHE_TIMEOUT)
+    return token_version
+
+
+def revoke_user_tokens(user_id):
+    """Revoke the tokens issued to a user so far, by incrementing the token
+    version signed into them.
+
+    Args:
+        `user_id` (`int`): The user ID.
+    """
+    User = get_user_model()
+    User.objects.filter(id=user_id).update(token_version=F("token_version") + 1)
+    cache.delete(get_token_version_cache_key(user_id))
+
+
+def get_user_id_for_request(request, username):
+    """Resolve a username to the user ID once per request.
+
+    Operations:
+    - The current user's own username resolves without any lookup.
+    - Other usernames go through `get_user_id_for_username` and are
+    remembered on the request, so permissions, mixins and views share
+    the result.
+
+    Args:
+        `request` (`Request`): The current request.
+        `username` (`str`): The username.
+
+    Returns:
+        `int`: The user ID, or `None` if no user has this username.
+    """
+    user = getattr(request, "user", None)
+    if user is not None and user.is_authenticated and user.username == username:
+        return user.id
+    resolved = request.__dict__.setdefault("_resolved_user_ids", {})
+    if username not in resolved:
+        resolved[username] = get_user_id_for_username(username)
+    return resolved[username]
+
+
+async def aget_user_id_for_request(request, username):
+    """Async version of `get_user_id_for_request`."""
+    user = getattr(request, "user", None)
+    if user is not None and user.is_authenticated and user.username == username:
+        return user.id
+    resolved = request.__dict__.setdefault("_resolved_user_ids", {})
+    if username not in resolved:
+        resolved[username] = await aget_user_id_for_username(username)
+    return resolved[username]
+
+
+def normalize_text(value):
+    """Normalize a text for matching: transliterate it to ASCII, lower it
+    and collapse anything but letters and digits into single spaces.
+
+    Args:
+        `value` (`str`): The text, e.g. `"Zürich (Stadt)"`.
+
+    Returns:
+        `str`: The normalized text, e.g. `"zurich stadt"`.
+    """
+    return NON_ALPHANUMERIC_RE.sub(" ", unidecode(value or "").lower()).strip()
+
+
+def get_geography_version():
+    """Get the version of the `cities_light` data, as the timestamp of
+    its last change. Derived data such as prefix indexes and cached
+    responses are keyed by this version.
+
+    Returns:
+        `float`: The version.
+    """
+    version = cache.get(GEOGRAPHY_VERSION_CACHE_KEY)
+    if version is None:
+        version = time.time()
+        cache.add(GEOGRAPHY_VERSION_CACHE_KEY, version, None)
+        version = cache.get(GEOGRAPHY_VERSION_CACHE_KEY, version)
+    return version
+
+
+async def aget_geography_version():
+    """Async version of `get_geography_version`."""
+    version = await cache.aget(GEOGRAPHY_VERSION_CACHE_KEY)
+    if version is None:
+        version = time.time()
+        await cache.aadd(GEOGRAPHY_VERSION_CACHE_KEY, version, None)
+        version = await cache.aget(GEOGRAPHY_VERSION_CACHE_KEY, version)
+    return version
+
+
+def bump_geography_version():
+    """Invalidate the data derived from `cities_light` rows."""
+    cache.set(GEOGRAPHY_VERSION_CACHE_KEY, time.time(), None)
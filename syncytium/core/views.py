@@ -1,27 +1,43 @@
 from cities_light.models import City, Country
-from rest_framework.filters import SearchFilter
 from rest_framework.generics import ListAPIView
 
-from .paginators import CustomLimitOffsetPagination
+from .autocomplete import get_city_index, get_country_index
+from .middleware import QueryBudget
+from .mixins import GeographyResponseCacheMixin, PrefixSearchListMixin
+from .paginators import KeysetPagination
 from .serializers import CitySerializer, CountrySerializer
 
 
-class CountryListAPIView(ListAPIView):
-    """API view to list all countries"""
+class CountryListAPIView(
+    GeographyResponseCacheMixin, PrefixSearchListMixin, ListAPIView
+):
+    """API view to list all countries, or autocomplete them by name
+    through the `search` query parameter.
+    """
+    query_budget = QueryBudget(queries=2)
     serializer_class = CountrySerializer
-    search_fields = ["name"]
-    filter_backends = [SearchFilter]
     queryset = Country.objects.all()
-    pagination_class = CustomLimitOffsetPagination
+    pagination_class = KeysetPagination
+    keyset_ordering = ("name", "id")
 
+    def get_prefix_index(self):
+        return get_country_index()
 
-class CityListAPIView(ListAPIView):
-    """API view to list all cities"""
+
+class CityListAPIView(
+    GeographyResponseCacheMixin, PrefixSearchListMixin, ListAPIView
+):
+    """API view to list all cities of a country, or autocomplete them by
+    name through the `search` query parameter.
+    """
+    query_budget = QueryBudget(queries=2)
     serializer_class = CitySerializer
-    search_fields = ["name"]
-    filter_backends = [SearchFilter]
-    pagination_class = CustomLimitOffsetPagination
+    pagination_class = KeysetPagination
+    keyset_ordering = ("name", "id")
 
     def get_queryset(self):
         country_code = self.kwargs.get("code")
         return City.objects.filter(country__code3=country_code)
+
+    def get_prefix_index(self):
+        return get_city_index(self.kwargs.get("code"))
@@ -0,0 +1,19 @@
+"""
+URL configuration of the ASGI requests, see `core.middleware.AsyncURLConfMiddleware`.
+
+Same routes as `syncytium.urls`, the read paths being served by async views.
+"""
+
+from django.contrib import admin
+from django.urls import include, path
+
+from .urls import docs_urlpatterns
+
+urlpatterns = [
+    path("admin/", admin.site.urls),
+    path("core/", include("core.async_urls")),
+    path("account/", include("account.async_urls")),
+    path("auth/", include("authentication.async_urls")),
+]
+
+urlpatterns += docs_urlpatterns
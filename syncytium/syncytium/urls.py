@@ -31,7 +31,7 @@ urlpatterns = [
 ]
 
 # API docs
-urlpatterns += [
+docs_urlpatterns = [
     path("docs/", SpectacularAPIView.as_view(), name="schema"),
     path(
         "docs/swagger/",
@@ -44,3 +44,5 @@ urlpatterns += [
         name="redoc",
     ),
 ]
+
+urlpatterns += docs_urlpatterns